@@ -1,8 +1,9 @@
 from django.contrib import admin
 
-from .models import AircraftType, Airstrip, Checkout
+from .models import AircraftType, Airstrip, Checkout, Job
 
 admin.site.register(AircraftType)
 admin.site.register(Airstrip)
 admin.site.register(Checkout)
+admin.site.register(Job)
 
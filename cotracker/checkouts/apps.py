@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class CheckoutsConfig(AppConfig):
+    name = 'checkouts'
+
+    def ready(self):
+        # Connects the signal receivers
+        from . import signals
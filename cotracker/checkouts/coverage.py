@@ -0,0 +1,447 @@
+"""Shared, memory-mapped checkout coverage
+
+The coverage tensor records which pilot/airstrip/aircraft type checkouts exist
+as a compact bitset. It lives in a single file (settings.CHECKOUT_COVERAGE_FILE)
+which every gunicorn worker maps read-only, so the sudah/belum reports and the
+precedent map can be answered without going to the database.
+
+The file is rebuilt from the database when the pilot, airstrip, or aircraft
+type dimensions change, and patched in place when a single checkout is added
+or removed (see checkouts.signals). Every change bumps the generation stamp in
+the header, which lets readers notice that anything they derived from an
+earlier generation is stale.
+
+File layout (little endian):
+
+    header      magic, format, generation, pilot count, airstrip count,
+                aircraft type count, bytes per pair, dimensions length
+    dimensions  JSON encoded pilot/airstrip/aircraft type/base tables
+    precedent   bytes per pair for each airstrip: checkouts held by anybody
+    coverage    bytes per pair for each pilot/airstrip pair, pilot major
+
+Each 'pair' is a little bitmask with one bit per aircraft type, in the
+sorted_position order of the aircraft types.
+"""
+import contextlib
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Q
+
+from .models import AircraftType, Airstrip, Checkout
+import checkouts.util as util
+
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('<4sIQIIIII')
+GENERATION = struct.Struct('<Q')
+GENERATION_OFFSET = 8
+MAGIC = b'CKCV'
+FORMAT = 1
+
+
+class CoverageError(Exception):
+    """The coverage file is missing, corrupt, or from an unknown format"""
+    pass
+
+
+class CoverageTensor(object):
+    """Read access to a coverage file. Construct with the path of the file and
+    an optional mmap access mode (ACCESS_WRITE is used for patching)."""
+
+    def __init__(self, path, access=mmap.ACCESS_READ):
+        self.path = path
+        mode = 'r+b' if access == mmap.ACCESS_WRITE else 'rb'
+        with open(path, mode) as f:
+            self.stat = os.fstat(f.fileno())
+            try:
+                self.buffer = mmap.mmap(f.fileno(), 0, access=access)
+            except ValueError:
+                raise CoverageError("%s is empty" % path)
+        try:
+            self._parse()
+        except Exception:
+            self.buffer.close()
+            raise
+
+    def _parse(self):
+        if len(self.buffer) < HEADER.size:
+            raise CoverageError("%s is truncated" % self.path)
+        (magic, fmt, _, pilot_count, airstrip_count, type_count,
+         self.bytes_per_pair, dimensions_length) = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or fmt != FORMAT:
+            raise CoverageError("%s is not a format %d coverage file" % (self.path, FORMAT))
+
+        start = HEADER.size
+        dimensions = json.loads(self.buffer[start:start + dimensions_length].decode('utf-8'))
+        # [id, username, first_name, last_name, is_pilot]
+        self.pilots = dimensions['pilots']
+        # [id, ident, name]
+        self.airstrips = dimensions['airstrips']
+        # [id, name]
+        self.aircraft_types = dimensions['aircraft_types']
+        # airstrip id -> base ids
+        self.bases = {int(k): set(v) for k, v in dimensions['bases'].items()}
+        if (len(self.pilots), len(self.airstrips), len(self.aircraft_types)) != (pilot_count, airstrip_count, type_count):
+            raise CoverageError("%s has inconsistent dimensions" % self.path)
+
+        self.precedent_offset = start + dimensions_length
+        self.coverage_offset = self.precedent_offset + airstrip_count * self.bytes_per_pair
+        expected_size = self.coverage_offset + pilot_count * airstrip_count * self.bytes_per_pair
+        if len(self.buffer) != expected_size:
+            raise CoverageError("%s is %d bytes, expected %d" % (self.path, len(self.buffer), expected_size))
+
+        self.pilot_index = {p[0]: i for i, p in enumerate(self.pilots)}
+        self.airstrip_index = {a[0]: i for i, a in enumerate(self.airstrips)}
+        self.type_index = {t[0]: i for i, t in enumerate(self.aircraft_types)}
+        self._precedented = None
+
+    def close(self):
+        self.buffer.close()
+
+    @property
+    def generation(self):
+        """The current version stamp. Read straight from the shared mapping,
+        so patches made by other processes are seen immediately."""
+        return GENERATION.unpack_from(self.buffer, GENERATION_OFFSET)[0]
+
+    def is_current(self, stat):
+        """True if 'stat' (from os.stat) describes the file we have mapped"""
+        return (stat.st_dev, stat.st_ino) == (self.stat.st_dev, self.stat.st_ino)
+
+    def pair_offset(self, pilot_index, airstrip_index):
+        pair = pilot_index * len(self.airstrips) + airstrip_index
+        return self.coverage_offset + pair * self.bytes_per_pair
+
+    def precedent_mask_offset(self, airstrip_index):
+        return self.precedent_offset + airstrip_index * self.bytes_per_pair
+
+    def _mask(self, offset):
+        return int.from_bytes(self.buffer[offset:offset + self.bytes_per_pair], 'little')
+
+    def pair_mask(self, pilot_index, airstrip_index):
+        """Bitmask of the aircraft types the pilot is checked out in at the
+        airstrip"""
+        return self._mask(self.pair_offset(pilot_index, airstrip_index))
+
+    def precedent_mask(self, airstrip_index):
+        """Bitmask of the aircraft types anybody is checked out in at the
+        airstrip"""
+        return self._mask(self.precedent_mask_offset(airstrip_index))
+
+    def aircrafttype_names(self):
+        return [name for _, name in self.aircraft_types]
+
+    def select_types(self, aircraft_type=None):
+        """[(bit, name)] for the requested aircraft type(s)"""
+        if aircraft_type is None:
+            return list(enumerate(self.aircrafttype_names()))
+        if aircraft_type.pk not in self.type_index:
+            return []
+        bit = self.type_index[aircraft_type.pk]
+        return [(bit, self.aircraft_types[bit][1])]
+
+    def select_pilots(self, pilot=None, pilots_only=False):
+        """Indexes of the requested pilot(s), in report order"""
+        if pilot is not None:
+            if pilot.pk not in self.pilot_index:
+                return []
+            indexes = [self.pilot_index[pilot.pk]]
+        else:
+            indexes = range(len(self.pilots))
+        if pilots_only:
+            return [i for i in indexes if self.pilots[i][4]]
+        return list(indexes)
+
+    def select_airstrips(self, airstrip=None, base=None, exclusive=False):
+        """Indexes of the requested airstrip(s), in ident order. Normally both
+        filters apply; with 'exclusive' the airstrip filter wins over base
+        (matching get_airstrip_names)."""
+        indexes = range(len(self.airstrips))
+        if airstrip is not None:
+            if airstrip.pk not in self.airstrip_index:
+                return []
+            indexes = [self.airstrip_index[airstrip.pk]]
+            if exclusive:
+                base = None
+        if base is not None:
+            indexes = [i for i in indexes
+                       if base.pk in self.bases.get(self.airstrips[i][0], ())]
+        return list(indexes)
+
+    def precedented(self):
+        """The same two-tier dictionary as util.get_precedented_checkouts.
+        Derived once per generation."""
+        generation = self.generation
+        if self._precedented is not None and self._precedented[0] == generation:
+            return self._precedented[1]
+        precedented = {}
+        for a, (_, ident, _) in enumerate(self.airstrips):
+            mask = self.precedent_mask(a)
+            if mask:
+                precedented[ident] = {
+                    name: True
+                    for bit, (_, name) in enumerate(self.aircraft_types)
+                    if mask >> bit & 1
+                }
+        self._precedented = (generation, precedented)
+        return precedented
+
+    def record(self, pilot_index, airstrip_index, actypes, status):
+        _, username, first_name, last_name, _ = self.pilots[pilot_index]
+        _, ident, name = self.airstrips[airstrip_index]
+        return util.checkout_record(
+                    util.format_full_name(username, first_name, last_name),
+                    username,
+                    ident,
+                    name,
+                    actypes,
+                    status)
+
+    def checkout_filter(self, actypes, pilot=None, airstrip=None, base=None, aircraft_type=None, **kwargs):
+        """Equivalent of util.checkout_filter"""
+        types = self.select_types(aircraft_type)
+        wanted = sum(1 << bit for bit, _ in types)
+        positions = util.aircrafttype_positions(actypes)
+        columns = [(bit, positions[name]) for bit, name in types]
+        results = []
+        for p in self.select_pilots(pilot):
+            for a in self.select_airstrips(airstrip, base):
+                mask = self.pair_mask(p, a) & wanted
+                if not mask:
+                    continue
+                r = self.record(p, a, actypes, util.CHECKOUT_BELUM)
+                for bit, position in columns:
+                    if mask >> bit & 1:
+                        r.cells[position] = util.CHECKOUT_SUDAH
+                results.append(r)
+        return results
+
+    def belum_selesai(self, actypes, pilot=None, airstrip=None, base=None, aircraft_type=None, **kwargs):
+        """Equivalent of util.belum_selesai_python"""
+        types = self.select_types(aircraft_type)
+        wanted = sum(1 << bit for bit, _ in types)
+        if not wanted:
+            return []
+        positions = util.aircrafttype_positions(actypes)
+        columns = [(bit, positions[name]) for bit, name in types]
+        airstrips = []
+        for a in self.select_airstrips(airstrip, base, exclusive=True):
+            precedent = self.precedent_mask(a)
+            if precedent:
+                airstrips.append((a, precedent))
+            else:
+                logger.debug("Dropping %s: airstrip is globally unprecedented" % self.airstrips[a][1])
+
+        results = []
+        for p in self.select_pilots(pilot, pilots_only=True):
+            for a, precedent in airstrips:
+                mask = self.pair_mask(p, a)
+                if mask & wanted == wanted:
+                    continue
+                r = self.record(p, a, actypes, util.CHECKOUT_BELUM)
+                for bit, position in columns:
+                    if mask >> bit & 1:
+                        r.cells[position] = util.CHECKOUT_SUDAH
+                    elif not precedent >> bit & 1:
+                        r.cells[position] = util.CHECKOUT_UNPRECEDENTED
+                results.append(r)
+        return results
+
+
+@contextlib.contextmanager
+def locked(path):
+    """Serializes writers (across processes) of the coverage file at 'path'"""
+    with open(path + '.lock', 'a') as lockfile:
+        fcntl.flock(lockfile.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lockfile.fileno(), fcntl.LOCK_UN)
+
+
+def set_bit(buffer, offset, bit, present):
+    index = offset + bit // 8
+    if present:
+        buffer[index] |= 1 << (bit % 8)
+    else:
+        buffer[index] &= ~(1 << (bit % 8)) & 0xFF
+
+
+def build(path=None):
+    """Writes a fresh coverage file from the database. The new file replaces
+    the old one atomically, so readers never see a partial file."""
+    path = path or settings.CHECKOUT_COVERAGE_FILE
+    start = time.time()
+
+    pilot_ids = set(util.get_pilots().values_list('id', flat=True))
+    # Users who have checkouts but are no longer pilots still show up in the
+    # sudah selesai reports, so they're part of the pilot dimension too.
+    users = User.objects.filter(
+                Q(id__in=pilot_ids) | Q(checkout__isnull=False)
+            ).distinct().order_by(
+                'last_name',
+                'first_name'
+            ).values_list('id', 'username', 'first_name', 'last_name')
+    pilots = [[pk, username, first_name, last_name, pk in pilot_ids]
+              for pk, username, first_name, last_name in users]
+    airstrips = [list(a) for a in Airstrip.objects.order_by('ident').values_list('id', 'ident', 'name')]
+    aircraft_types = [list(t) for t in AircraftType.objects.order_by('sorted_position', 'name', 'pk').values_list('id', 'name')]
+    bases = {}
+    for airstrip_id, base_id in Airstrip.bases.through.objects.values_list('from_airstrip_id', 'to_airstrip_id'):
+        bases.setdefault(airstrip_id, []).append(base_id)
+
+    pilot_index = {p[0]: i for i, p in enumerate(pilots)}
+    airstrip_index = {a[0]: i for i, a in enumerate(airstrips)}
+    type_index = {t[0]: i for i, t in enumerate(aircraft_types)}
+    bytes_per_pair = max(1, (len(aircraft_types) + 7) // 8)
+
+    precedent = bytearray(len(airstrips) * bytes_per_pair)
+    coverage = bytearray(len(pilots) * len(airstrips) * bytes_per_pair)
+    rows = Checkout.objects.values_list('pilot_id', 'airstrip_id', 'aircraft_type_id')
+    for pilot_id, airstrip_id, type_id in rows.iterator():
+        a = airstrip_index[airstrip_id]
+        bit = type_index[type_id]
+        pair = pilot_index[pilot_id] * len(airstrips) + a
+        set_bit(coverage, pair * bytes_per_pair, bit, True)
+        set_bit(precedent, a * bytes_per_pair, bit, True)
+
+    dimensions = json.dumps({
+        'pilots': pilots,
+        'airstrips': airstrips,
+        'aircraft_types': aircraft_types,
+        'bases': bases,
+    }).encode('utf-8')
+    header = HEADER.pack(
+                MAGIC,
+                FORMAT,
+                time.time_ns(),
+                len(pilots),
+                len(airstrips),
+                len(aircraft_types),
+                bytes_per_pair,
+                len(dimensions))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.coverage-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(dimensions)
+            f.write(precedent)
+            f.write(coverage)
+        os.replace(temp_path, path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+    logger.info("Built coverage tensor %s (%d pilots x %d airstrips x %d aircraft types) in %.0fms" % (
+        path, len(pilots), len(airstrips), len(aircraft_types), (time.time() - start) * 1000.0))
+
+
+# The tensor currently mapped by this process
+_tensor = None
+
+
+def load():
+    """Returns the CoverageTensor for settings.CHECKOUT_COVERAGE_FILE, or None
+    if the coverage tensor isn't enabled. The file is built if it doesn't
+    exist yet, and remapped if another process has replaced it."""
+    global _tensor
+    path = settings.CHECKOUT_COVERAGE_FILE
+    if not path:
+        return None
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        stat = None
+    if _tensor is not None and stat is not None and _tensor.path == path and _tensor.is_current(stat):
+        return _tensor
+
+    if _tensor is not None:
+        _tensor.close()
+        _tensor = None
+    try:
+        _tensor = CoverageTensor(path)
+    except (FileNotFoundError, CoverageError) as exc:
+        logger.debug("Rebuilding coverage tensor: %s" % exc)
+        with locked(path):
+            # Another process may have rebuilt it while we waited for the lock
+            try:
+                _tensor = CoverageTensor(path)
+            except (FileNotFoundError, CoverageError):
+                build(path)
+                _tensor = CoverageTensor(path)
+    return _tensor
+
+
+def invalidate():
+    """Discards the coverage file; the next reader rebuilds it"""
+    path = settings.CHECKOUT_COVERAGE_FILE
+    if not path:
+        return
+    with locked(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def patch(pilot_id, airstrip_id, aircraft_type_id, present):
+    """Records that a single checkout was added ('present') or removed. Falls
+    back to invalidating the file if the checkout isn't within the tensor's
+    dimensions (e.g. a brand new airstrip)."""
+    patch_many([(pilot_id, airstrip_id, aircraft_type_id)], present)
+
+
+def patch_many(cells, present):
+    """Records that the checkouts given as (pilot_id, airstrip_id,
+    aircraft_type_id) 'cells' were all added ('present') or all removed, under
+    a single lock and generation bump. Falls back to invalidating the file if
+    any of them isn't within the tensor's dimensions."""
+    path = settings.CHECKOUT_COVERAGE_FILE
+    if not path or not cells:
+        return
+    with locked(path):
+        try:
+            tensor = CoverageTensor(path, access=mmap.ACCESS_WRITE)
+        except (FileNotFoundError, CoverageError):
+            return # The next reader will build it from scratch
+        try:
+            indexes = []
+            for pilot_id, airstrip_id, aircraft_type_id in cells:
+                indexes.append((
+                    tensor.pilot_index.get(pilot_id),
+                    tensor.airstrip_index.get(airstrip_id),
+                    tensor.type_index.get(aircraft_type_id),
+                ))
+            rebuild = any(index is None for cell in indexes for index in cell)
+            if not rebuild:
+                if not present:
+                    # A precedent only goes away with the last checkout held
+                    # by anybody at the airstrip in the aircraft type
+                    airstrip_ids = set(cell[1] for cell in cells)
+                    type_ids = set(cell[2] for cell in cells)
+                    remaining = set(Checkout.objects.filter(
+                                    airstrip_id__in=airstrip_ids,
+                                    aircraft_type_id__in=type_ids
+                                ).values_list('airstrip_id', 'aircraft_type_id').distinct())
+                for (p, a, bit), (_, airstrip_id, aircraft_type_id) in zip(indexes, cells):
+                    set_bit(tensor.buffer, tensor.pair_offset(p, a), bit, present)
+                    if present or (airstrip_id, aircraft_type_id) not in remaining:
+                        set_bit(tensor.buffer, tensor.precedent_mask_offset(a), bit, present)
+                GENERATION.pack_into(tensor.buffer, GENERATION_OFFSET, tensor.generation + 1)
+                tensor.buffer.flush()
+        finally:
+            tensor.close()
+        if rebuild:
+            os.unlink(path)
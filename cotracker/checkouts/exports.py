@@ -0,0 +1,316 @@
+"""Writing and publishing exported files
+
+The pilot weight exports are served straight from STATIC_ROOT by nginx (see
+etc/nginx.secure) to other systems which poll them.
+
+json_chunks() and xml_chunks() render a document made of a few header
+fields and a list of records, yielding the text a piece at a time as the
+records are consumed. Given records read through a server-side cursor
+(QuerySet.iterator()) an export is never held in memory as a whole,
+however many records it has. Either writer can produce indented or compact
+output, and all XML text is escaped.
+
+publish() streams such a document to its file, atomically, along with:
+
+- precompressed '.gz' and, when the optional 'brotli' package is installed,
+  '.br' copies for nginx's gzip_static/brotli_static. They are given the
+  same mtime as the export itself, so every encoding of it carries the same
+  Last-Modified and its ETag only changes when the content does;
+- optionally, a content addressed copy whose name includes a prefix of the
+  content's SHA-256 digest. Its content never changes, so consumers may cache
+  it forever.
+
+write_metadata() records the digest, sizes and content addressed name of
+each export in a small JSON pointer file. A consumer can poll that cheaply
+and fetch an export only when its digest has changed. The content addressed
+copy which the previous pointer file named is kept until the next change,
+for any consumer which read the pointer just before it changed; older ones
+are deleted.
+"""
+import contextlib
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import uuid
+from xml.sax.saxutils import escape
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Number of hex digits of the digest used in content addressed names
+HASH_LENGTH = 12
+# Block size for reading files back when checking their digests
+READ_SIZE = 64 * 1024
+
+
+# =============================================================================
+# == Writers
+# =============================================================================
+
+def json_chunks(header, items_key, records, indent=4):
+    """Yields the text of a JSON object holding the 'header' fields plus an
+    'items_key' list of the dictionaries from 'records' (any iterable, read
+    lazily). Keys are sorted. With an indent the text is the same as
+    json.dumps(..., indent=indent, sort_keys=True) would give; with
+    indent=None it is as compact as possible."""
+    if indent is None:
+        separators, newline, pad = (',', ':'), '', ''
+    else:
+        separators, newline, pad = (',', ': '), '\n', ' ' * indent
+
+    def dump(value, depth):
+        text = json.dumps(value, indent=indent, sort_keys=True, separators=separators)
+        return text.replace('\n', '\n' + pad * depth) if indent is not None else text
+
+    yield '{'
+    for position, key in enumerate(sorted(list(header) + [items_key])):
+        if position:
+            yield separators[0]
+        yield newline + pad + json.dumps(key) + separators[1]
+        if key != items_key:
+            yield dump(header[key], 1)
+            continue
+        count = 0
+        for record in records:
+            yield ('[' if count == 0 else separators[0]) + newline + pad * 2 + dump(record, 2)
+            count += 1
+        yield '[]' if count == 0 else newline + pad + ']'
+    yield newline + '}'
+
+
+def xml_text(value):
+    """Escaped element text for a value"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return escape(str(value))
+
+
+def xml_chunks(root, header, items_tag, records, indent=2):
+    """Yields the text of an XML document: a 'root' element holding an
+    element for each of the 'header' fields, followed by an 'items_tag'
+    element for each dictionary from 'records' (any iterable, read lazily)
+    holding an element for each of its fields. Fields are written in the
+    dictionaries' order. With indent=None there is no whitespace between the
+    elements."""
+    newline = '\n' if indent is not None else ''
+    pad = ' ' * (indent or 0)
+
+    def element(name, value, depth):
+        return '%s<%s>%s</%s>%s' % (pad * depth, name, xml_text(value), name, newline)
+
+    yield '<%s>%s' % (root, newline)
+    for name, value in header.items():
+        yield element(name, value, 1)
+    for record in records:
+        parts = ['%s<%s>%s' % (pad, items_tag, newline)]
+        for name, value in record.items():
+            parts.append(element(name, value, 2))
+        parts.append('%s</%s>%s' % (pad, items_tag, newline))
+        yield ''.join(parts)
+    yield '</%s>%s' % (root, newline)
+
+
+def digest(chunks):
+    """SHA-256 hex digest of the UTF-8 text from 'chunks'"""
+    sha = hashlib.sha256()
+    for chunk in chunks:
+        sha.update(chunk.encode('utf-8'))
+    return sha.hexdigest()
+
+
+# =============================================================================
+# == Files
+# =============================================================================
+
+@contextlib.contextmanager
+def atomic_writer(path):
+    """Opens a temporary file (binary) in the same directory as 'path' which
+    replaces 'path' in one step when the block completes, so a reader (e.g.
+    nginx) sees either the old file or the new one but never a partly
+    written one. If the block raises, 'path' is left as it was."""
+    directory, filename = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(prefix='.' + filename + '.', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file readable only by its owner
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def write_atomically(path, content):
+    """Replaces the file at 'path' with 'content' (str or bytes) in one step"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    with atomic_writer(path) as f:
+        f.write(content)
+
+
+def link_atomically(source, target):
+    """Makes 'target' another name for the file at 'source', replacing any
+    existing 'target' in one step"""
+    directory, filename = os.path.split(target)
+    temp_path = os.path.join(directory, '.%s.%s' % (filename, uuid.uuid4().hex))
+    os.link(source, temp_path)
+    try:
+        os.replace(temp_path, target)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def read(path):
+    """Returns the contents of an exported file, or None if it's missing"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def file_digest(path):
+    """SHA-256 hex digest of a file's content, or None if it's missing"""
+    sha = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(READ_SIZE), b''):
+                sha.update(block)
+    except FileNotFoundError:
+        return None
+    return sha.hexdigest()
+
+
+def hashed_path(path, digest):
+    """'dir/name.ext' -> 'dir/name.<digest prefix>.ext'"""
+    root, ext = os.path.splitext(path)
+    return '%s.%s%s' % (root, digest[:HASH_LENGTH], ext)
+
+
+def encodings():
+    """[(encoding, suffix)] of the precompressed copies publish() writes"""
+    return [('gz', '.gz')] + ([('br', '.br')] if brotli is not None else [])
+
+
+def is_published(path, digest, hashed=False):
+    """True if 'path' already holds the content with the given digest and
+    every copy publish() would write for it exists"""
+    if file_digest(path) != digest:
+        return False
+    paths = [path]
+    if hashed:
+        paths.append(hashed_path(path, digest))
+    suffixes = [''] + [suffix for _, suffix in encodings()]
+    return all(os.path.exists(p + suffix) for p in paths for suffix in suffixes)
+
+
+def publish(path, chunks, hashed=False, previous=None):
+    """Streams the text from 'chunks' (an iterable of str, or a single str)
+    to 'path' together with its precompressed copies and, if 'hashed', its
+    content addressed copy. 'previous' is the metadata this export had in the
+    last pointer file, if any. Returns the export's metadata for
+    write_metadata()."""
+    if isinstance(chunks, str):
+        chunks = [chunks]
+    sha = hashlib.sha256()
+    size = 0
+    with contextlib.ExitStack() as stack:
+        # Entered first so that it's closed (and so replaced) last
+        plain = stack.enter_context(atomic_writer(path))
+        writers = []
+        finishers = []
+        for encoding, suffix in encodings():
+            f = stack.enter_context(atomic_writer(path + suffix))
+            if encoding == 'gz':
+                # A fixed header (no name or timestamp) means the same content
+                # always compresses to the same bytes
+                gz = stack.enter_context(gzip.GzipFile(filename='', mode='wb', fileobj=f, compresslevel=9, mtime=0))
+                writers.append(gz.write)
+            else:
+                compressor = brotli.Compressor()
+                writers.append(lambda data, f=f, c=compressor: f.write(c.process(data)))
+                finishers.append(lambda f=f, c=compressor: f.write(c.finish()))
+        for chunk in chunks:
+            data = chunk.encode('utf-8')
+            sha.update(data)
+            size += len(data)
+            plain.write(data)
+            for write in writers:
+                write(data)
+        for finish in finishers:
+            finish()
+
+    digest = sha.hexdigest()
+    metadata = {
+        'name': os.path.basename(path),
+        'sha256': digest,
+        'bytes': size,
+        'encodings': {},
+    }
+    stat = os.stat(path)
+    for encoding, suffix in encodings():
+        os.utime(path + suffix, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        metadata['encodings'][encoding] = os.path.getsize(path + suffix)
+
+    if hashed:
+        target = hashed_path(path, digest)
+        for suffix in [''] + [suffix for _, suffix in encodings()]:
+            link_atomically(path + suffix, target + suffix)
+        metadata['hashed'] = os.path.basename(target)
+
+    keep = [metadata.get('hashed'), (previous or {}).get('hashed')]
+    remove_superseded(path, [name for name in keep if name])
+    return metadata
+
+
+def remove_superseded(path, keep=()):
+    """Deletes the content addressed copies of 'path' (and their compressed
+    copies) except those named in 'keep'. Returns the number of files
+    deleted."""
+    root, ext = os.path.splitext(path)
+    pattern = re.compile(r'^%s\.[0-9a-f]{%d}%s(\.gz|\.br)?$' % (
+                            re.escape(os.path.basename(root)), HASH_LENGTH, re.escape(ext)))
+    count = 0
+    for candidate in glob.glob(glob.escape(root) + '.*'):
+        name = os.path.basename(candidate)
+        if not pattern.match(name):
+            continue
+        if any(name.startswith(kept) for kept in keep):
+            continue
+        os.unlink(candidate)
+        count += 1
+    return count
+
+
+def read_metadata(path):
+    """Returns the pointer file's contents, or {} if there isn't a readable
+    one"""
+    try:
+        document = json.loads(read(path) or '{}')
+    except ValueError:
+        return {}
+    return document if isinstance(document, dict) else {}
+
+
+def write_metadata(path, version, updated, files):
+    """Writes the pointer file describing the published exports. 'files' maps
+    a format name to the metadata returned by publish()."""
+    document = {
+        'version': version,
+        'updated': updated,
+        'files': files,
+    }
+    write_atomically(path, json.dumps(document, indent=4, sort_keys=True))
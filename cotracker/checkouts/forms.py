@@ -1,4 +1,5 @@
 from django import forms
+from django.utils.http import urlencode
 
 from .models import AircraftType, Airstrip
 import checkouts.util as util
@@ -13,22 +14,27 @@ class BaseModelChoiceField(forms.ModelChoiceField):
 
 
 class FilterForm(forms.Form):
+    """The filter is submitted with GET, so pilots and airstrips are chosen by
+    username and ident to keep the result URLs readable"""
     pilot = forms.ModelChoiceField(
         queryset=util.get_pilots(), 
         empty_label="All", 
         required=False,
+        to_field_name='username',
     )
     
     airstrip = forms.ModelChoiceField(
         queryset=Airstrip.objects.all().order_by('ident'),
         empty_label="All",
         required=False,
+        to_field_name='ident',
     )
     
     base = BaseModelChoiceField(
         queryset=util.get_bases().order_by('name'),
         empty_label="All",
         required=False,
+        to_field_name='ident',
     )
     
     aircraft_type = forms.ModelChoiceField(
@@ -43,6 +49,17 @@ class FilterForm(forms.Form):
         initial=util.CHECKOUT_SUDAH,
         widget=forms.RadioSelect,
     )
+    
+    def query_string(self):
+        """The canonical query string of a valid filter: the fields in the
+        order they're declared, leaving out those set to 'All'"""
+        params = []
+        for name, field in self.fields.items():
+            value = self.cleaned_data.get(name)
+            if value in (None, ''):
+                continue
+            params.append((name, field.prepare_value(value)))
+        return urlencode(params)
 
 
 class CheckoutEditForm(forms.Form):
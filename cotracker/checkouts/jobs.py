@@ -0,0 +1,225 @@
+"""Durable background jobs
+
+Work which shouldn't hold up a request (rewriting the pilot weight exports,
+sending notification emails, rebuilding out of date reports) is recorded as
+a Job row by enqueue() and carried out by the worker process, 'manage.py
+run_jobs', which runs under supervisor alongside gunicorn (see
+etc/supervisor.conf).
+
+Because the queue lives in the database, a job is only visible to the worker
+once the transaction which enqueued it commits, and nothing is lost when the
+worker restarts. A job which raises is put back in the queue with an
+exponentially growing delay until it has used up its attempts, after which
+it is left as FAILED for a person to look at on the jobs status page. A job
+left RUNNING by a worker which died part way through is put back in the
+queue once it's older than STALE_AFTER.
+
+When settings.BACKGROUND_JOBS is not enabled the job is still recorded, but
+it is also run as soon as the enqueueing transaction commits, so the work
+happens during the request just as it did before there was a worker. Any
+retries are left to the worker. With no worker to call purge_finished(), the
+inline run clears out old finished jobs itself.
+"""
+import datetime
+import logging
+import traceback
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Job, PilotWeight
+from . import reports
+import checkouts.util as util
+
+
+logger = logging.getLogger(__name__)
+
+# Delay before the first retry; doubled for each further attempt
+RETRY_DELAY = datetime.timedelta(seconds=30)
+MAX_RETRY_DELAY = datetime.timedelta(hours=1)
+# A RUNNING job older than this is assumed to have lost its worker
+STALE_AFTER = datetime.timedelta(minutes=15)
+# Finished jobs are kept this long for the status page
+KEEP_DONE = datetime.timedelta(days=30)
+
+HANDLERS = {}
+
+
+def handler(name):
+    """Registers the decorated function as the handler for jobs named 'name'"""
+    def register(func):
+        HANDLERS[name] = func
+        return func
+    return register
+
+
+def enqueue(name, max_attempts=5, **arguments):
+    """Records a job which will call the 'name' handler with the given
+    (JSON serializable) keyword arguments. Returns the Job."""
+    if name not in HANDLERS:
+        raise ValueError("No handler for jobs named '%s'" % name)
+    job = Job.objects.create(name=name, arguments=arguments, max_attempts=max_attempts)
+    logger.info("Enqueued %s" % job)
+    if not settings.BACKGROUND_JOBS:
+        transaction.on_commit(lambda: run_inline(job.pk))
+    return job
+
+
+def enqueue_once(name, delay=0, **arguments):
+    """Like enqueue, but coalesces repeated requests for the same work: if a
+    job with the same name and arguments is still waiting to start, that job
+    is returned instead of recording another. With settings.BACKGROUND_JOBS
+    enabled a new job waits 'delay' seconds first, so everything asked for
+    within that window is covered by a single run. (Without the worker there
+    is nothing to run a delayed or coalesced job, so this is just enqueue.)"""
+    if not settings.BACKGROUND_JOBS:
+        return enqueue(name, **arguments)
+    if name not in HANDLERS:
+        raise ValueError("No handler for jobs named '%s'" % name)
+    for job in Job.objects.filter(name=name, status=Job.QUEUED):
+        if job.arguments == arguments:
+            logger.info("Coalesced with %s" % job)
+            return job
+    run_after = timezone.now() + datetime.timedelta(seconds=delay)
+    job = Job.objects.create(name=name, arguments=arguments, run_after=run_after)
+    logger.info("Enqueued %s to run after %s" % (job, run_after))
+    return job
+
+
+def retry_delay(attempts):
+    """How long to wait before trying a job again after its Nth failed attempt"""
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def claim(pk=None):
+    """Marks a queued job which is due as RUNNING and returns it, or returns
+    None if there isn't one. The update only succeeds for the first claimant,
+    so several workers (or a worker and an inline run) never share a job."""
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_after__lte=now)
+    if pk is not None:
+        due = due.filter(pk=pk)
+    for candidate in due.order_by('run_after', 'pk').values_list('pk', flat=True)[:10]:
+        claimed = Job.objects.filter(pk=candidate, status=Job.QUEUED).update(
+                    status=Job.RUNNING,
+                    attempts=F('attempts') + 1,
+                    started=now,
+                    modified=now)
+        if claimed:
+            return Job.objects.get(pk=candidate)
+    return None
+
+
+def execute(job):
+    """Calls the handler for a claimed job and records the outcome. Returns
+    True if the handler succeeded."""
+    try:
+        HANDLERS[job.name](**job.arguments)
+    except Exception:
+        now = timezone.now()
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts or job.name not in HANDLERS:
+            job.status = Job.FAILED
+            job.finished = now
+            logger.exception("%s failed after %d attempts" % (job, job.attempts))
+        else:
+            job.status = Job.QUEUED
+            job.run_after = now + retry_delay(job.attempts)
+            logger.exception("%s failed (attempt %d of %d); retrying after %s" % (
+                                job, job.attempts, job.max_attempts, job.run_after))
+        job.save(update_fields=['status', 'run_after', 'finished', 'last_error', 'modified'])
+        return False
+
+    job.status = Job.DONE
+    job.finished = timezone.now()
+    job.save(update_fields=['status', 'finished', 'modified'])
+    logger.info("%s done" % job)
+    return True
+
+
+def run_job(pk):
+    """Runs one particular job, if it is still queued and due"""
+    job = claim(pk)
+    if job is not None:
+        execute(job)
+
+
+def run_inline(pk):
+    """Runs a job enqueued without the worker, then purges old finished jobs
+    which the worker would otherwise have cleared out"""
+    run_job(pk)
+    purge_finished()
+
+
+def run_pending(limit=None):
+    """Runs due jobs until there are none left (or 'limit' have run). Returns
+    the number of jobs run."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim()
+        if job is None:
+            break
+        execute(job)
+        count += 1
+    return count
+
+
+def requeue_stale():
+    """Puts RUNNING jobs whose worker seems to have died back in the queue.
+    The interrupted run still counts as an attempt. Returns the number of
+    jobs requeued."""
+    now = timezone.now()
+    count = Job.objects.filter(status=Job.RUNNING, started__lt=now - STALE_AFTER).update(
+                status=Job.QUEUED,
+                run_after=now,
+                modified=now)
+    if count:
+        logger.warning("Requeued %d stale jobs" % count)
+    return count
+
+
+def purge_finished():
+    """Deletes jobs which finished successfully more than KEEP_DONE ago"""
+    count, _ = Job.objects.filter(status=Job.DONE, finished__lt=timezone.now() - KEEP_DONE).delete()
+    return count
+
+
+def status_counts():
+    """Returns the number of jobs in each status, as a dictionary"""
+    counts = dict((status, 0) for status, _ in Job.STATUS_CHOICES)
+    rows = Job.objects.order_by().values('status').annotate(count=Count('pk')).values_list('status', 'count')
+    for status, count in rows:
+        counts[status] = count
+    return counts
+
+
+# =============================================================================
+# == Handlers
+# =============================================================================
+
+@handler('export_pilotweights')
+def export_pilotweights():
+    util.export_pilotweights()
+
+
+@handler('notify_pilotweight_update')
+def notify_pilotweight_update(pilotweight_id, weight):
+    # The weight is the one which was saved when the job was enqueued, so
+    # each notification reports its own update even if a later one has
+    # already been made.
+    pilotweight = PilotWeight.objects.select_related('pilot').get(pk=pilotweight_id)
+    pilotweight.weight = weight
+    util.notify_pilotweight_update(pilotweight)
+
+
+@handler('refresh_filter_report')
+def refresh_filter_report(filters):
+    try:
+        reports.refresh_filter(filters)
+    except ObjectDoesNotExist:
+        # Something the filter named has been deleted since; nobody will ask
+        # for its report again
+        logger.info("Not refreshing filter report %s: no longer exists" % filters)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from checkouts import summary
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the checkout summary table from the checkouts, or checks it for drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help="Only compare the table with the checkouts; exits with an error if they differ",
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            differences = summary.drift()
+            for (pilot_id, airstrip_id), (expected, stored) in sorted(differences.items()):
+                self.stdout.write("pilot=%d airstrip=%d expected=%s stored=%s" % (
+                                    pilot_id, airstrip_id, bin(expected), bin(stored)))
+            if differences:
+                raise CommandError("%d pilot/airstrip pairs have drifted; run 'checkout_summary' to rebuild" % len(differences))
+            self.stdout.write("Checkout summary is up to date")
+        else:
+            count = summary.rebuild()
+            self.stdout.write("Rebuilt checkout summary with %d rows" % count)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from checkouts import reports
+
+
+class Command(BaseCommand):
+    help = "Builds the unfiltered and per-base Belum Selesai reports into the report cache, unless they're up to date"
+
+    def handle(self, *args, **options):
+        if reports.get_cache() is None:
+            self.stdout.write("The report cache isn't configured (REPORT_CACHE_BACKEND); nothing to do")
+            return
+        count = reports.precompute()
+        self.stdout.write("Built %d reports" % count)
@@ -0,0 +1,57 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from checkouts import jobs
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs, polling for new ones until stopped (or, with --once, until the queue is empty)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Run the jobs which are due now and exit",
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help="Seconds to wait between checks of an empty queue (default: 5)",
+        )
+
+    def handle(self, *args, **options):
+        if options['once']:
+            jobs.requeue_stale()
+            count = jobs.run_pending()
+            self.stdout.write("Ran %d jobs" % count)
+            return
+
+        # Supervisor stops the worker with SIGTERM. The job in progress (if
+        # any) is allowed to finish before the loop exits.
+        self.stopping = False
+        def stop(signum, frame):
+            self.stopping = True
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write("Waiting for jobs")
+        last_purge = None
+        while not self.stopping:
+            # Drops connections which the database has closed or which have
+            # outlived CONN_MAX_AGE, as a request would
+            close_old_connections()
+            if last_purge is None or time.monotonic() - last_purge > 60 * 60:
+                jobs.purge_finished()
+                last_purge = time.monotonic()
+            jobs.requeue_stale()
+            while not self.stopping and jobs.run_pending(limit=1):
+                pass
+            waited = 0.0
+            while not self.stopping and waited < options['interval']:
+                time.sleep(0.5)
+                waited += 0.5
+        self.stdout.write("Stopped")
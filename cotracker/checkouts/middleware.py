@@ -1,14 +1,78 @@
 """Checkouts application middleware"""
 
 import datetime
+import hashlib
 import logging
+import re
 import subprocess
 import time
 
 from django.contrib import messages
+from django.db import connection
 
 logger = logging.getLogger('analytics')
 
+
+# Literal values which vary between otherwise identical statements
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SQL_IN_LISTS = re.compile(r"\bIN \((?:%s|\?)(?:, (?:%s|\?))*\)", re.IGNORECASE)
+SQL_TABLES = re.compile(r'\b(?:FROM|JOIN|INTO|UPDATE)\s+[`"]?(\w+)', re.IGNORECASE)
+
+
+def sql_fingerprint(sql):
+    """Condenses a SQL statement into a short token identifying its shape,
+    e.g. 'SELECT:checkouts_checkout+auth_user#3f2a9c1e'.
+
+    The statement type and the tables it touches make the token readable in
+    the log; the hash (taken after replacing literals and collapsing IN
+    lists) tells apart different statements on the same tables while giving
+    repeated executions of one statement the same fingerprint. The token
+    contains no spaces, quotes, or '=' so the log parsers can split on them.
+    """
+    normalized = ' '.join(sql.split())
+    normalized = SQL_LITERALS.sub('?', normalized)
+    normalized = SQL_IN_LISTS.sub('IN (...)', normalized)
+    verb = normalized.split(' ', 1)[0].upper() if normalized else 'EMPTY'
+    tables = []
+    for table in SQL_TABLES.findall(normalized):
+        if table not in tables:
+            tables.append(table)
+    digest = hashlib.md5(normalized.encode('utf-8')).hexdigest()[:8]
+    return '%s:%s#%s' % (verb, '+'.join(tables) or '-', digest)
+
+
+class QueryStats():
+    """Database execute wrapper which tallies the queries made while it is
+    installed (see connection.execute_wrapper): how many, how long they took
+    in total, and which was the slowest."""
+    def __init__(self):
+        self.count = 0
+        self.elapsed = 0.0
+        self.slowest_elapsed = -1.0
+        self.slowest_sql = None
+
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000.0
+            self.count += 1
+            self.elapsed += elapsed
+            if elapsed > self.slowest_elapsed:
+                self.slowest_elapsed = elapsed
+                self.slowest_sql = sql
+
+
+    @property
+    def slowest(self):
+        """Fingerprint of the slowest statement, or '-' if there were none"""
+        if self.slowest_sql is None:
+            return '-'
+        return sql_fingerprint(self.slowest_sql)
+
+
 class Analytics():
     """Tracks request details useful for analysis of usage patterns.
 
@@ -67,7 +131,7 @@ class Analytics():
             'useragent': request.META.get('HTTP_USER_AGENT', 'None'),
         }
 
-        if hasattr(request, 'user') and request.user.is_authenticated():
+        if hasattr(request, 'user') and request.user.is_authenticated:
             context['user'] = request.user.username
         else:
             context['user'] = 'anonymous'
@@ -102,7 +166,12 @@ class Analytics():
         else:
             context['elapsed'] = -1.0
 
-        template = "client=%(user)s@%(ip)s method=%(method)s path=%(path)s queue=%(queue).0fms real=%(elapsed).0fms status=%(status)s bytes=%(bytes)s useragent=\"%(useragent)s\""
+        stats = getattr(request, '_analytics_queries', None) or QueryStats()
+        context['queries'] = stats.count
+        context['sql'] = stats.elapsed
+        context['slowest'] = stats.slowest
+
+        template = "client=%(user)s@%(ip)s method=%(method)s path=%(path)s queue=%(queue).0fms real=%(elapsed).0fms status=%(status)s bytes=%(bytes)s queries=%(queries)d sql=%(sql).0fms slowest=%(slowest)s useragent=\"%(useragent)s\""
         logger.info(template % context)
 
         return response
@@ -151,5 +220,10 @@ class Analytics():
         #        self.update_check(request)
         #    except:
         #        logger.exception("Encountered an error during update_check middleware, skipping")
-        response = self.get_response(request)
+        if self.is_monitor_agent(request):
+            response = self.get_response(request)
+        else:
+            request._analytics_queries = QueryStats()
+            with connection.execute_wrapper(request._analytics_queries):
+                response = self.get_response(request)
         return self.process_response(request, response)
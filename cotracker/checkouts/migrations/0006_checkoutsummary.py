@@ -0,0 +1,68 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+def populate_summary(apps, schema_editor):
+    """Builds the summary rows for the existing checkouts. Each aircraft
+    type's bit is its rank in primary key order (see checkouts.summary)."""
+    AircraftType = apps.get_model('checkouts', 'AircraftType')
+    Checkout = apps.get_model('checkouts', 'Checkout')
+    CheckoutSummary = apps.get_model('checkouts', 'CheckoutSummary')
+
+    pks = AircraftType.objects.order_by('pk').values_list('pk', flat=True)
+    bits = dict((pk, 1 << rank) for rank, pk in enumerate(pks))
+    if len(bits) > 63:
+        return
+    masks = {}
+    for pilot_id, airstrip_id, aircraft_type_id in Checkout.objects.values_list('pilot_id', 'airstrip_id', 'aircraft_type_id'):
+        pair = (pilot_id, airstrip_id)
+        masks[pair] = masks.get(pair, 0) | bits[aircraft_type_id]
+    CheckoutSummary.objects.bulk_create(
+        [CheckoutSummary(pilot_id=p, airstrip_id=a, sudah=mask) for (p, a), mask in masks.items()],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('checkouts', '0005_auto_20151017_1209'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='airstrip',
+            name='bases',
+            field=models.ManyToManyField(blank=True, limit_choices_to={'is_base': True}, to='checkouts.Airstrip'),
+        ),
+        migrations.AlterField(
+            model_name='checkout',
+            name='pilot',
+            field=models.ForeignKey(limit_choices_to={'groups__name': 'Pilots'}, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='pilotweight',
+            name='pilot',
+            field=models.OneToOneField(limit_choices_to={'groups__name': 'Pilots'}, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='CheckoutSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('sudah', models.BigIntegerField(default=0)),
+                ('airstrip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='checkouts.airstrip')),
+                ('pilot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('pilot', 'airstrip')},
+            },
+        ),
+        migrations.RunPython(populate_summary, migrations.RunPython.noop),
+    ]
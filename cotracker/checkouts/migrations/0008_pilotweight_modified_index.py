@@ -0,0 +1,17 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkouts', '0007_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pilotweight',
+            index=models.Index(fields=['modified', 'id'], name='checkouts_p_modifie_72b7cd_idx'),
+        ),
+    ]
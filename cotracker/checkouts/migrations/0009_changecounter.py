@@ -0,0 +1,41 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:59
+
+from django.db import migrations, models
+import django.utils.timezone
+import model_utils.fields
+
+
+def create_counters(apps, schema_editor):
+    """One counter for each model the report pages are built from (see
+    checkouts.versions)"""
+    ChangeCounter = apps.get_model('checkouts', 'ChangeCounter')
+    for name in ('aircrafttype', 'airstrip', 'checkout', 'user'):
+        ChangeCounter.objects.get_or_create(name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkouts', '0008_pilotweight_modified_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='checkout',
+            index=models.Index(fields=['modified'], name='checkouts_c_modifie_d02195_idx'),
+        ),
+        migrations.RunPython(create_counters, migrations.RunPython.noop),
+    ]
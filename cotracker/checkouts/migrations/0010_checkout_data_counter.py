@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def create_counter(apps, schema_editor):
+    """The checkout data version which keys the cached reports (see
+    checkouts.reports)"""
+    ChangeCounter = apps.get_model('checkouts', 'ChangeCounter')
+    ChangeCounter.objects.get_or_create(name='checkout_data')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkouts', '0009_changecounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_counter, migrations.RunPython.noop),
+    ]
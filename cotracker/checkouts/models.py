@@ -1,6 +1,9 @@
 """Model definitions for the Checkouts app"""
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 from model_utils.models import TimeStampedModel
 
@@ -10,29 +13,70 @@ from model_utils.models import TimeStampedModel
 # =============================================================================
 
 # User names are desired in 'Last, First' format
+def format_full_name(username, first_name, last_name):
+    """Returns a name in 'Last, First' order. If neither last_name nor
+    first_name are set, the username will be returned.
+
+    Split out from user_full_name so that callers holding plain column values
+    (e.g. from a values_list query) don't need a User instance.
+    """
+    if last_name != '' and first_name != '':
+        return '%s, %s' % (last_name, first_name)
+    return username
+
+
 def user_full_name(user):
     """Returns the user's name in 'Last, First' order. If neither last_name 
     nor first_name are set for the user, the username field will be returned.
     """
-    if user.last_name != '' and user.first_name != '':
-        return '%s, %s' % (user.last_name, user.first_name)
-    return user.username
+    return format_full_name(user.username, user.first_name, user.last_name)
 User.full_name = property(user_full_name)
 
 # Default representation for users should be the 'Last, First' name format
 User.__str__ = user_full_name
 
+# Role checks are made many times per request (views and templates alike), so
+# a user's group names are loaded once and remembered on the User instance.
+# With settings.CACHE_USER_ROLES enabled they are also kept in the cache
+# between requests; checkouts.signals discards the cached copy whenever the
+# user's group memberships change.
+ROLES_CACHE_KEY = 'checkouts:roles:%d'
+ROLES_CACHE_TIMEOUT = 60 * 60
+
+def user_group_names(user):
+    """Returns the (frozen) set of names of the groups the user belongs to"""
+    try:
+        return user._group_names
+    except AttributeError:
+        pass
+
+    names = None
+    if settings.CACHE_USER_ROLES:
+        names = cache.get(ROLES_CACHE_KEY % user.pk)
+    if names is None:
+        names = frozenset(user.groups.values_list('name', flat=True))
+        if settings.CACHE_USER_ROLES:
+            cache.set(ROLES_CACHE_KEY % user.pk, names, ROLES_CACHE_TIMEOUT)
+    user._group_names = names
+    return names
+
+
+def invalidate_user_roles(user_ids):
+    """Discards the cached group names of the given users"""
+    cache.delete_many([ROLES_CACHE_KEY % pk for pk in user_ids])
+
+
 # Desire an easy, globally usable way to detect pilot vs non-pilot users
 def user_is_pilot(user):
     """Returns True if the given user is a member of the Pilots group"""
-    return user.groups.filter(name='Pilots').exists()
+    return 'Pilots' in user_group_names(user)
 User.is_pilot = property(user_is_pilot)
 
 # Similar to the need for an 'is_pilot' property, we need to recognize
 # flight schedulers.
 def user_is_flight_scheduler(user):
     """Returns True if the given user is a member of the Flight Schedulers group"""
-    return user.groups.filter(name='Flight Schedulers').exists()
+    return 'Flight Schedulers' in user_group_names(user)
 User.is_flight_scheduler = property(user_is_flight_scheduler)
 
 
@@ -100,6 +144,8 @@ class Checkout(TimeStampedModel):
 
     class Meta:
         unique_together = (('pilot', 'airstrip', 'aircraft_type'),)
+        # Serves the latest 'modified' lookup of checkouts.versions
+        indexes = [models.Index(fields=['modified'])]
 
 
 class PilotWeight(TimeStampedModel):
@@ -112,3 +158,76 @@ class PilotWeight(TimeStampedModel):
 
     def __str__(self):
         return "%s: %dkg" % (self.pilot, self.weight)
+
+    class Meta:
+        # Serves the change feed (util.pilotweight_changes), which pages
+        # through the rows in (modified, id) order
+        indexes = [models.Index(fields=['modified', 'id'])]
+
+
+class CheckoutSummary(TimeStampedModel):
+    """Denormalized copy of the checkouts, one row per pilot/airstrip pair
+
+    'sudah' is a bitmask of the aircraft types the pilot is checked out in at
+    the airstrip; see checkouts.summary for how the bits are assigned. Rows
+    are maintained by signals on Checkout and AircraftType and are never
+    edited directly.
+    """
+    pilot = models.ForeignKey(User, on_delete=models.CASCADE)
+    airstrip = models.ForeignKey(Airstrip, on_delete=models.CASCADE)
+    sudah = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return '%s at %s: %s' % (self.pilot, self.airstrip, bin(self.sudah))
+
+    class Meta:
+        unique_together = (('pilot', 'airstrip'),)
+
+
+class Job(TimeStampedModel):
+    """A unit of background work, carried out by 'manage.py run_jobs'
+
+    'name' selects the handler (see checkouts.jobs) and 'arguments' holds the
+    keyword arguments it is called with. A job which raises is put back in
+    the queue with a growing delay until it has used up 'max_attempts'.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=64)
+    arguments = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return '%s #%d (%s)' % (self.name, self.pk, self.status)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+
+class ChangeCounter(TimeStampedModel):
+    """Counts the changes to a model which its rows' 'modified' timestamps
+    don't reveal: deletions, many-to-many changes and, for Users (which
+    have no timestamp of their own), every save. 'name' is the model's
+    name, or that of a set of data counted as a whole; see
+    checkouts.versions.
+    """
+    name = models.CharField(max_length=64, unique=True)
+    count = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return '%s: %d' % (self.name, self.count)
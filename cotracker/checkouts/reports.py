@@ -0,0 +1,217 @@
+"""Cache of the rendered checkout reports
+
+The same few reports (a pilot's or an airstrip's checkouts, the filter
+results, the bases) are requested over and over, and building one runs the
+whole sudah_selesai/belum_selesai pipeline. render() keeps the HTML of each
+report in the cache named by settings.REPORT_CACHE, so that a repeat request
+only costs a cache read.
+
+Keys are made of the report's name, its parameters and the checkout data
+version (see checkouts.versions), which the receivers in checkouts.signals
+bump for every change to the checkouts, airstrips, aircraft types, base
+attachments and users. A change therefore never needs to find and delete
+the reports it affects: they're simply no longer asked for, and expire.
+As a change retires every report at once, each is rebuilt by just one of
+the requests which find it missing (see checkouts.singleflight).
+
+Only the part of a page which is the same for everyone who may see it is
+cached. Anything depending on the user (e.g. an 'Edit' link for flight
+schedulers) is either rendered outside of the report or passed in 'variant'
+so that each kind of user gets a copy of their own.
+
+Filter reports can also be served stale while they're rebuilt (see
+render_latest()). The unfiltered Belum Selesai report, the most expensive
+one there is, and the per-base ones are kept built ahead of time by
+precompute(), which 'manage.py precompute_reports' runs from cron (see
+etc/checkniner.crontab).
+
+The backend is whichever Django cache the alias is configured with (see
+REPORT_CACHE_BACKEND in the settings): a local-memory cache per worker, a
+file based cache shared by the workers on a host, or a shared store such as
+memcached.
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import AircraftType, Airstrip
+from . import singleflight, versions
+import checkouts.util as util
+
+
+logger = logging.getLogger(__name__)
+
+# Reports outlive any realistic gap between changes; superseded versions
+# expire on their own
+TIMEOUT = 24 * 60 * 60
+# The latest copy of a report, whatever its version, for serving while its
+# replacement is built
+LATEST_TIMEOUT = 7 * 24 * 60 * 60
+
+FILTER_TEMPLATE = 'checkouts/display_checkouts.html'
+
+
+def get_cache():
+    """The report cache, or None if the reports aren't cached"""
+    if not settings.REPORT_CACHE:
+        return None
+    return caches[settings.REPORT_CACHE]
+
+
+def params_digest(params):
+    return hashlib.md5(repr(tuple(params)).encode('utf-8')).hexdigest()
+
+
+def make_key(version, name, params):
+    """Key of the named report for the given parameters (a sequence of
+    primitive values) and checkout data version"""
+    return 'report:%d:%s:%s' % (version, name, params_digest(params))
+
+
+def render(name, params, template, build, variant=()):
+    """Returns the rendered 'template' for the named report, from the cache
+    if it's there. 'build' is called (without arguments) for the template's
+    context only when it isn't; it must not depend on the request beyond
+    'params' and 'variant'."""
+    cache = get_cache()
+    version = versions.checkout_data_version() if cache is not None else None
+    if version is None:
+        return mark_safe(render_to_string(template, build()))
+
+    key = make_key(version, name, list(params) + list(variant))
+    html = singleflight.run(cache, key, lambda: render_to_string(template, build()), TIMEOUT)
+    return mark_safe(html)
+
+
+def latest_key(name, params):
+    return 'report-latest:%s:%s' % (name, params_digest(params))
+
+
+def build_latest(cache, version, name, params, template, build):
+    """Renders the report, and keeps it as the latest copy as well"""
+    html = render_to_string(template, build())
+    cache.set(latest_key(name, params), (version, html), LATEST_TIMEOUT)
+    return html
+
+
+def render_latest(name, params, template, build, on_stale):
+    """Like render(), but when the report hasn't been built for the current
+    checkout data version and an older copy of it is cached, returns that
+    copy instead and calls on_stale() (which should have the report rebuilt
+    in the background, e.g. with refresh()). Returns (html, stale)."""
+    cache = get_cache()
+    version = versions.checkout_data_version() if cache is not None else None
+    if version is None:
+        return mark_safe(render_to_string(template, build())), False
+
+    key = make_key(version, name, params)
+    html = cache.get(key)
+    if html is None:
+        latest = cache.get(latest_key(name, params))
+        if latest is not None:
+            logger.debug("Serving report %s from version %d while it's rebuilt", key, latest[0])
+            on_stale()
+            return mark_safe(latest[1]), True
+        html = singleflight.run(
+            cache, key, lambda: build_latest(cache, version, name, params, template, build), TIMEOUT)
+    return mark_safe(html), False
+
+
+def refresh(name, params, template, build):
+    """Builds the report for the current checkout data version unless it's
+    already cached. Returns True if it was built."""
+    cache = get_cache()
+    version = versions.checkout_data_version() if cache is not None else None
+    if version is None:
+        return False
+    key = make_key(version, name, params)
+    if cache.get(key) is not None:
+        return False
+    singleflight.run(cache, key, lambda: build_latest(cache, version, name, params, template, build), TIMEOUT)
+    return True
+
+
+# =============================================================================
+# == Filter reports
+# =============================================================================
+
+FILTER_FIELDS = {
+    'pilot': util.get_pilots(),
+    'airstrip': Airstrip.objects.all(),
+    'base': util.get_bases(),
+    'aircraft_type': AircraftType.objects.all(),
+}
+
+
+def filter_params(filters):
+    """The filter (as from FilterForm.cleaned_data) as primitive values in a
+    fixed order, with model instances given by primary key"""
+    return [(name, getattr(value, 'pk', value)) for name, value in sorted(filters.items())]
+
+
+def filters_from_values(values):
+    """The inverse of filter_params() (given as a dict). Raises DoesNotExist
+    for a pilot, airstrip, base or aircraft type which no longer exists."""
+    filters = {}
+    for name, value in values.items():
+        if name in FILTER_FIELDS and value is not None:
+            value = FILTER_FIELDS[name].get(pk=value)
+        filters[name] = value
+    return filters
+
+
+def build_filter_report(filters):
+    """Context for the display_checkouts template"""
+    if filters['checkout_status'] == util.CHECKOUT_SUDAH:
+        checkouts = util.sudah_selesai(**filters)
+    else:
+        checkouts = util.belum_selesai(**filters)
+    return {'checkouts': checkouts, 'show_summary': True}
+
+
+def render_filter(filters, on_stale=None):
+    """Returns (html, stale) for the filter report. Given 'on_stale', a copy
+    built for an older checkout data version may be returned (see
+    render_latest())."""
+    params = filter_params(filters)
+    build = lambda: build_filter_report(filters)
+    if on_stale is None:
+        return render('filter', params, FILTER_TEMPLATE, build), False
+    return render_latest('filter', params, FILTER_TEMPLATE, build, on_stale)
+
+
+def refresh_filter(values):
+    """Rebuilds the filter report given by filter_params() (as a dict) for
+    the current checkout data version, if it isn't already cached"""
+    filters = filters_from_values(values)
+    return refresh('filter', filter_params(filters), FILTER_TEMPLATE, lambda: build_filter_report(filters))
+
+
+def precomputed_filters():
+    """The filters whose reports precompute() keeps built: Belum Selesai for
+    all airstrips and for each base"""
+    everything = {
+        'pilot': None,
+        'airstrip': None,
+        'base': None,
+        'aircraft_type': None,
+        'checkout_status': util.CHECKOUT_BELUM,
+    }
+    yield everything
+    for base in util.get_bases():
+        yield dict(everything, base=base)
+
+
+def precompute():
+    """Builds the precomputed filter reports which aren't cached for the
+    current checkout data version. Returns the number built."""
+    built = 0
+    for filters in precomputed_filters():
+        params = filter_params(filters)
+        if refresh('filter', params, FILTER_TEMPLATE, lambda: build_filter_report(filters)):
+            built += 1
+    return built
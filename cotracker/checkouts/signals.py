@@ -0,0 +1,210 @@
+"""Signal receivers for the Checkouts app
+
+Keeps derived data (e.g. cached summaries of the checkouts) in step with the
+models it is derived from.
+"""
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import AircraftType, Airstrip, Checkout, invalidate_user_roles
+from . import coverage, summary, versions
+import checkouts.util as util
+
+
+@receiver(post_save, sender=Checkout)
+@receiver(post_delete, sender=Checkout)
+@receiver(post_save, sender=Airstrip)
+@receiver(post_delete, sender=Airstrip)
+@receiver(post_save, sender=AircraftType)
+@receiver(post_delete, sender=AircraftType)
+def checkout_data_changed(sender, **kwargs):
+    """Any change to a checkout, or to the names/idents a checkout is reported
+    under, invalidates the precedent map."""
+    util.invalidate_precedented_checkouts()
+
+
+@receiver(post_save, sender=Airstrip)
+@receiver(post_delete, sender=Airstrip)
+@receiver(m2m_changed, sender=Airstrip.bases.through)
+def base_attachments_changed(sender, **kwargs):
+    """Adding/removing airstrips, or attaching/detaching them from bases,
+    changes the counts on the bases page."""
+    if kwargs.get('action', 'post_').startswith('post_'):
+        util.invalidate_base_counts()
+
+
+# Cached role flags are discarded right away, and again once the change is
+# committed: another worker could re-cache the old memberships in between.
+
+def discard_user_roles(user_ids):
+    user_ids = list(user_ids)
+    invalidate_user_roles(user_ids)
+    transaction.on_commit(lambda: invalidate_user_roles(user_ids))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def roles_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # instance is a User; pk_set holds Group pks
+        if action.startswith('post_'):
+            instance.__dict__.pop('_group_names', None)
+            discard_user_roles([instance.pk])
+    elif action == 'pre_clear':
+        # instance is a Group, and its members are about to be forgotten
+        instance._role_user_ids = list(instance.user_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        discard_user_roles(getattr(instance, '_role_user_ids', []))
+    elif action.startswith('post_'):
+        discard_user_roles(pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def roles_group_changed(sender, instance, **kwargs):
+    """Renaming or deleting a group changes the roles of all its members
+    (and deleting one removes the memberships without an m2m_changed)."""
+    if instance.pk is not None:
+        discard_user_roles(instance.user_set.values_list('pk', flat=True))
+
+
+# The summary table lives in the database, so it's updated inside the same
+# transaction as the change it reflects. It's only maintained while it's in
+# use; after turning settings.CHECKOUT_SUMMARY_TABLE on, rebuild it with
+# 'manage.py checkout_summary'.
+
+@receiver(pre_save, sender=Checkout)
+def summary_checkout_saving(sender, instance, **kwargs):
+    """Remembers which pair an existing checkout belonged to, in case the
+    save moves it to another pilot/airstrip."""
+    if not settings.CHECKOUT_SUMMARY_TABLE:
+        return
+    if not instance._state.adding and instance.pk is not None:
+        instance._summary_pair = Checkout.objects.filter(pk=instance.pk).values_list(
+                                    'pilot_id', 'airstrip_id').first()
+
+
+@receiver(post_save, sender=Checkout)
+def summary_checkout_saved(sender, instance, **kwargs):
+    if not settings.CHECKOUT_SUMMARY_TABLE:
+        return
+    summary.refresh_pair(instance.pilot_id, instance.airstrip_id)
+    previous = getattr(instance, '_summary_pair', None)
+    if previous is not None and previous != (instance.pilot_id, instance.airstrip_id):
+        summary.refresh_pair(*previous)
+
+
+@receiver(post_delete, sender=Checkout)
+def summary_checkout_deleted(sender, instance, **kwargs):
+    if not settings.CHECKOUT_SUMMARY_TABLE:
+        return
+    summary.refresh_pair(instance.pilot_id, instance.airstrip_id)
+
+
+@receiver(post_save, sender=AircraftType)
+def summary_aircrafttype_saved(sender, instance, created, **kwargs):
+    if not settings.CHECKOUT_SUMMARY_TABLE:
+        return
+    # A new aircraft type normally takes the next free bit; only one created
+    # with a lower primary key than an existing type shifts the others.
+    if created and AircraftType.objects.filter(pk__gt=instance.pk).exists():
+        summary.rebuild()
+
+
+@receiver(post_delete, sender=AircraftType)
+def summary_aircrafttype_deleted(sender, **kwargs):
+    if settings.CHECKOUT_SUMMARY_TABLE:
+        summary.rebuild()
+
+
+# The coverage tensor is shared with other processes, so it's only updated
+# once the change has been committed (otherwise another worker could rebuild
+# it from data that is about to be rolled back).
+
+@receiver(post_save, sender=Checkout)
+def coverage_checkout_saved(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: coverage.patch(
+            instance.pilot_id, instance.airstrip_id, instance.aircraft_type_id, True))
+    else:
+        # An existing checkout may have been moved to another pilot/airstrip/
+        # aircraft type, and we don't know where it was before.
+        transaction.on_commit(coverage.invalidate)
+
+
+@receiver(post_delete, sender=Checkout)
+def coverage_checkout_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: coverage.patch(
+        instance.pilot_id, instance.airstrip_id, instance.aircraft_type_id, False))
+
+
+@receiver(post_save, sender=Airstrip)
+@receiver(post_delete, sender=Airstrip)
+@receiver(post_save, sender=AircraftType)
+@receiver(post_delete, sender=AircraftType)
+@receiver(post_delete, sender=User)
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=Airstrip.bases.through)
+def coverage_dimensions_changed(sender, **kwargs):
+    """The pilot/airstrip/aircraft type dimensions (or the airstrip/base
+    attachments) changed, so the coverage tensor must be rebuilt."""
+    if kwargs.get('action', 'post_').startswith('post_'):
+        transaction.on_commit(coverage.invalidate)
+
+
+@receiver(post_save, sender=User)
+def coverage_user_saved(sender, update_fields=None, **kwargs):
+    # Logging in saves the user's last_login, which doesn't affect coverage
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    transaction.on_commit(coverage.invalidate)
+
+
+# The data versions behind the report pages' ETags. Saves of timestamped rows
+# already move their model's latest 'modified'; everything else is counted.
+
+@receiver(post_delete, sender=Checkout)
+@receiver(post_delete, sender=Airstrip)
+@receiver(post_delete, sender=AircraftType)
+@receiver(m2m_changed, sender=Airstrip.bases.through)
+def versions_rows_removed(sender, **kwargs):
+    if kwargs.get('action', 'post_').startswith('post_'):
+        model = Airstrip if sender is Airstrip.bases.through else sender
+        versions.record_change(model)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def versions_users_changed(sender, update_fields=None, **kwargs):
+    # Logging in saves the user's last_login, which isn't shown anywhere
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    if kwargs.get('action', 'post_').startswith('post_'):
+        versions.record_change(User)
+
+
+@receiver(post_save, sender=Checkout)
+@receiver(post_delete, sender=Checkout)
+@receiver(post_save, sender=Airstrip)
+@receiver(post_delete, sender=Airstrip)
+@receiver(post_save, sender=AircraftType)
+@receiver(post_delete, sender=AircraftType)
+@receiver(m2m_changed, sender=Airstrip.bases.through)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def versions_checkout_data_changed(sender, update_fields=None, **kwargs):
+    """Every change to the data shown in the checkout reports (including the
+    pilots' names and who counts as a pilot) makes the cached reports
+    stale."""
+    if sender is User and update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    if kwargs.get('action', 'post_').startswith('post_'):
+        versions.record_checkout_data_change()
@@ -0,0 +1,82 @@
+"""Single-flight computation of cached values
+
+When a cached report goes missing (most often because the checkout data
+version moved on, which retires every report at once) the requests which
+arrive for it before it has been rebuilt would otherwise all rebuild it,
+each in its own worker. run() lets one of them compute the value while the
+others wait for it to appear in the cache.
+
+The caller which adds 'lock:<key>' to the cache computes. The lock expires
+after LOCK_TIMEOUT, so a worker which dies while holding it holds up the
+others for at most that long. The others poll the cache, backing off (with
+jitter) up to MAX_POLL_INTERVAL, and keep trying to take the lock themselves
+in case its holder failed. Only after WAIT_TIMEOUT does a caller give up on
+the others and compute the value itself.
+
+Coalescing across workers needs a cache with an atomic add() which they
+share, e.g. memcached. The local-memory cache only coalesces the threads of
+one process, and the file based cache's add() may let two callers through.
+"""
+import logging
+import random
+import time
+import uuid
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a lock is released even if its holder never finishes
+LOCK_TIMEOUT = 60
+# Seconds a caller waits for another's result before computing it itself
+WAIT_TIMEOUT = 30
+# Seconds between polls of the cache while waiting
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 1.0
+
+
+def lock_key(key):
+    return 'lock:' + key
+
+
+def compute_and_cache(cache, key, compute, timeout):
+    value = compute()
+    cache.set(key, value, timeout)
+    return value
+
+
+def run(cache, key, compute, timeout, lock_timeout=LOCK_TIMEOUT, wait_timeout=WAIT_TIMEOUT):
+    """Returns the value cached under 'key' or, if there isn't one, caches
+    and returns what compute() returns. Of the concurrent callers missing the
+    same key, only one calls compute(). The value must not be None."""
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + wait_timeout
+    interval = POLL_INTERVAL
+    while True:
+        if cache.add(lock_key(key), token, lock_timeout):
+            try:
+                # The previous holder may have finished since we last looked
+                value = cache.get(key)
+                if value is None:
+                    value = compute_and_cache(cache, key, compute, timeout)
+                return value
+            finally:
+                # Not atomic, but the lock is only ours to delete if it
+                # hasn't expired and been taken by another caller
+                if cache.get(lock_key(key)) == token:
+                    cache.delete(lock_key(key))
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(interval * random.uniform(0.5, 1.5), remaining))
+        interval = min(interval * 2, MAX_POLL_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+    logger.warning("Gave up waiting %ds for %s; computing it here", wait_timeout, key)
+    return compute_and_cache(cache, key, compute, timeout)
@@ -0,0 +1,163 @@
+"""Incrementally maintained checkout summary
+
+CheckoutSummary holds one row per pilot/airstrip pair which has any checkouts,
+with a bitmask of the aircraft types the pilot is checked out in. When
+settings.CHECKOUT_SUMMARY_TABLE is enabled util.checkout_filter reads these
+ready-made rows instead of regrouping the raw checkouts.
+
+Each aircraft type's bit is its rank when the aircraft types are ordered by
+primary key. A new aircraft type normally gets the highest primary key, so
+adding one leaves every existing bit where it was; deleting one shifts the
+ranks and the table is rebuilt (see checkouts.signals). The mask is stored in
+a signed 64 bit column, so the summary is only used while there are no more
+than MAX_AIRCRAFT_TYPES aircraft types.
+
+The rows are kept up to date by signals on Checkout and AircraftType. Bulk
+operations bypass those signals, so anything which uses them must call
+refresh_pair(s) or rebuild itself. None of this is done while the setting is
+off, so the table must be rebuilt when it's turned on: 'manage.py
+checkout_summary' rebuilds the table from scratch and, with --check, reports
+any drift.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import AircraftType, Checkout, CheckoutSummary
+import checkouts.util as util
+
+
+logger = logging.getLogger(__name__)
+
+MAX_AIRCRAFT_TYPES = 63
+
+
+def bit_positions():
+    """Maps each aircraft type's primary key to its bit in the mask"""
+    pks = AircraftType.objects.order_by('pk').values_list('pk', flat=True)
+    return {pk: 1 << rank for rank, pk in enumerate(pks)}
+
+
+def available(bits=None):
+    """True if every aircraft type fits in the mask"""
+    if bits is None:
+        bits = bit_positions()
+    return len(bits) <= MAX_AIRCRAFT_TYPES
+
+
+def compute(bits=None, **filters):
+    """Computes the masks from the checkouts themselves, as a dictionary of
+    {(pilot_id, airstrip_id): mask}. Any 'filters' are applied to the
+    checkouts."""
+    if bits is None:
+        bits = bit_positions()
+    masks = {}
+    rows = Checkout.objects.filter(**filters).values_list('pilot_id', 'airstrip_id', 'aircraft_type_id')
+    for pilot_id, airstrip_id, aircraft_type_id in rows.iterator():
+        pair = (pilot_id, airstrip_id)
+        masks[pair] = masks.get(pair, 0) | bits.get(aircraft_type_id, 0)
+    return masks
+
+
+def refresh_pair(pilot_id, airstrip_id):
+    """Brings the row for a single pilot/airstrip pair up to date"""
+    refresh_pairs(pilot_id, [airstrip_id])
+
+
+def refresh_pairs(pilot_id, airstrip_ids):
+    """Brings the rows for one pilot at any number of airstrips up to date,
+    with a fixed number of queries"""
+    bits = bit_positions()
+    if not available(bits):
+        return
+    airstrip_ids = list(airstrip_ids)
+    masks = compute(bits, pilot_id=pilot_id, airstrip_id__in=airstrip_ids)
+    CheckoutSummary.objects.filter(pilot_id=pilot_id, airstrip_id__in=airstrip_ids).delete()
+    CheckoutSummary.objects.bulk_create(
+        [CheckoutSummary(pilot_id=p, airstrip_id=a, sudah=mask) for (p, a), mask in masks.items() if mask],
+        batch_size=1000)
+
+
+@transaction.atomic
+def rebuild():
+    """Replaces the whole table with rows computed from the checkouts. Returns
+    the number of rows written."""
+    bits = bit_positions()
+    CheckoutSummary.objects.all().delete()
+    if not available(bits):
+        logger.warning("%d aircraft types don't fit in the checkout summary; leaving it empty" % len(bits))
+        return 0
+    rows = [CheckoutSummary(pilot_id=pilot_id, airstrip_id=airstrip_id, sudah=mask)
+            for (pilot_id, airstrip_id), mask in compute(bits).items()]
+    CheckoutSummary.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def drift():
+    """Compares the table with the checkouts. Returns a dictionary of
+    {(pilot_id, airstrip_id): (expected mask, stored mask)} for every pair
+    which differs, using 0 for a missing row."""
+    bits = bit_positions()
+    expected = compute(bits) if available(bits) else {}
+    stored = dict(((pilot_id, airstrip_id), mask) for pilot_id, airstrip_id, mask
+                  in CheckoutSummary.objects.values_list('pilot_id', 'airstrip_id', 'sudah').iterator())
+    differences = {}
+    for pair in set(expected) | set(stored):
+        if expected.get(pair, 0) != stored.get(pair, 0):
+            differences[pair] = (expected.get(pair, 0), stored.get(pair, 0))
+    return differences
+
+
+def checkout_filter(pilot=None, airstrip=None, base=None, aircraft_type=None, actypes=None, **kwargs):
+    """Equivalent of util.checkout_filter, read from the summary table.
+    Returns None if the aircraft types don't fit in the mask."""
+    types = list(AircraftType.objects.order_by('pk').values_list('pk', 'name'))
+    if len(types) > MAX_AIRCRAFT_TYPES:
+        return None
+    bits = dict((name, 1 << rank) for rank, (_, name) in enumerate(types))
+
+    core_query = CheckoutSummary.objects.all()
+    if pilot != None:
+        core_query = core_query.filter(pilot=pilot)
+    if airstrip != None:
+        core_query = core_query.filter(airstrip=airstrip)
+    if base != None:
+        core_query = core_query.filter(airstrip__bases=base)
+    if aircraft_type:
+        core_query = core_query.annotate(
+                        selected=F('sudah').bitand(bits[aircraft_type.name])
+                    ).exclude(selected=0)
+    if actypes is None:
+        if aircraft_type:
+            actypes = [aircraft_type.name,]
+        else:
+            actypes = util.get_aircrafttype_names()
+    columns = [(position, bits[name]) for position, name in enumerate(actypes)]
+
+    rows = core_query.order_by(
+                'pilot__last_name',
+                'pilot__first_name',
+                'airstrip__ident'
+            ).values_list(
+                'pilot__username',
+                'pilot__first_name',
+                'pilot__last_name',
+                'airstrip__ident',
+                'airstrip__name',
+                'sudah'
+            )
+    results = []
+    for username, first_name, last_name, ident, airstrip_name, mask in rows.iterator():
+        r = util.checkout_record(
+                util.format_full_name(username, first_name, last_name),
+                username,
+                ident,
+                airstrip_name,
+                actypes,
+                util.CHECKOUT_BELUM)
+        for position, bit in columns:
+            if mask & bit:
+                r.cells[position] = util.CHECKOUT_SUDAH
+        results.append(r)
+    return results
@@ -6,6 +6,15 @@ from django.contrib.auth.models import Group, User
 
 from checkouts.models import AircraftType, Airstrip, Checkout
 
+# The test settings use a dummy cache; tests which need a working cache can
+# use override_settings(CACHES=helper.LOCMEM_CACHES, SHARED_CACHE=True)
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'checkouts-tests',
+    },
+}
+
 def create_aircrafttype(name='FooBar1234', object_only=True):
     """Returns a new AircraftType with the given name.
     
@@ -75,3 +84,12 @@ def create_checkout(**kwargs):
     
     return Checkout.objects.create(**kwargs)
     
+
+
+def as_dicts(checkouts):
+    """Converts the CheckoutRecords in a list of them, or in the 'results' of
+    a report, to dictionaries (see CheckoutRecord.as_dict) so they can be
+    compared with expected values written out by hand."""
+    if isinstance(checkouts, dict):
+        return dict(checkouts, results=as_dicts(checkouts['results']))
+    return [r.as_dict() for r in checkouts]
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+
+from checkouts import coverage, util
+
+import checkouts.tests.helper as helper
+
+
+class CoverageTensorTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'coverage.bin')
+        self.settings_override = override_settings(CHECKOUT_COVERAGE_FILE=self.path)
+
+        self.pilot1 = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        self.pilot2 = helper.create_pilot('sam', 'Sam', 'Pilot2')
+        self.actype1 = helper.create_aircrafttype('Name1')
+        self.actype2 = helper.create_aircrafttype('Name2')
+        self.base = helper.create_airstrip('BASE', 'Base1', is_base=True)
+        self.airstrip1 = helper.create_airstrip('ID1', 'Airstrip1')
+        self.airstrip2 = helper.create_airstrip('ID2', 'Airstrip2')
+        self.airstrip3 = helper.create_airstrip('ID3', 'Airstrip3')
+        self.airstrip1.bases.add(self.base)
+        self.airstrip3.bases.add(self.base)
+
+        helper.create_checkout(pilot=self.pilot1, airstrip=self.airstrip1, aircraft_type=self.actype1)
+        helper.create_checkout(pilot=self.pilot1, airstrip=self.airstrip1, aircraft_type=self.actype2)
+        helper.create_checkout(pilot=self.pilot2, airstrip=self.airstrip2, aircraft_type=self.actype1)
+
+    def tearDown(self):
+        if coverage._tensor is not None:
+            coverage._tensor.close()
+            coverage._tensor = None
+        shutil.rmtree(self.directory)
+
+    def filters(self):
+        return [
+            {},
+            {'pilot': self.pilot1},
+            {'pilot': self.pilot2},
+            {'airstrip': self.airstrip1},
+            {'airstrip': self.airstrip3},
+            {'base': self.base},
+            {'aircraft_type': self.actype1},
+            {'aircraft_type': self.actype2, 'base': self.base},
+        ]
+
+    def test_matches_database(self):
+        expected = []
+        for kwargs in self.filters():
+            expected.append((util.sudah_selesai(**kwargs), util.belum_selesai(**kwargs)))
+        precedented = util.get_precedented_checkouts()
+
+        with self.settings_override:
+            for kwargs, (sudah, belum) in zip(self.filters(), expected):
+                self.assertEqual(util.sudah_selesai(**kwargs), sudah)
+                self.assertEqual(util.belum_selesai(**kwargs), belum)
+            self.assertEqual(util.get_precedented_checkouts(), precedented)
+
+    def test_no_queries_once_built(self):
+        with self.settings_override:
+            coverage.load()
+            with self.assertNumQueries(0):
+                util.sudah_selesai()
+                util.belum_selesai(base=self.base)
+                util.get_precedented_checkouts()
+
+    def test_patched_on_checkout_changes(self):
+        with self.settings_override:
+            tensor = coverage.load()
+            generation = tensor.generation
+
+            with self.captureOnCommitCallbacks(execute=True):
+                c = helper.create_checkout(pilot=self.pilot2, airstrip=self.airstrip3, aircraft_type=self.actype2)
+            self.assertIs(coverage.load(), tensor)
+            self.assertGreater(tensor.generation, generation)
+            self.assertEqual(util.get_precedented_checkouts()['ID3'], {'Name2': True})
+            self.assertEqual(len(util.sudah_selesai(pilot=self.pilot2)['results']), 2)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                c.delete()
+            self.assertNotIn('ID3', util.get_precedented_checkouts())
+            self.assertEqual(len(util.sudah_selesai(pilot=self.pilot2)['results']), 1)
+
+    def test_patched_by_bulk_changes(self):
+        with self.settings_override:
+            tensor = coverage.load()
+            with self.captureOnCommitCallbacks(execute=True):
+                util.apply_checkout_changes(
+                    self.pilot2,
+                    add=[(self.airstrip3.pk, self.actype1.pk), (self.airstrip3.pk, self.actype2.pk)],
+                    remove=[(self.airstrip2.pk, self.actype1.pk)])
+            self.assertIs(coverage.load(), tensor)
+            self.assertEqual(util.get_precedented_checkouts()['ID3'], {'Name1': True, 'Name2': True})
+            self.assertNotIn('ID2', util.get_precedented_checkouts())
+            self.assertEqual(util.sudah_selesai(pilot=self.pilot2)['results'], util.checkout_filter(pilot=self.pilot2))
+
+    def test_rebuilt_on_dimension_changes(self):
+        with self.settings_override:
+            tensor = coverage.load()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                airstrip = helper.create_airstrip('ID4', 'Airstrip4')
+            self.assertFalse(os.path.exists(self.path))
+
+            with self.captureOnCommitCallbacks(execute=True):
+                helper.create_checkout(pilot=self.pilot1, airstrip=airstrip, aircraft_type=self.actype1)
+            self.assertIsNot(coverage.load(), tensor)
+            self.assertEqual(util.get_precedented_checkouts()['ID4'], {'Name1': True})
+
+    def test_rebuilds_corrupt_file(self):
+        with self.settings_override:
+            with open(self.path, 'wb') as f:
+                f.write(b'garbage')
+            self.assertEqual(len(util.sudah_selesai()['results']), 2)
+
+    def test_disabled(self):
+        self.assertIsNone(coverage.load())
+        coverage.invalidate()
+        coverage.patch(self.pilot1.pk, self.airstrip1.pk, self.actype1.pk, True)
+        self.assertFalse(os.path.exists(self.path))
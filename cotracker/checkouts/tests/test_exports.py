@@ -0,0 +1,127 @@
+import gzip
+import json
+import os
+import tempfile
+from unittest import mock
+from xml.etree import ElementTree
+
+from django.test import SimpleTestCase
+
+from checkouts import exports
+
+
+class ExportsTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.path = os.path.join(self.root, 'prefix_pilotweights.json')
+
+    def test_publish_writes_compressed_copies(self):
+        metadata = exports.publish(self.path, '{"pilots": []}')
+        with open(self.path + '.gz', 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), b'{"pilots": []}')
+        self.assertEqual(metadata['bytes'], 14)
+        self.assertEqual(metadata['encodings']['gz'], os.path.getsize(self.path + '.gz'))
+        self.assertNotIn('hashed', metadata)
+        # Every encoding has the same Last-Modified
+        self.assertEqual(os.stat(self.path).st_mtime_ns, os.stat(self.path + '.gz').st_mtime_ns)
+
+    def test_compression_is_repeatable(self):
+        exports.publish(self.path, 'abc')
+        with open(self.path + '.gz', 'rb') as f:
+            first = f.read()
+        exports.publish(self.path, ['a', 'bc'])
+        with open(self.path + '.gz', 'rb') as f:
+            self.assertEqual(f.read(), first)
+
+    def test_hashed_copy(self):
+        metadata = exports.publish(self.path, 'content', hashed=True)
+        hashed = os.path.join(self.root, metadata['hashed'])
+        self.assertEqual(hashed, exports.hashed_path(self.path, metadata['sha256']))
+        self.assertTrue(metadata['hashed'].startswith('prefix_pilotweights.%s' % metadata['sha256'][:12]))
+        self.assertEqual(exports.read(hashed), 'content')
+        self.assertEqual(metadata['sha256'], exports.digest(['con', 'tent']))
+        self.assertTrue(exports.is_published(self.path, metadata['sha256'], hashed=True))
+        self.assertFalse(exports.is_published(self.path, exports.digest(['other']), hashed=True))
+
+        os.unlink(hashed + '.gz')
+        self.assertFalse(exports.is_published(self.path, metadata['sha256'], hashed=True))
+
+    def test_remove_superseded(self):
+        old = exports.publish(self.path, 'old', hashed=True)
+        exports.publish(os.path.join(self.root, 'prefix_pilotweights.xml'), 'xml', hashed=True)
+        new = exports.publish(self.path, 'new', hashed=True, previous=old)
+        self.assertTrue(os.path.exists(os.path.join(self.root, old['hashed'])))
+
+        self.assertEqual(exports.remove_superseded(self.path, [new['hashed']]), 2)
+        names = sorted(os.listdir(self.root))
+        self.assertNotIn(old['hashed'], names)
+        self.assertIn(new['hashed'], names)
+        # The other export's copies are left alone
+        self.assertEqual(len([name for name in names if name.endswith('.xml')]), 2)
+
+    def test_failed_write_leaves_old_file(self):
+        exports.write_atomically(self.path, 'before')
+        with mock.patch('os.fsync', side_effect=OSError("Disk full")):
+            with self.assertRaises(OSError):
+                exports.write_atomically(self.path, 'partial')
+        self.assertEqual(exports.read(self.path), 'before')
+        self.assertEqual(os.listdir(self.root), ['prefix_pilotweights.json'])
+
+    def test_read_metadata(self):
+        metapath = os.path.join(self.root, 'meta.json')
+        self.assertEqual(exports.read_metadata(metapath), {})
+        files = {'json': exports.publish(self.path, 'content')}
+        exports.write_metadata(metapath, '1', 'now', files)
+        self.assertEqual(exports.read_metadata(metapath), {'version': '1', 'updated': 'now', 'files': files})
+
+
+class WritersTests(SimpleTestCase):
+
+    header = {'version': '1', 'updated': '2020-01-02T03:04:05'}
+    records = [
+        {'lastname': 'Pilot & Sons', 'firstname': '<Kim>', 'weight': 70},
+        {'lastname': 'Pilot2', 'firstname': 'Sam', 'weight': 80},
+    ]
+
+    def test_json_matches_json_dumps(self):
+        document = dict(self.header, pilots=self.records)
+        for records in [self.records, []]:
+            document['pilots'] = records
+            text = ''.join(exports.json_chunks(self.header, 'pilots', iter(records)))
+            self.assertEqual(text, json.dumps(document, indent=4, sort_keys=True))
+
+    def test_json_compact(self):
+        text = ''.join(exports.json_chunks(self.header, 'pilots', self.records, indent=None))
+        self.assertNotIn('\n', text)
+        self.assertNotIn(' ', text.replace('Pilot & Sons', ''))
+        self.assertEqual(json.loads(text), dict(self.header, pilots=self.records))
+
+    def test_json_reads_records_lazily(self):
+        def records():
+            yield self.records[0]
+            raise RuntimeError("Not yet")
+        chunks = exports.json_chunks(self.header, 'pilots', records())
+        text = ''
+        with self.assertRaises(RuntimeError):
+            for chunk in chunks:
+                text += chunk
+        self.assertIn('<Kim>', text)
+
+    def test_xml_escaped(self):
+        text = ''.join(exports.xml_chunks('pilotweights', self.header, 'pilot', self.records))
+        root = ElementTree.fromstring(text)
+        self.assertEqual(root.find('updated').text, '2020-01-02T03:04:05')
+        pilots = root.findall('pilot')
+        self.assertEqual(pilots[0].find('lastname').text, 'Pilot & Sons')
+        self.assertEqual(pilots[0].find('firstname').text, '<Kim>')
+        self.assertEqual(pilots[1].find('weight').text, '80')
+        self.assertTrue(text.startswith('<pilotweights>\n  <version>1</version>\n'))
+
+    def test_xml_compact(self):
+        text = ''.join(exports.xml_chunks('feed', {'more': False, 'cursor': None}, 'pilot', self.records[1:], indent=None))
+        self.assertEqual(text, '<feed><more>false</more><cursor></cursor><pilot>'
+                               '<lastname>Pilot2</lastname><firstname>Sam</firstname><weight>80</weight>'
+                               '</pilot></feed>')
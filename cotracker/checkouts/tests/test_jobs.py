@@ -0,0 +1,175 @@
+import datetime
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from checkouts import jobs
+from checkouts.models import Job, PilotWeight
+
+import checkouts.tests.helper as helper
+
+
+class JobsTests(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.failures = 0
+        def record(**kwargs):
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("Temporary failure")
+            self.calls.append(kwargs)
+        patcher = mock.patch.dict(jobs.HANDLERS, {'record': record})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(BACKGROUND_JOBS=True)
+    def test_run_pending(self):
+        jobs.enqueue('record', n=1)
+        jobs.enqueue('record', n=2)
+        self.assertEqual(self.calls, [])
+
+        self.assertEqual(jobs.run_pending(), 2)
+        self.assertEqual(self.calls, [{'n': 1}, {'n': 2}])
+        self.assertEqual(Job.objects.filter(status=Job.DONE, attempts=1).count(), 2)
+        self.assertEqual(jobs.run_pending(), 0)
+
+    @override_settings(BACKGROUND_JOBS=True)
+    def test_retry_with_backoff(self):
+        self.failures = 2
+        job = jobs.enqueue('record', max_attempts=3)
+
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('Temporary failure', job.last_error)
+        self.assertAlmostEqual(job.run_after - job.started, jobs.RETRY_DELAY, delta=datetime.timedelta(seconds=1))
+        # Not due again yet
+        self.assertEqual(jobs.run_pending(), 0)
+
+        Job.objects.update(run_after=timezone.now())
+        jobs.run_pending()
+        job.refresh_from_db()
+        self.assertAlmostEqual(job.run_after - job.started, 2 * jobs.RETRY_DELAY, delta=datetime.timedelta(seconds=1))
+
+        Job.objects.update(run_after=timezone.now())
+        jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.attempts, 3)
+        self.assertEqual(len(self.calls), 1)
+
+    @override_settings(BACKGROUND_JOBS=True)
+    def test_fails_after_max_attempts(self):
+        self.failures = 5
+        job = jobs.enqueue('record', max_attempts=2)
+        jobs.run_pending()
+        Job.objects.update(run_after=timezone.now())
+        jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIsNotNone(job.finished)
+        self.assertEqual(jobs.status_counts(), {
+            Job.QUEUED: 0, Job.RUNNING: 0, Job.DONE: 0, Job.FAILED: 1,
+        })
+
+    def test_retry_delay_capped(self):
+        self.assertEqual(jobs.retry_delay(1), jobs.RETRY_DELAY)
+        self.assertEqual(jobs.retry_delay(3), 4 * jobs.RETRY_DELAY)
+        self.assertEqual(jobs.retry_delay(30), jobs.MAX_RETRY_DELAY)
+
+    def test_unknown_job(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue('missing')
+
+    @override_settings(BACKGROUND_JOBS=True)
+    def test_enqueue_once_coalesces(self):
+        first = jobs.enqueue_once('record', delay=30, n=1)
+        self.assertGreater(first.run_after, timezone.now() + datetime.timedelta(seconds=25))
+        self.assertEqual(jobs.enqueue_once('record', delay=30, n=1).pk, first.pk)
+        other = jobs.enqueue_once('record', delay=30, n=2)
+        self.assertNotEqual(other.pk, first.pk)
+        # Not due until the window has passed
+        self.assertEqual(jobs.run_pending(), 0)
+
+        Job.objects.update(run_after=timezone.now())
+        self.assertEqual(jobs.run_pending(), 2)
+        # Once the job has run, the next request starts a new window
+        self.assertNotEqual(jobs.enqueue_once('record', delay=30, n=1).pk, first.pk)
+
+    @override_settings(BACKGROUND_JOBS=False)
+    def test_enqueue_once_inline(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.enqueue_once('record', delay=30, n=1)
+        self.assertEqual(self.calls, [{'n': 1}])
+
+    @override_settings(BACKGROUND_JOBS=False)
+    def test_inline_runs_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            job = jobs.enqueue('record', n=1)
+            self.assertEqual(self.calls, [])
+        self.assertEqual(self.calls, [{'n': 1}])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+
+    @override_settings(BACKGROUND_JOBS=False)
+    def test_inline_purges_finished(self):
+        old = Job.objects.create(name='record', status=Job.DONE,
+                                 finished=timezone.now() - jobs.KEEP_DONE - datetime.timedelta(days=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            job = jobs.enqueue('record', n=1)
+        self.assertFalse(Job.objects.filter(pk=old.pk).exists())
+        self.assertTrue(Job.objects.filter(pk=job.pk).exists())
+
+    @override_settings(BACKGROUND_JOBS=True)
+    def test_claimed_once(self):
+        job = jobs.enqueue('record')
+        self.assertEqual(jobs.claim().pk, job.pk)
+        self.assertIsNone(jobs.claim())
+        jobs.run_job(job.pk)
+        self.assertEqual(self.calls, [])
+
+    @override_settings(BACKGROUND_JOBS=True)
+    def test_requeue_stale(self):
+        job = jobs.enqueue('record')
+        jobs.claim()
+        self.assertEqual(jobs.requeue_stale(), 0)
+
+        Job.objects.update(started=timezone.now() - jobs.STALE_AFTER - datetime.timedelta(seconds=1))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.attempts, 2)
+
+    @override_settings(BACKGROUND_JOBS=True)
+    def test_purge_finished(self):
+        jobs.enqueue('record')
+        jobs.enqueue('record')
+        jobs.run_pending()
+        old = Job.objects.order_by('pk').first()
+        Job.objects.filter(pk=old.pk).update(finished=timezone.now() - jobs.KEEP_DONE - datetime.timedelta(days=1))
+        self.assertEqual(jobs.purge_finished(), 1)
+        self.assertFalse(Job.objects.filter(pk=old.pk).exists())
+
+    @override_settings(BACKGROUND_JOBS=True)
+    def test_command_once(self):
+        jobs.enqueue('record', n=1)
+        out = StringIO()
+        call_command('run_jobs', '--once', stdout=out)
+        self.assertIn('Ran 1 jobs', out.getvalue())
+        self.assertEqual(self.calls, [{'n': 1}])
+
+
+class HandlerTests(TestCase):
+
+    def test_notify_uses_enqueued_weight(self):
+        pilot = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        pilotweight = PilotWeight.objects.create(pilot=pilot, weight=90)
+        with mock.patch('checkouts.util.notify_pilotweight_update') as notify:
+            jobs.HANDLERS['notify_pilotweight_update'](pilotweight_id=pilotweight.pk, weight=80)
+        self.assertEqual(notify.call_args[0][0].weight, 80)
+        self.assertEqual(notify.call_args[0][0].pilot, pilot)
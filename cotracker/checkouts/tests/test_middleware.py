@@ -0,0 +1,63 @@
+from django.contrib.auth.models import AnonymousUser, User
+from django.http import HttpResponse
+from django.test import TestCase, RequestFactory
+
+from checkouts.middleware import Analytics, sql_fingerprint
+
+import checkouts.tests.helper as helper
+
+
+class SqlFingerprintTests(TestCase):
+
+    def test_literals_ignored(self):
+        a = sql_fingerprint('SELECT "a"."id" FROM "a" WHERE "a"."id" IN (%s, %s) LIMIT 21')
+        b = sql_fingerprint('SELECT  "a"."id" FROM "a"\nWHERE "a"."id" IN (%s) LIMIT 1')
+        self.assertEqual(a, b)
+        self.assertTrue(a.startswith('SELECT:a#'))
+
+    def test_tables(self):
+        fingerprint = sql_fingerprint('SELECT * FROM "auth_user" INNER JOIN "checkouts_checkout" ON (1 = 1)')
+        self.assertTrue(fingerprint.startswith('SELECT:auth_user+checkouts_checkout#'))
+        self.assertNotIn(' ', fingerprint)
+        self.assertNotIn('=', fingerprint)
+
+    def test_different_statements(self):
+        a = sql_fingerprint('SELECT "a"."id" FROM "a"')
+        b = sql_fingerprint('SELECT "a"."name" FROM "a"')
+        self.assertNotEqual(a, b)
+
+
+class AnalyticsTests(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def log_line(self, view, user):
+        request = self.factory.get('/pilots/', HTTP_USER_AGENT='Test Agent')
+        request.user = user
+        with self.assertLogs('analytics', 'INFO') as logs:
+            Analytics(view)(request)
+        self.assertEqual(len(logs.records), 1)
+        return logs.records[0].getMessage()
+
+    def test_database_fields(self):
+        helper.create_pilot('kim', 'Kim', 'Pilot1')
+        helper.create_pilot('sam', 'Sam', 'Pilot2')
+
+        def view(request):
+            for user in User.objects.all():
+                list(user.groups.all())
+            return HttpResponse('ok')
+
+        line = self.log_line(view, AnonymousUser())
+        self.assertIn('client=anonymous@127.0.0.1 method=GET path=/pilots/ ', line)
+        self.assertIn(' queries=3 ', line)
+        self.assertRegex(line, r' sql=\d+ms ')
+        self.assertRegex(line, r' slowest=SELECT:auth_[\w+]+#[0-9a-f]{8} ')
+        self.assertTrue(line.endswith('useragent="Test Agent"'))
+
+    def test_no_queries(self):
+        user = User.objects.create_user(username='user', password='pass')
+        line = self.log_line(lambda request: HttpResponse('ok'), user)
+        self.assertIn('client=user@127.0.0.1 ', line)
+        self.assertIn(' queries=0 sql=0ms slowest=- ', line)
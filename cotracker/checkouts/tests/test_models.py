@@ -1,11 +1,14 @@
-from django.contrib.auth.models import User
-from django.test import TestCase
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 
 from checkouts.models import (
     Checkout,
+    format_full_name,
     user_full_name,
     user_is_pilot,
     user_is_flight_scheduler,
+    user_group_names,
 )
 
 import checkouts.tests.helper as helper
@@ -118,6 +121,11 @@ class ModelFunctionTests(TestCase):
         user.first_name = ''
         self.assertEqual(user_full_name(user), expected)
     
+    def test_format_full_name(self):
+        self.assertEqual(format_full_name('kim', 'Kim', 'Pilot'), 'Pilot, Kim')
+        self.assertEqual(format_full_name('kim', '', 'Pilot'), 'kim')
+        self.assertEqual(format_full_name('kim', 'Kim', ''), 'kim')
+    
     def test_user_is_pilot(self):
         pilot_user = helper.create_pilot('pilot','Pilot','User')
         self.assertTrue(user_is_pilot(pilot_user))
@@ -162,3 +170,58 @@ class VerifyPatchedUserModelTests(TestCase):
     def test_unicode(self):
         expected = '%s, %s' % (self.pilot.last_name, self.pilot.first_name)
         self.assertEqual(str(self.pilot), expected)
+
+
+class UserRolesTests(TestCase):
+    
+    def setUp(self):
+        self.pilot = helper.create_pilot()
+        self.pilots = Group.objects.get(name='Pilots')
+    
+    def test_single_query_per_user(self):
+        user = User.objects.get(pk=self.pilot.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(user.is_pilot)
+            self.assertFalse(user.is_flight_scheduler)
+            self.assertTrue(user.is_pilot)
+        self.assertEqual(user_group_names(user), frozenset(['Pilots']))
+    
+    def test_membership_changes_seen_by_same_instance(self):
+        self.assertTrue(self.pilot.is_pilot)
+        self.pilot.groups.remove(self.pilots)
+        self.assertFalse(self.pilot.is_pilot)
+    
+    @override_settings(CACHE_USER_ROLES=True, CACHES=helper.LOCMEM_CACHES)
+    def test_cached_across_requests(self):
+        cache.clear()
+        self.assertTrue(User.objects.get(pk=self.pilot.pk).is_pilot)
+        user = User.objects.get(pk=self.pilot.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(user.is_pilot)
+            self.assertFalse(user.is_flight_scheduler)
+    
+    @override_settings(CACHE_USER_ROLES=True, CACHES=helper.LOCMEM_CACHES)
+    def test_cache_invalidated_by_membership_changes(self):
+        cache.clear()
+        scheduler = helper.create_flight_scheduler()
+        schedulers = Group.objects.get(name='Flight Schedulers')
+        
+        def roles(user):
+            user = User.objects.get(pk=user.pk)
+            return (user.is_pilot, user.is_flight_scheduler)
+        
+        self.assertEqual(roles(self.pilot), (True, False))
+        schedulers.user_set.add(self.pilot)
+        self.assertEqual(roles(self.pilot), (True, True))
+        self.pilot.groups.remove(self.pilots)
+        self.assertEqual(roles(self.pilot), (False, True))
+        
+        self.assertEqual(roles(scheduler), (False, True))
+        schedulers.user_set.clear()
+        self.assertEqual(roles(scheduler), (False, False))
+        self.assertEqual(roles(self.pilot), (False, False))
+        
+        self.pilots.user_set.add(scheduler)
+        self.assertEqual(roles(scheduler), (True, False))
+        self.pilots.delete()
+        self.assertEqual(roles(scheduler), (False, False))
@@ -0,0 +1,201 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, RequestFactory, override_settings
+
+from checkouts import jobs, reports, util
+from checkouts.models import Job
+from checkouts.views import BaseList, FilterFormView
+
+import checkouts.tests.helper as helper
+
+
+REPORT_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+    'reports': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'checkouts-tests-reports',
+    },
+}
+
+
+@override_settings(CACHES=REPORT_CACHES, REPORT_CACHE='reports')
+class ReportCacheTests(TestCase):
+
+    def setUp(self):
+        caches['reports'].clear()
+        self.pilot = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        self.actype = helper.create_aircrafttype('Name1')
+        self.base = helper.create_airstrip('BASE', 'Base1', is_base=True)
+        self.airstrip = helper.create_airstrip('ID1', 'Airstrip1')
+        self.builds = 0
+
+    def render(self, params=(), variant=()):
+        def build():
+            self.builds += 1
+            return {'base_list': util.get_base_counts(), 'editable': True}
+        return reports.render('bases', params, 'checkouts/base_report.html', build, variant=variant)
+
+    def test_cached_until_data_changes(self):
+        first = self.render()
+        self.assertEqual(self.render(), first)
+        self.assertEqual(self.builds, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.airstrip.bases.add(self.base)
+        changed = self.render()
+        self.assertEqual(self.builds, 2)
+        self.assertNotEqual(changed, first)
+
+        for change in [
+            lambda: helper.create_checkout(pilot=self.pilot, airstrip=self.airstrip, aircraft_type=self.actype),
+            lambda: self.actype.save(),
+            lambda: self.pilot.save(),
+            lambda: util.apply_checkout_changes(self.pilot, remove={(self.airstrip.pk, self.actype.pk)}),
+        ]:
+            builds = self.builds
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.render()
+            self.assertEqual(self.builds, builds + 1)
+
+    def test_login_keeps_reports(self):
+        self.render()
+        self.pilot.save(update_fields=['last_login'])
+        self.render()
+        self.assertEqual(self.builds, 1)
+
+    def test_params_and_variant(self):
+        self.render()
+        self.render(params=[1])
+        self.render(variant=[False])
+        self.assertEqual(self.builds, 3)
+
+    @override_settings(REPORT_CACHE=None)
+    def test_disabled(self):
+        self.render()
+        self.render()
+        self.assertEqual(self.builds, 2)
+
+
+@override_settings(CACHES=REPORT_CACHES, REPORT_CACHE='reports')
+class ReportViewTests(TestCase):
+
+    def setUp(self):
+        caches['reports'].clear()
+        self.factory = RequestFactory()
+        self.pilot = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        self.scheduler = helper.create_flight_scheduler('sam', 'Sam', 'Scheduler')
+        self.base = helper.create_airstrip('BASE', 'Base1', is_base=True)
+        helper.create_checkout(pilot=self.pilot, airstrip=self.base)
+
+    def test_filter_results(self):
+        def get():
+            request = self.factory.get('/checkouts/', {'checkout_status': util.CHECKOUT_SUDAH})
+            request.user = self.pilot
+            return FilterFormView.as_view()(request)
+
+        first = get().context_data['report']
+        self.assertIn('Found 1 matching record', first)
+        with mock.patch('checkouts.util.sudah_selesai') as sudah_selesai:
+            self.assertEqual(get().context_data['report'], first)
+        sudah_selesai.assert_not_called()
+
+    def test_base_edit_links_per_role(self):
+        def get(user):
+            request = self.factory.get('/bases/')
+            request.user = user
+            return BaseList.as_view()(request).context_data['report']
+
+        self.assertNotIn('Edit', get(self.pilot))
+        self.assertIn('Edit', get(self.scheduler))
+        self.assertNotIn('Edit', get(self.pilot))
+
+
+@override_settings(CACHES=REPORT_CACHES, REPORT_CACHE='reports')
+class StaleWhileRevalidateTests(TestCase):
+
+    def setUp(self):
+        caches['reports'].clear()
+        self.factory = RequestFactory()
+        self.pilot = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        self.actype = helper.create_aircrafttype('Name1')
+        self.base = helper.create_airstrip('BASE', 'Base1', is_base=True)
+        self.airstrip = helper.create_airstrip('ID1', 'Airstrip1')
+        self.airstrip.bases.add(self.base)
+
+    def get(self, query='?checkout_status=belum'):
+        request = self.factory.get('/checkouts/' + query)
+        request.user = self.pilot
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        return FilterFormView.as_view()(request)
+
+    def test_precompute(self):
+        self.assertEqual(reports.precompute(), 2)
+        self.assertEqual(reports.precompute(), 0)
+        with mock.patch('checkouts.util.belum_selesai') as belum_selesai:
+            self.get()
+            self.get('?base=BASE&checkout_status=belum')
+        belum_selesai.assert_not_called()
+
+    def test_command(self):
+        out = StringIO()
+        call_command('precompute_reports', stdout=out)
+        self.assertIn('Built 2 reports', out.getvalue())
+
+    @override_settings(REPORT_CACHE=None)
+    def test_command_without_cache(self):
+        out = StringIO()
+        call_command('precompute_reports', stdout=out)
+        self.assertIn("isn't configured", out.getvalue())
+
+    def change(self):
+        """Checks kim out in one of the aircraft types at ID1, which changes
+        the Belum Selesai report. Returns the report from before."""
+        other = helper.create_pilot('sam', 'Sam', 'Pilot2')
+        actype2 = helper.create_aircrafttype('Name2')
+        helper.create_checkout(pilot=other, airstrip=self.airstrip, aircraft_type=self.actype)
+        helper.create_checkout(pilot=other, airstrip=self.airstrip, aircraft_type=actype2)
+        reports.precompute()
+        before = self.get().context_data['report']
+        self.assertEqual(before.count('class="belum"'), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            helper.create_checkout(pilot=self.pilot, airstrip=self.airstrip, aircraft_type=self.actype)
+        return before
+
+    @override_settings(BACKGROUND_JOBS=True, CONDITIONAL_REPORTS=True)
+    def test_serves_stale_copy_while_rebuilding(self):
+        before = self.change()
+
+        response = self.get()
+        self.assertTrue(response.context_data['refreshing'])
+        self.assertEqual(response.context_data['report'], before)
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertFalse(response.has_header('ETag'))
+        # Requests made before the rebuild share one job
+        self.get()
+        self.assertEqual(Job.objects.filter(name='refresh_filter_report', status=Job.QUEUED).count(), 1)
+
+        self.assertEqual(jobs.run_pending(), 1)
+        response = self.get()
+        self.assertFalse(response.context_data['refreshing'])
+        self.assertEqual(response.context_data['report'].count('class="belum"'), 1)
+
+    @override_settings(BACKGROUND_JOBS=False)
+    def test_without_worker_builds_in_request(self):
+        self.change()
+        response = self.get()
+        self.assertFalse(response.context_data['refreshing'])
+        self.assertEqual(response.context_data['report'].count('class="belum"'), 1)
+
+    def test_refresh_deleted_base(self):
+        values = dict(reports.filter_params({'pilot': None, 'airstrip': None, 'base': self.base,
+                                             'aircraft_type': None, 'checkout_status': util.CHECKOUT_BELUM}))
+        self.base.delete()
+        jobs.HANDLERS['refresh_filter_report'](filters=values)
@@ -22,5 +22,12 @@ class SettingsTests(unittest.TestCase):
     def test_get_env_var_failure(self):
         self.assertRaises(ImproperlyConfigured, base.get_env_var, self.failure_key)
     
+    def test_env_flag(self):
+        for value, expected in [('1', True), ('true', True), ('Yes', True), (' TRUE ', True),
+                                ('0', False), ('false', False), ('no', False), ('', False)]:
+            os.environ[self.success_key] = value
+            self.assertEqual(base.env_flag(self.success_key), expected, value)
+        self.assertFalse(base.env_flag(self.failure_key))
+    
     def tearDown(self):
         os.environ.pop(self.success_key)
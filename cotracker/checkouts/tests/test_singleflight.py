@@ -0,0 +1,67 @@
+import threading
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase
+
+from checkouts import singleflight
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = LocMemCache('checkouts-tests-singleflight', {})
+        self.cache.clear()
+        self.calls = 0
+
+    def compute(self, delay=0.0, fail=False):
+        def compute():
+            self.calls += 1
+            time.sleep(delay)
+            if fail:
+                raise RuntimeError("Failed")
+            return 'report'
+        return compute
+
+    def test_cached(self):
+        self.assertEqual(singleflight.run(self.cache, 'k', self.compute(), 60), 'report')
+        self.assertEqual(singleflight.run(self.cache, 'k', self.compute(), 60), 'report')
+        self.assertEqual(self.calls, 1)
+        self.assertIsNone(self.cache.get(singleflight.lock_key('k')))
+
+    def test_concurrent_callers_share_one_computation(self):
+        results = []
+        compute = self.compute(delay=0.3)
+        threads = [
+            threading.Thread(target=lambda: results.append(singleflight.run(self.cache, 'k', compute, 60)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['report'] * 8)
+        self.assertEqual(self.calls, 1)
+
+    def test_gives_up_waiting(self):
+        # Someone else holds the lock and never finishes
+        self.cache.add(singleflight.lock_key('k'), 'other', 60)
+        with self.assertLogs('checkouts.singleflight', 'WARNING'):
+            value = singleflight.run(self.cache, 'k', self.compute(), 60, wait_timeout=0.2)
+        self.assertEqual(value, 'report')
+        self.assertEqual(self.calls, 1)
+        # The other holder's lock is left alone
+        self.assertEqual(self.cache.get(singleflight.lock_key('k')), 'other')
+
+    def test_takes_over_expired_lock(self):
+        self.cache.add(singleflight.lock_key('k'), 'other', 0.2)
+        start = time.monotonic()
+        singleflight.run(self.cache, 'k', self.compute(), 60, wait_timeout=5)
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(self.calls, 1)
+
+    def test_failure_releases_lock(self):
+        with self.assertRaises(RuntimeError):
+            singleflight.run(self.cache, 'k', self.compute(fail=True), 60)
+        self.assertIsNone(self.cache.get(singleflight.lock_key('k')))
+        self.assertEqual(singleflight.run(self.cache, 'k', self.compute(), 60), 'report')
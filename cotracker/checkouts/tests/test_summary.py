@@ -0,0 +1,117 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from checkouts import summary, util
+from checkouts.models import CheckoutSummary
+
+import checkouts.tests.helper as helper
+
+
+@override_settings(CHECKOUT_SUMMARY_TABLE=True)
+class CheckoutSummaryTests(TestCase):
+
+    def setUp(self):
+        self.pilot1 = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        self.pilot2 = helper.create_pilot('sam', 'Sam', 'Pilot2')
+        self.actype1 = helper.create_aircrafttype('Name1')
+        self.actype2 = helper.create_aircrafttype('Name2')
+        self.base = helper.create_airstrip('BASE', 'Base1', is_base=True)
+        self.airstrip1 = helper.create_airstrip('ID1', 'Airstrip1')
+        self.airstrip2 = helper.create_airstrip('ID2', 'Airstrip2')
+        self.airstrip1.bases.add(self.base)
+
+        helper.create_checkout(pilot=self.pilot1, airstrip=self.airstrip1, aircraft_type=self.actype1)
+        helper.create_checkout(pilot=self.pilot1, airstrip=self.airstrip1, aircraft_type=self.actype2)
+        helper.create_checkout(pilot=self.pilot2, airstrip=self.airstrip2, aircraft_type=self.actype2)
+
+    def masks(self):
+        return dict(((s.pilot_id, s.airstrip_id), s.sudah) for s in CheckoutSummary.objects.all())
+
+    def test_maintained_by_checkout_signals(self):
+        self.assertEqual(self.masks(), {
+            (self.pilot1.pk, self.airstrip1.pk): 0b11,
+            (self.pilot2.pk, self.airstrip2.pk): 0b10,
+        })
+
+        c = helper.create_checkout(pilot=self.pilot2, airstrip=self.airstrip1, aircraft_type=self.actype1)
+        self.assertEqual(self.masks()[(self.pilot2.pk, self.airstrip1.pk)], 0b01)
+
+        # Moving a checkout refreshes both the old and the new pair
+        c.airstrip = self.airstrip2
+        c.save()
+        self.assertNotIn((self.pilot2.pk, self.airstrip1.pk), self.masks())
+        self.assertEqual(self.masks()[(self.pilot2.pk, self.airstrip2.pk)], 0b11)
+
+        c.delete()
+        self.assertEqual(self.masks()[(self.pilot2.pk, self.airstrip2.pk)], 0b10)
+        self.assertEqual(summary.drift(), {})
+
+    def test_maintained_by_aircrafttype_changes(self):
+        actype3 = helper.create_aircrafttype('Name3')
+        helper.create_checkout(pilot=self.pilot2, airstrip=self.airstrip2, aircraft_type=actype3)
+        self.assertEqual(self.masks()[(self.pilot2.pk, self.airstrip2.pk)], 0b110)
+
+        # Deleting a type shifts the bits of every later type
+        self.actype1.delete()
+        self.assertEqual(self.masks(), {
+            (self.pilot1.pk, self.airstrip1.pk): 0b01,
+            (self.pilot2.pk, self.airstrip2.pk): 0b11,
+        })
+        self.assertEqual(summary.drift(), {})
+
+    def test_checkout_filter_matches_checkouts(self):
+        filters = [
+            {},
+            {'pilot': self.pilot1},
+            {'airstrip': self.airstrip2},
+            {'base': self.base},
+            {'aircraft_type': self.actype1},
+            {'aircraft_type': self.actype2, 'pilot': self.pilot2},
+        ]
+        with override_settings(CHECKOUT_SUMMARY_TABLE=False):
+            expected = [util.checkout_filter(**kwargs) for kwargs in filters]
+        for kwargs, results in zip(filters, expected):
+            self.assertEqual(util.checkout_filter(**kwargs), results)
+        with self.assertNumQueries(3):
+            util.checkout_filter()
+
+    def test_falls_back_with_too_many_aircraft_types(self):
+        with override_settings(CHECKOUT_SUMMARY_TABLE=False):
+            expected = util.checkout_filter()
+        with mock.patch.object(summary, 'MAX_AIRCRAFT_TYPES', 1):
+            self.assertIsNone(summary.checkout_filter())
+            self.assertEqual(util.checkout_filter(), expected)
+
+    def test_not_maintained_when_disabled(self):
+        with override_settings(CHECKOUT_SUMMARY_TABLE=False):
+            helper.create_checkout(pilot=self.pilot2, airstrip=self.airstrip1, aircraft_type=self.actype1)
+            util.add_checkouts(self.pilot2, self.airstrip1, [self.actype2])
+            self.actype1.delete()
+        self.assertEqual(self.masks(), {
+            (self.pilot1.pk, self.airstrip1.pk): 0b11,
+            (self.pilot2.pk, self.airstrip2.pk): 0b10,
+        })
+
+        # Turning the setting on needs a rebuild
+        self.assertEqual(len(summary.drift()), 3)
+        call_command('checkout_summary', stdout=StringIO())
+        self.assertEqual(summary.drift(), {})
+
+    def test_command_check_and_rebuild(self):
+        CheckoutSummary.objects.filter(pilot=self.pilot2).delete()
+        CheckoutSummary.objects.filter(pilot=self.pilot1).update(sudah=0b01)
+
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('checkout_summary', '--check', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+        call_command('checkout_summary', stdout=StringIO())
+        out = StringIO()
+        call_command('checkout_summary', '--check', stdout=out)
+        self.assertIn('up to date', out.getvalue())
+
@@ -1,8 +1,23 @@
+import datetime
+import hashlib
+import json
+import os
+import stat
+import tempfile
+from unittest import mock
+from xml.etree import ElementTree
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
-from checkouts import util
-from checkouts.models import AircraftType
+from checkouts import summary, util
+from checkouts.models import AircraftType, Airstrip, Checkout, PilotWeight
 
 import checkouts.tests.helper as helper
 
@@ -43,14 +58,14 @@ class GetAircraftTypeNamesTests(TestCase):
 class GetPilotAirstripPairsTests(TestCase):
     
     def test_empty(self):
-        self.assertEqual(util.get_pilot_airstrip_pairs(), [])
+        self.assertEqual(list(util.get_pilot_airstrip_pairs()), [])
     
     def test_single(self):
         pilot = helper.create_pilot()
         airstrip = helper.create_airstrip()
         
         expected = [(pilot.username, airstrip.ident)]
-        self.assertEqual(util.get_pilot_airstrip_pairs(), expected)
+        self.assertEqual(list(util.get_pilot_airstrip_pairs()), expected)
     
     def test_multiple(self):
         pilot1 = helper.create_pilot('kim', 'Kim', 'Pilot1')
@@ -64,21 +79,21 @@ class GetPilotAirstripPairsTests(TestCase):
             (pilot2.username, airstrip1.ident),
             (pilot2.username, airstrip2.ident),
         ]
-        self.assertEqual(util.get_pilot_airstrip_pairs(), expected)
+        self.assertEqual(list(util.get_pilot_airstrip_pairs()), expected)
         
         # Filter on Pilot
         expected = [
             (pilot1.username, airstrip1.ident),
             (pilot1.username, airstrip2.ident),
         ]
-        self.assertEqual(util.get_pilot_airstrip_pairs(pilot=pilot1), expected)
+        self.assertEqual(list(util.get_pilot_airstrip_pairs(pilot=pilot1)), expected)
         
         # Filter on Airstrip
         expected = [
             (pilot1.username, airstrip2.ident),
             (pilot2.username, airstrip2.ident),
         ]
-        self.assertEqual(util.get_pilot_airstrip_pairs(airstrip=airstrip2), expected)
+        self.assertEqual(list(util.get_pilot_airstrip_pairs(airstrip=airstrip2)), expected)
         
         # Filter on Base
         base1 = helper.create_airstrip('BASE', 'Base1', is_base=True)
@@ -88,7 +103,27 @@ class GetPilotAirstripPairsTests(TestCase):
             (pilot1.username, airstrip1.ident),
             (pilot2.username, airstrip1.ident),
         ]
-        self.assertEqual(util.get_pilot_airstrip_pairs(base=base1), expected)
+        self.assertEqual(list(util.get_pilot_airstrip_pairs(base=base1)), expected)
+
+
+    def test_lazy(self):
+        """No queries should run until the pairs are actually consumed"""
+        helper.create_pilot()
+        helper.create_airstrip()
+        with self.assertNumQueries(0):
+            pairs = util.get_pilot_airstrip_pairs()
+        with self.assertNumQueries(2):
+            self.assertEqual(len(list(pairs)), 1)
+    
+    def test_preloaded_dimensions(self):
+        pilot_names = {'kim': 'Pilot, Kim'}
+        airstrip_names = {'ID1': 'Airstrip1', 'ID2': 'Airstrip2'}
+        expected = [('kim', 'ID1'), ('kim', 'ID2')]
+        with self.assertNumQueries(0):
+            pairs = util.get_pilot_airstrip_pairs(
+                        pilot_names=pilot_names,
+                        airstrip_names=airstrip_names)
+            self.assertEqual(list(pairs), expected)
 
 
 class GetPrecedentedCheckoutsTests(TestCase):
@@ -142,10 +177,134 @@ class GetPrecedentedCheckoutsTests(TestCase):
         self.assertEqual(util.get_precedented_checkouts(), expected)
 
 
-class CheckoutFilterTests(TestCase):   
+    def test_single_query(self):
+        helper.create_checkout()
+        with self.assertNumQueries(1):
+            util.get_precedented_checkouts()
+
+
+@override_settings(CACHES=helper.LOCMEM_CACHES, SHARED_CACHE=True)
+class CachedPrecedentedCheckoutsTests(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.checkout = helper.create_checkout()
+        self.expected = {
+            self.checkout.airstrip.ident: {
+                self.checkout.aircraft_type.name: True,
+            },
+        }
+    
+    def test_reuses_cached_copy(self):
+        self.assertEqual(util.get_precedented_checkouts(), self.expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(util.get_precedented_checkouts(), self.expected)
+        with self.assertNumQueries(1):
+            util.get_precedented_checkouts(use_cache=False)
+    
+    @override_settings(SHARED_CACHE=False)
+    def test_not_cached_per_worker(self):
+        util.get_precedented_checkouts()
+        with self.assertNumQueries(1):
+            util.get_precedented_checkouts()
+    
+    def test_invalidated_by_checkout_changes(self):
+        util.get_precedented_checkouts()
+        
+        actype = helper.create_aircrafttype('Name2')
+        helper.create_checkout(
+            pilot=self.checkout.pilot,
+            airstrip=self.checkout.airstrip,
+            aircraft_type=actype)
+        self.expected[self.checkout.airstrip.ident][actype.name] = True
+        self.assertEqual(util.get_precedented_checkouts(), self.expected)
+        
+        self.checkout.delete()
+        self.expected[self.checkout.airstrip.ident].pop(self.checkout.aircraft_type.name)
+        self.assertEqual(util.get_precedented_checkouts(), self.expected)
+    
+    def test_invalidated_by_renames(self):
+        util.get_precedented_checkouts()
+        
+        actype = self.checkout.aircraft_type
+        actype.name = 'Renamed'
+        actype.save()
+        airstrip = self.checkout.airstrip
+        airstrip.ident = 'NEW'
+        airstrip.save()
+        
+        expected = {'NEW': {'Renamed': True}}
+        self.assertEqual(util.get_precedented_checkouts(), expected)
+    
+    def test_invalidated_again_on_commit(self):
+        stale = util.get_precedented_checkouts()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.checkout.delete()
+            # Another worker rebuilds the map before the change is committed
+            cache.set(util.PRECEDENTED_CACHE_KEY, stale)
+        self.assertIsNone(cache.get(util.PRECEDENTED_CACHE_KEY))
+
+
+class CheckoutRecordTests(TestCase):
+
+    def test_record(self):
+        actypes = ['Name1', 'Name2']
+        r = util.checkout_record('Pilot1, Kim', 'kim', 'ID1', 'Airstrip1', actypes, util.CHECKOUT_BELUM)
+        r.cells[1] = util.CHECKOUT_SUDAH
+        self.assertEqual(r.status('Name1'), util.CHECKOUT_BELUM)
+        self.assertEqual(r.status('Name2'), util.CHECKOUT_SUDAH)
+        self.assertEqual(r.as_dict()['actypes'], {'Name1': util.CHECKOUT_BELUM, 'Name2': util.CHECKOUT_SUDAH})
+        self.assertIs(r.aircraft_types, actypes)
+
+        other = util.checkout_record('Pilot1, Kim', 'kim', 'ID1', 'Airstrip1', actypes, util.CHECKOUT_BELUM)
+        self.assertNotEqual(r, other)
+        other.cells[1] = util.CHECKOUT_SUDAH
+        self.assertEqual(r, other)
+        with self.assertRaises(AttributeError):
+            r.actypes = {}
+
+    def test_rendered_in_aircraft_type_order(self):
+        pilot = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        airstrip = helper.create_airstrip('ID1', 'Airstrip1')
+        helper.create_aircrafttype('Name1')
+        actype2 = helper.create_aircrafttype('Name2')
+        helper.create_checkout(pilot=pilot, airstrip=airstrip, aircraft_type=actype2)
+
+        html = render_to_string('checkouts/display_checkouts.html', {'checkouts': util.sudah_selesai()})
+        self.assertLess(html.index('<th>Name1</th>'), html.index('<th>Name2</th>'))
+        self.assertLess(html.index('class="%s"' % util.CHECKOUT_BELUM), html.index('class="%s"' % util.CHECKOUT_SUDAH))
+
+    def test_tied_sorted_positions(self):
+        pilot = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        airstrip = helper.create_airstrip('ID1', 'Airstrip1')
+        zulu = helper.create_aircrafttype('Zulu')
+        helper.create_aircrafttype('Alpha')
+        helper.create_checkout(pilot=pilot, airstrip=airstrip, aircraft_type=zulu)
+        helper.create_checkout(pilot=helper.create_pilot('sam', 'Sam', 'Pilot2'), airstrip=airstrip)
+        self.assertEqual(util.get_aircrafttype_names(), ['Alpha', 'FooBar1234', 'Zulu'])
+
+        def assertAligned(report):
+            kim = [r for r in report['results'] if r.pilot_slug == 'kim'][0]
+            columns = dict(zip(report['aircraft_types'], kim.cells))
+            self.assertEqual(columns['Zulu'], util.CHECKOUT_SUDAH)
+            self.assertNotEqual(columns['Alpha'], util.CHECKOUT_SUDAH)
+
+        # Each report looks the aircraft types up once, so its records can't
+        # disagree with its columns even if a second lookup would
+        names = util.get_aircrafttype_names()
+        for settings_overrides in ({}, {'CHECKOUT_SUMMARY_TABLE': True}):
+            with override_settings(**settings_overrides):
+                summary.rebuild()
+                for report in (util.sudah_selesai, util.belum_selesai):
+                    orders = iter([names, list(reversed(names))])
+                    with mock.patch('checkouts.util.get_aircrafttype_names', lambda *args: next(orders)):
+                        assertAligned(report())
+
+
+class CheckoutFilterTests(TestCase):
  
     def test_empty(self):
-        self.assertEqual(util.checkout_filter(), [])
+        self.assertEqual(helper.as_dicts(util.checkout_filter()), [])
     
     def test_single_checkout(self):
         c = helper.create_checkout()
@@ -160,7 +319,7 @@ class CheckoutFilterTests(TestCase):
             },
         },]
         
-        self.assertEqual(util.checkout_filter(), expected)
+        self.assertEqual(helper.as_dicts(util.checkout_filter()), expected)
     
     def test_multiple_aircrafttypes(self):
         actype1 = helper.create_aircrafttype('Name1')    
@@ -179,16 +338,16 @@ class CheckoutFilterTests(TestCase):
             },
         },]
         
-        self.assertEqual(util.checkout_filter(), expected)
+        self.assertEqual(helper.as_dicts(util.checkout_filter()), expected)
         
         # Testing what happens when limiting to a particular aircraft type
         expected[0]['actypes'].pop(actype2.name)
-        self.assertEqual(util.checkout_filter(aircraft_type=actype1), expected)
+        self.assertEqual(helper.as_dicts(util.checkout_filter(aircraft_type=actype1)), expected)
         
         helper.create_checkout(aircraft_type=actype2, pilot=c.pilot, airstrip=c.airstrip)
         expected[0]['actypes'][actype2.name] = util.CHECKOUT_SUDAH
         
-        self.assertEqual(util.checkout_filter(), expected)
+        self.assertEqual(helper.as_dicts(util.checkout_filter()), expected)
     
     def test_multiple_airstrips(self):
         airstrip1 = helper.create_airstrip('ID1', 'Airstrip1')
@@ -206,7 +365,7 @@ class CheckoutFilterTests(TestCase):
             },
         },]
         
-        self.assertEqual(util.checkout_filter(), expected)
+        self.assertEqual(helper.as_dicts(util.checkout_filter()), expected)
         
         helper.create_checkout(airstrip=airstrip2, pilot=c.pilot, aircraft_type=c.aircraft_type)
         r = {
@@ -220,7 +379,7 @@ class CheckoutFilterTests(TestCase):
         }
         expected.append(r)
         
-        self.assertEqual(util.checkout_filter(), expected)
+        self.assertEqual(helper.as_dicts(util.checkout_filter()), expected)
     
     def test_filtering_by_base(self):
         base1 = helper.create_airstrip('BASE', 'Base1', is_base=True)
@@ -241,7 +400,7 @@ class CheckoutFilterTests(TestCase):
             },
         },]
         
-        self.assertEqual(util.checkout_filter(base=base1), expected)
+        self.assertEqual(helper.as_dicts(util.checkout_filter(base=base1)), expected)
     
     def test_multiple_pilots(self):
         pilot1 = helper.create_pilot('kim', 'Kim', 'Pilot1')
@@ -259,7 +418,7 @@ class CheckoutFilterTests(TestCase):
             },
         },]
         
-        self.assertEqual(util.checkout_filter(), expected)
+        self.assertEqual(helper.as_dicts(util.checkout_filter()), expected)
         
         c2 = helper.create_checkout(pilot=pilot2, airstrip=c1.airstrip, aircraft_type=c1.aircraft_type)
         r = {
@@ -273,7 +432,7 @@ class CheckoutFilterTests(TestCase):
         }
         expected.append(r)
         
-        self.assertEqual(util.checkout_filter(), expected)
+        self.assertEqual(helper.as_dicts(util.checkout_filter()), expected)
     
     def test_multiple_all(self):
         pilot1 = helper.create_pilot('kim', 'Kim', 'Pilot1')
@@ -330,22 +489,40 @@ class CheckoutFilterTests(TestCase):
             },
         },]
         
-        self.assertEqual(util.checkout_filter(), expected)
+        self.assertEqual(helper.as_dicts(util.checkout_filter()), expected)
         
         # Since we already have all these objects created, let's test the
         # filtering feature!
-        self.assertEqual(util.checkout_filter(pilot=pilot1), expected[:2])
-        self.assertEqual(util.checkout_filter(pilot=pilot2), expected[2:])
+        self.assertEqual(helper.as_dicts(util.checkout_filter(pilot=pilot1)), expected[:2])
+        self.assertEqual(helper.as_dicts(util.checkout_filter(pilot=pilot2)), expected[2:])
         t = [r for i, r in enumerate(expected) if i in (0,2)]
-        self.assertEqual(util.checkout_filter(airstrip=airstrip1), t)
+        self.assertEqual(helper.as_dicts(util.checkout_filter(airstrip=airstrip1)), t)
         t = [r for i, r in enumerate(expected) if i in (1,3)]
-        self.assertEqual(util.checkout_filter(airstrip=airstrip2), t)
+        self.assertEqual(helper.as_dicts(util.checkout_filter(airstrip=airstrip2)), t)
         
         c1.delete()
         expected = expected[1:]
         for e in expected:
            e['actypes'].pop(actype2.name)
-        self.assertEqual(util.checkout_filter(aircraft_type=actype1), expected)
+        self.assertEqual(helper.as_dicts(util.checkout_filter(aircraft_type=actype1)), expected)
+    
+    def test_query_count(self):
+        """The number of queries must not depend on the number of checkouts"""
+        pilot1 = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        pilot2 = helper.create_pilot('sam', 'Sam', 'Pilot2')
+        actype1 = helper.create_aircrafttype('Name1')
+        actype2 = helper.create_aircrafttype('Name2')
+        airstrip1 = helper.create_airstrip('ID1', 'Airstrip1')
+        airstrip2 = helper.create_airstrip('ID2', 'Airstrip2')
+        for p in (pilot1, pilot2):
+            for a in (airstrip1, airstrip2):
+                for ac in (actype1, actype2):
+                    helper.create_checkout(pilot=p, airstrip=a, aircraft_type=ac)
+        
+        # One for the aircraft type names, one for the checkouts
+        with self.assertNumQueries(2):
+            results = util.checkout_filter()
+        self.assertEqual(len(results), 4)
         
         
 class PilotCheckoutsGroupedByAirstripTests(TestCase):
@@ -363,7 +540,7 @@ class PilotCheckoutsGroupedByAirstripTests(TestCase):
     
     def test_empty(self):
         pilot = helper.create_pilot()
-        self.assertEqual(util.pilot_checkouts_grouped_by_airstrip(pilot), self.expected)
+        self.assertEqual(helper.as_dicts(util.pilot_checkouts_grouped_by_airstrip(pilot)), self.expected)
     
     def test_multiple_pilots(self):
         pilot1 = helper.create_pilot('kim', 'Kim', 'Pilot1')
@@ -385,7 +562,7 @@ class PilotCheckoutsGroupedByAirstripTests(TestCase):
         self.expected['aircraft_types'] = [c1.aircraft_type.name,]
         self.expected['results'] = results
         
-        self.assertEqual(util.pilot_checkouts_grouped_by_airstrip(pilot1), self.expected)
+        self.assertEqual(helper.as_dicts(util.pilot_checkouts_grouped_by_airstrip(pilot1)), self.expected)
     
 
 class AirstripCheckoutsGroupedByPilotTests(TestCase):
@@ -403,7 +580,7 @@ class AirstripCheckoutsGroupedByPilotTests(TestCase):
     
     def test_empty(self):
         airstrip = helper.create_airstrip()
-        self.assertEqual(util.airstrip_checkouts_grouped_by_pilot(airstrip), self.expected)
+        self.assertEqual(helper.as_dicts(util.airstrip_checkouts_grouped_by_pilot(airstrip)), self.expected)
     
     def test_multiple_pilots(self):
         airstrip1 = helper.create_airstrip('ID1', 'Airstrip1')
@@ -425,7 +602,7 @@ class AirstripCheckoutsGroupedByPilotTests(TestCase):
         self.expected['aircraft_types'] = [c1.aircraft_type.name,]
         self.expected['results'] = results
         
-        self.assertEqual(util.airstrip_checkouts_grouped_by_pilot(airstrip1), self.expected)
+        self.assertEqual(helper.as_dicts(util.airstrip_checkouts_grouped_by_pilot(airstrip1)), self.expected)
         
 
 class CheckoutsSelesaiTests(TestCase):
@@ -442,7 +619,7 @@ class CheckoutsSelesaiTests(TestCase):
         }
     
     def test_empty(self):
-        self.assertEqual(util.sudah_selesai(), self.expected)
+        self.assertEqual(helper.as_dicts(util.sudah_selesai()), self.expected)
     
     def test_with_checkouts(self):
         c = helper.create_checkout()
@@ -460,7 +637,7 @@ class CheckoutsSelesaiTests(TestCase):
         self.expected['aircraft_types'] = [c.aircraft_type.name,]
         self.expected['results'] = results
         
-        self.assertEqual(util.sudah_selesai(), self.expected)
+        self.assertEqual(helper.as_dicts(util.sudah_selesai()), self.expected)
         
 
 class CheckoutsBelumSelesaiTests(TestCase):
@@ -477,7 +654,7 @@ class CheckoutsBelumSelesaiTests(TestCase):
         }
     
     def test_empty(self):
-        self.assertEqual(util.belum_selesai(), self.expected)
+        self.assertEqual(helper.as_dicts(util.belum_selesai()), self.expected)
     
     def test_exclude_fully_selesai(self):
         """If all AircraftTypes for a Pilot/Airstrip pair have a Sudah Selesai
@@ -486,7 +663,7 @@ class CheckoutsBelumSelesaiTests(TestCase):
         
         self.expected['aircraft_types'] = util.get_aircrafttype_names()
         
-        self.assertEqual(util.belum_selesai(), self.expected)
+        self.assertEqual(helper.as_dicts(util.belum_selesai()), self.expected)
         
     def test_with_data(self):
         pilot1 = helper.create_pilot('kim', 'Kim', 'Pilot1')
@@ -533,24 +710,416 @@ class CheckoutsBelumSelesaiTests(TestCase):
         self.expected['aircraft_types'] = util.get_aircrafttype_names()
         self.expected['results'] = results
         
-        self.assertEqual(util.belum_selesai(), self.expected)
+        self.assertEqual(helper.as_dicts(util.belum_selesai()), self.expected)
         
         # Since we already have all these objects created, let's test the
         # 'belum selesai' filtering feature!
         self.expected['results'] = results[:1]
-        self.assertEqual(util.belum_selesai(pilot=pilot1), self.expected)
+        self.assertEqual(helper.as_dicts(util.belum_selesai(pilot=pilot1)), self.expected)
         self.expected['results'] = results[1:]
-        self.assertEqual(util.belum_selesai(pilot=pilot2), self.expected)
+        self.assertEqual(helper.as_dicts(util.belum_selesai(pilot=pilot2)), self.expected)
         self.expected['results'] = [results[1],]
-        self.assertEqual(util.belum_selesai(airstrip=airstrip1), self.expected)
+        self.assertEqual(helper.as_dicts(util.belum_selesai(airstrip=airstrip1)), self.expected)
         self.expected['results'] = [r for i, r in enumerate(results) if i in (0,2)]
-        self.assertEqual(util.belum_selesai(airstrip=airstrip2), self.expected)
+        self.assertEqual(helper.as_dicts(util.belum_selesai(airstrip=airstrip2)), self.expected)
         
         self.expected['results'] = results[:2]
         for r in self.expected['results']:
             r['actypes'].pop(actype2.name)
         self.expected['aircraft_types'] = [actype1.name,]
-        self.assertEqual(util.belum_selesai(aircraft_type=actype1), self.expected)
+        self.assertEqual(helper.as_dicts(util.belum_selesai(aircraft_type=actype1)), self.expected)
+
+
+    def test_query_count_independent_of_roster(self):
+        """Adding pilots and airstrips must not add queries"""
+        actype = helper.create_aircrafttype('Name1')
+        pilot = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        airstrip = helper.create_airstrip('ID1', 'Airstrip1')
+        helper.create_checkout(pilot=pilot, airstrip=airstrip, aircraft_type=actype)
+        
+        with CaptureQueriesContext(connection) as small:
+            small_results = util.belum_selesai()
+        
+        for i in range(10):
+            helper.create_pilot('pilot%d' % i, 'First%d' % i, 'Last%d' % i)
+            helper.create_airstrip('A%d' % i, 'Airstrip%d' % i)
+        
+        with CaptureQueriesContext(connection) as large:
+            large_results = util.belum_selesai()
+        
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertEqual(len(small_results['results']), 0)
+        # Only ID1 is precedented, so one gap per new pilot
+        self.assertEqual(len(large_results['results']), 10)
+
+
+class BelumSelesaiDatabaseTests(TestCase):
+    
+    def setUp(self):
+        self.pilot1 = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        self.pilot2 = helper.create_pilot('sam', 'Sam', 'Pilot2')
+        self.actype1 = helper.create_aircrafttype('Name1')
+        self.actype2 = helper.create_aircrafttype('Name2')
+        self.base = helper.create_airstrip('BASE', 'Base1', is_base=True)
+        self.airstrip1 = helper.create_airstrip('ID1', 'Airstrip1')
+        self.airstrip2 = helper.create_airstrip('ID2', 'Airstrip2')
+        self.airstrip3 = helper.create_airstrip('ID3', 'Airstrip3')
+        self.airstrip1.bases.add(self.base)
+        self.airstrip3.bases.add(self.base)
+        
+        helper.create_checkout(pilot=self.pilot1, airstrip=self.airstrip1, aircraft_type=self.actype1)
+        helper.create_checkout(pilot=self.pilot1, airstrip=self.airstrip1, aircraft_type=self.actype2)
+        helper.create_checkout(pilot=self.pilot2, airstrip=self.airstrip2, aircraft_type=self.actype1)
+    
+    def assertEnginesAgree(self, **kwargs):
+        if kwargs.get('aircraft_type'):
+            actypes = [kwargs['aircraft_type'].name,]
+        else:
+            actypes = util.get_aircrafttype_names()
+        expected = util.belum_selesai_python(actypes, **kwargs)
+        self.assertEqual(util.belum_selesai_database(actypes, **kwargs), expected)
+        return expected
+    
+    def test_matches_python_engine(self):
+        self.assertEqual(len(self.assertEnginesAgree()), 3)
+        self.assertEnginesAgree(pilot=self.pilot1)
+        self.assertEnginesAgree(pilot=self.pilot2)
+        self.assertEnginesAgree(airstrip=self.airstrip1)
+        self.assertEnginesAgree(airstrip=self.airstrip3)
+        self.assertEnginesAgree(base=self.base)
+        self.assertEnginesAgree(aircraft_type=self.actype1)
+        self.assertEnginesAgree(aircraft_type=self.actype2, base=self.base)
+    
+    def test_no_aircraft_types(self):
+        self.assertEqual(util.belum_selesai_database([]), [])
+    
+    @override_settings(BELUM_SELESAI_IN_DATABASE=True)
+    def test_falls_back_without_postgres(self):
+        with mock.patch.object(util, 'belum_selesai_database') as database:
+            results = util.belum_selesai()
+        self.assertFalse(database.called)
+        self.assertEqual(len(results['results']), 3)
+
+
+class GetBaseCountsTests(TestCase):
+    
+    def setUp(self):
+        self.base1 = helper.create_airstrip('BS1', 'Base1', is_base=True)
+        self.base2 = helper.create_airstrip('BS2', 'Base2', is_base=True)
+        self.airstrip1 = helper.create_airstrip('ID1', 'Airstrip1')
+        self.airstrip2 = helper.create_airstrip('ID2', 'Airstrip2')
+        self.airstrip3 = helper.create_airstrip('ID3', 'Airstrip3')
+        self.airstrip1.bases.add(self.base1)
+        self.airstrip2.bases.add(self.base1, self.base2)
+        # A base may be attached to itself
+        self.base2.bases.add(self.base2)
+    
+    def expected(self):
+        return [
+            (base, base.attached_airstrips().count(), base.unattached_airstrips().count())
+            for base in util.get_bases()
+        ]
+    
+    def test_empty(self):
+        Airstrip.objects.all().delete()
+        self.assertEqual(util.get_base_counts(use_cache=False), [])
+    
+    def test_counts(self):
+        self.assertEqual(util.get_base_counts(use_cache=False), self.expected())
+        self.assertEqual(
+            [(base.ident, attached, unattached) for base, attached, unattached in util.get_base_counts(use_cache=False)],
+            [('BS1', 2, 2), ('BS2', 2, 3)]
+        )
+    
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            util.get_base_counts(use_cache=False)
+    
+    @override_settings(CACHES=helper.LOCMEM_CACHES, SHARED_CACHE=True)
+    def test_cached_until_attachments_change(self):
+        cache.clear()
+        util.get_base_counts()
+        with self.assertNumQueries(0):
+            util.get_base_counts()
+        
+        self.airstrip3.bases.add(self.base1)
+        self.assertEqual(util.get_base_counts(), self.expected())
+        self.base1.airstrip_set.remove(self.airstrip1)
+        self.assertEqual(util.get_base_counts(), self.expected())
+        helper.create_airstrip('ID4', 'Airstrip4')
+        self.assertEqual(util.get_base_counts(), self.expected())
+    
+    @override_settings(CACHES=helper.LOCMEM_CACHES, SHARED_CACHE=True)
+    def test_invalidated_again_on_commit(self):
+        cache.clear()
+        stale = util.get_base_counts()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.airstrip3.bases.add(self.base1)
+            # Another worker counts again before the change is committed
+            cache.set(util.BASE_COUNTS_CACHE_KEY, stale)
+        self.assertIsNone(cache.get(util.BASE_COUNTS_CACHE_KEY))
+
+
+class SetAttachedAirstripsTests(TestCase):
+    
+    def setUp(self):
+        self.base = helper.create_airstrip('BS1', 'Base1', is_base=True)
+        self.airstrips = [helper.create_airstrip('A%03d' % i, 'Airstrip%03d' % i) for i in range(20)]
+        for airstrip in self.airstrips[:10]:
+            airstrip.bases.add(self.base)
+    
+    def idents(self, airstrips):
+        return [airstrip.ident for airstrip in airstrips]
+    
+    def test_changes(self):
+        proposed = self.idents(self.airstrips[5:15]) + ['BS1', 'NONE']
+        changes = util.set_attached_airstrips(self.base, proposed)
+        self.assertEqual(self.idents(changes['attached']), self.idents(self.airstrips[10:15]))
+        self.assertEqual(self.idents(changes['detached']), self.idents(self.airstrips[:5]))
+        self.assertEqual(self.idents(changes['rejected']), ['BS1'])
+        self.assertEqual(self.idents(changes['current']), self.idents(self.airstrips[5:15]))
+        self.assertEqual(list(self.base.attached_airstrips()), changes['current'])
+    
+    def test_no_changes(self):
+        changes = util.set_attached_airstrips(self.base, self.idents(self.airstrips[:10]))
+        self.assertEqual(changes['attached'], [])
+        self.assertEqual(changes['detached'], [])
+        self.assertEqual(changes['current'], self.airstrips[:10])
+    
+    def test_query_count_independent_of_changes(self):
+        def queries(proposed):
+            with CaptureQueriesContext(connection) as context:
+                util.set_attached_airstrips(self.base, self.idents(proposed))
+            return len(context.captured_queries)
+        
+        few = queries(self.airstrips[1:11])
+        many = queries(self.airstrips[10:])
+        self.assertEqual(few, many)
+
+
+class AddRemoveCheckoutsTests(TestCase):
+    
+    def setUp(self):
+        self.pilot = helper.create_pilot()
+        self.airstrip = helper.create_airstrip('ID1', 'Airstrip1')
+        self.actypes = [helper.create_aircrafttype('Name%d' % i) for i in range(4)]
+        helper.create_checkout(pilot=self.pilot, airstrip=self.airstrip, aircraft_type=self.actypes[0])
+    
+    def held(self):
+        return list(Checkout.objects.filter(pilot=self.pilot, airstrip=self.airstrip)
+                        .order_by('aircraft_type__name').values_list('aircraft_type__name', flat=True))
+    
+    def names(self, checkouts):
+        return [c.aircraft_type.name for c in checkouts]
+    
+    def test_add(self):
+        results = util.add_checkouts(self.pilot, self.airstrip, [self.actypes[1], self.actypes[0], self.actypes[2]])
+        self.assertEqual([(c.aircraft_type.name, added) for c, added in results],
+                         [('Name1', True), ('Name0', False), ('Name2', True)])
+        self.assertEqual(self.held(), ['Name0', 'Name1', 'Name2'])
+        self.assertEqual(str(results[0][0]), str(Checkout.objects.get(aircraft_type=self.actypes[1])))
+        checkout = Checkout.objects.get(aircraft_type=self.actypes[1])
+        self.assertEqual(checkout.date, datetime.date.today())
+        self.assertEqual(checkout.created, checkout.modified)
+    
+    def test_add_without_returning(self):
+        with mock.patch.object(util, 'supports_returning', return_value=False):
+            results = util.add_checkouts(self.pilot, self.airstrip, self.actypes[:2])
+        self.assertEqual([(c.aircraft_type.name, added) for c, added in results],
+                         [('Name0', False), ('Name1', True)])
+        self.assertEqual(self.held(), ['Name0', 'Name1'])
+    
+    def test_add_ignores_other_rows_with_same_timestamp(self):
+        now = timezone.now()
+        other = helper.create_checkout(pilot=self.pilot, aircraft_type=self.actypes[3])
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            Checkout.objects.filter(pk=other.pk).update(created=now, modified=now)
+            changes = util.apply_checkout_changes(self.pilot, add=[(self.airstrip.pk, self.actypes[1].pk)])
+        self.assertEqual(changes['added'], set([(self.airstrip.pk, self.actypes[1].pk)]))
+    
+    def test_remove(self):
+        util.add_checkouts(self.pilot, self.airstrip, self.actypes[1:2])
+        deleted, missing = util.remove_checkouts(self.pilot, self.airstrip, self.actypes[1:])
+        self.assertEqual(self.names(deleted), ['Name1'])
+        self.assertEqual(self.names(missing), ['Name2', 'Name3'])
+        self.assertEqual(self.held(), ['Name0'])
+    
+    def test_remove_without_returning(self):
+        with mock.patch.object(util, 'supports_returning', return_value=False):
+            deleted, missing = util.remove_checkouts(self.pilot, self.airstrip, self.actypes[:2])
+        self.assertEqual(self.names(deleted), ['Name0'])
+        self.assertEqual(self.names(missing), ['Name1'])
+        self.assertEqual(self.held(), [])
+    
+    def test_single_statement_writes(self):
+        with CaptureQueriesContext(connection) as context:
+            util.add_checkouts(self.pilot, self.airstrip, self.actypes)
+            util.remove_checkouts(self.pilot, self.airstrip, self.actypes)
+        writes = [q['sql'] for q in context.captured_queries
+                  if 'INTO "checkouts_checkout"' in q['sql'] or q['sql'].startswith('DELETE FROM "checkouts_checkout"')]
+        self.assertEqual(len(writes), 2)
+    
+    @override_settings(CHECKOUT_SUMMARY_TABLE=True)
+    def test_derived_data_updated(self):
+        util.add_checkouts(self.pilot, self.airstrip, self.actypes[2:])
+        self.assertEqual(summary.drift(), {})
+        self.assertEqual(util.get_precedented_checkouts(use_cache=False)['ID1'],
+                         {'Name0': True, 'Name2': True, 'Name3': True})
+        util.remove_checkouts(self.pilot, self.airstrip, self.actypes)
+        self.assertEqual(summary.drift(), {})
+        self.assertEqual(util.get_precedented_checkouts(use_cache=False), {})
+
+
+class ExportPilotWeightsTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        static_root = override_settings(STATIC_ROOT=self.root)
+        static_root.enable()
+        self.addCleanup(static_root.disable)
+
+        pilot1 = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        pilot2 = helper.create_pilot('sam', 'Sam', 'Pilot2')
+        PilotWeight.objects.create(pilot=pilot1, weight=70)
+        self.pilotweight = PilotWeight.objects.create(pilot=pilot2, weight=80)
+
+    def path(self, name):
+        return os.path.join(self.root, getattr(settings, name))
+
+    def test_writes_both_files(self):
+        self.assertTrue(util.export_pilotweights())
+        with open(self.path('PILOTWEIGHTS_JSON_FILE')) as f:
+            exported = json.load(f)
+        self.assertEqual(exported['version'], '1')
+        self.assertEqual(exported['pilots'], [
+            {'lastname': 'Pilot1', 'firstname': 'Kim', 'weight': 70},
+            {'lastname': 'Pilot2', 'firstname': 'Sam', 'weight': 80},
+        ])
+        with open(self.path('PILOTWEIGHTS_XML_FILE')) as f:
+            xml = f.read()
+        self.assertIn("<updated>%s</updated>" % exported['updated'], xml)
+        self.assertIn("<weight>80</weight>", xml)
+
+        # Readable by the web server, and no temporary files left behind
+        mode = os.stat(self.path('PILOTWEIGHTS_JSON_FILE')).st_mode
+        self.assertEqual(stat.S_IMODE(mode), 0o644)
+        self.assertFalse([name for name in os.listdir(self.root) if name.startswith('.')])
+
+        with open(self.path('PILOTWEIGHTS_META_FILE')) as f:
+            metadata = json.load(f)
+        self.assertEqual(metadata['updated'], exported['updated'])
+        self.assertEqual(set(metadata['files']), {'json', 'xml'})
+        with open(self.path('PILOTWEIGHTS_JSON_FILE'), 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self.assertEqual(metadata['files']['json']['sha256'], digest)
+
+    def test_unchanged_data_not_rewritten(self):
+        util.export_pilotweights()
+        jsonpath = self.path('PILOTWEIGHTS_JSON_FILE')
+        os.utime(jsonpath, (0, 0))
+
+        self.assertFalse(util.export_pilotweights())
+        self.assertEqual(os.path.getmtime(jsonpath), 0)
+
+        self.pilotweight.weight = 81
+        self.pilotweight.save()
+        self.assertTrue(util.export_pilotweights())
+        self.assertNotEqual(os.path.getmtime(jsonpath), 0)
+
+    def test_missing_file_rewritten(self):
+        util.export_pilotweights()
+        os.unlink(self.path('PILOTWEIGHTS_XML_FILE') + '.gz')
+        self.assertTrue(util.export_pilotweights())
+        self.assertTrue(os.path.exists(self.path('PILOTWEIGHTS_XML_FILE') + '.gz'))
+
+    def test_escaped_and_compact(self):
+        self.pilotweight.pilot.last_name = 'Pilot & Sons'
+        self.pilotweight.pilot.save()
+        with override_settings(PILOTWEIGHTS_COMPACT_EXPORTS=True):
+            # Nothing published yet to compare with, so just one streamed
+            # query for each format
+            with self.assertNumQueries(2):
+                util.export_pilotweights()
+        with open(self.path('PILOTWEIGHTS_XML_FILE')) as f:
+            xml = f.read()
+        self.assertNotIn('\n', xml)
+        self.assertEqual(ElementTree.fromstring(xml).findall('pilot')[0].find('lastname').text, 'Pilot & Sons')
+        with open(self.path('PILOTWEIGHTS_JSON_FILE')) as f:
+            self.assertEqual(json.load(f)['pilots'][0]['lastname'], 'Pilot & Sons')
+
+    def test_hashed_exports(self):
+        with override_settings(PILOTWEIGHTS_HASHED_EXPORTS=True):
+            util.export_pilotweights()
+            with open(self.path('PILOTWEIGHTS_META_FILE')) as f:
+                first = json.load(f)['files']['json']['hashed']
+            self.assertTrue(os.path.exists(os.path.join(self.root, first)))
+            self.assertFalse(util.export_pilotweights())
+
+            self.pilotweight.weight = 81
+            self.pilotweight.save()
+            util.export_pilotweights()
+            with open(self.path('PILOTWEIGHTS_META_FILE')) as f:
+                second = json.load(f)['files']['json']['hashed']
+            self.assertNotEqual(first, second)
+            # The superseded copy is kept until the next change
+            self.assertTrue(os.path.exists(os.path.join(self.root, first)))
+
+            self.pilotweight.weight = 82
+            self.pilotweight.save()
+            util.export_pilotweights()
+            self.assertFalse(os.path.exists(os.path.join(self.root, first)))
+            self.assertFalse(os.path.exists(os.path.join(self.root, first + '.gz')))
+            self.assertTrue(os.path.exists(os.path.join(self.root, second)))
+
+
+class PilotWeightChangesTests(TestCase):
+
+    def setUp(self):
+        self.past = timezone.now() - datetime.timedelta(hours=1)
+        self.pilotweights = []
+        for i, name in enumerate(['kim', 'sam', 'ada']):
+            pilot = helper.create_pilot(name, name.title(), 'Pilot%d' % i)
+            self.pilotweights.append(PilotWeight.objects.create(pilot=pilot, weight=70 + i))
+        # Two rows share a timestamp, so the cursor must also use the pk
+        PilotWeight.objects.filter(pk=self.pilotweights[0].pk).update(modified=self.past)
+        PilotWeight.objects.filter(pk=self.pilotweights[1].pk).update(modified=self.past)
+        PilotWeight.objects.filter(pk=self.pilotweights[2].pk).update(modified=self.past + datetime.timedelta(seconds=1))
+
+    def test_paging(self):
+        rows, cursor, more = util.pilotweight_changes(limit=2)
+        self.assertEqual([pw.pk for pw in rows], [pw.pk for pw in self.pilotweights[:2]])
+        self.assertTrue(more)
+
+        rows, cursor, more = util.pilotweight_changes(cursor, limit=2)
+        self.assertEqual([pw.pk for pw in rows], [self.pilotweights[2].pk])
+        self.assertFalse(more)
+
+        # Nothing new: the cursor stays put
+        self.assertEqual(util.pilotweight_changes(cursor), ([], cursor, False))
+
+    def test_changed_rows_reappear(self):
+        _, cursor, _ = util.pilotweight_changes()
+        PilotWeight.objects.filter(pk=self.pilotweights[0].pk).update(
+            weight=90, modified=self.past + datetime.timedelta(seconds=2))
+        rows, _, _ = util.pilotweight_changes(cursor)
+        self.assertEqual([(pw.pk, pw.weight) for pw in rows], [(self.pilotweights[0].pk, 90)])
+
+    def test_recent_rows_held_back(self):
+        _, cursor, _ = util.pilotweight_changes()
+        pilotweight = self.pilotweights[1]
+        pilotweight.weight = 90
+        pilotweight.save()
+        self.assertEqual(util.pilotweight_changes(cursor)[0], [])
+
+    def test_cursor_round_trip(self):
+        modified = self.past.replace(microsecond=123456)
+        cursor = util.encode_change_cursor(modified, 42)
+        self.assertEqual(util.decode_change_cursor(cursor), (modified, 42))
+        for bad in ['junk', '1-2-3', 'a-1']:
+            with self.assertRaises(ValueError):
+                util.pilotweight_changes(bad)
 
 
 class ChoicesTests(TestCase):
@@ -595,3 +1164,17 @@ class QueryTests(TestCase):
         
         query = util.get_bases()
         self.assertEqual([o for o in query], expected)
+    
+    def test_get_pilot_weights(self):
+        self.assertEqual(util.get_pilot_weights(), [])
+        
+        pilot1 = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        pilot2 = helper.create_pilot('sam', 'Sam', 'Pilot2')
+        PilotWeight.objects.create(pilot=pilot2, weight=80)
+        
+        with self.assertNumQueries(1):
+            weights = util.get_pilot_weights()
+        self.assertEqual(weights, [(pilot1, 0), (pilot2, 80)])
+        
+        query = User.objects.filter(pk=pilot2.pk)
+        self.assertEqual(util.get_pilot_weights(query), [(pilot2, 80)])
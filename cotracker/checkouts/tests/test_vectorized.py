@@ -0,0 +1,87 @@
+import unittest
+
+from django.test import TestCase, override_settings
+
+from checkouts import util, vectorized
+from checkouts.models import AircraftType
+
+import checkouts.tests.helper as helper
+
+
+@unittest.skipIf(vectorized.numpy is None, "NumPy is not installed")
+class VectorizedBelumSelesaiTests(TestCase):
+
+    def setUp(self):
+        self.pilot1 = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        self.pilot2 = helper.create_pilot('sam', 'Sam', 'Pilot2')
+        self.actype1 = helper.create_aircrafttype('Name1')
+        self.actype2 = helper.create_aircrafttype('Name2')
+        self.base = helper.create_airstrip('BASE', 'Base1', is_base=True)
+        self.airstrip1 = helper.create_airstrip('ID1', 'Airstrip1')
+        self.airstrip2 = helper.create_airstrip('ID2', 'Airstrip2')
+        self.airstrip3 = helper.create_airstrip('ID3', 'Airstrip3')
+        self.airstrip1.bases.add(self.base)
+        self.airstrip3.bases.add(self.base)
+
+        helper.create_checkout(pilot=self.pilot1, airstrip=self.airstrip1, aircraft_type=self.actype1)
+        helper.create_checkout(pilot=self.pilot1, airstrip=self.airstrip1, aircraft_type=self.actype2)
+        helper.create_checkout(pilot=self.pilot2, airstrip=self.airstrip2, aircraft_type=self.actype1)
+
+    def assertEvaluatorsAgree(self, **kwargs):
+        if kwargs.get('aircraft_type'):
+            actypes = [kwargs['aircraft_type'].name,]
+        else:
+            actypes = util.get_aircrafttype_names()
+        expected = util.belum_selesai_python(actypes, **kwargs)
+        self.assertEqual(vectorized.belum_selesai(actypes, **kwargs), expected)
+        return expected
+
+    def test_matches_python_evaluator(self):
+        self.assertEqual(len(self.assertEvaluatorsAgree()), 3)
+        self.assertEvaluatorsAgree(pilot=self.pilot1)
+        self.assertEvaluatorsAgree(pilot=self.pilot2)
+        self.assertEvaluatorsAgree(airstrip=self.airstrip1)
+        self.assertEvaluatorsAgree(airstrip=self.airstrip3)
+        self.assertEvaluatorsAgree(base=self.base)
+        self.assertEvaluatorsAgree(aircraft_type=self.actype1)
+        self.assertEvaluatorsAgree(aircraft_type=self.actype2, base=self.base)
+
+    def test_precedent_includes_former_pilots(self):
+        """Checkouts held by users outside the Pilots group still count as
+        precedent, even though those users aren't in the report"""
+        former = helper.create_flight_scheduler()
+        airstrip = helper.create_airstrip('ID4', 'Airstrip4')
+        helper.create_checkout(pilot=former, airstrip=airstrip, aircraft_type=self.actype2)
+        results = self.assertEvaluatorsAgree(airstrip=airstrip)
+        self.assertEqual(len(results), 2)
+
+    def test_status_matrix(self):
+        evaluated = vectorized.evaluate(pilot=self.pilot2)
+        self.assertEqual(evaluated['status'].shape, (1, 4, 2))
+        # BASE: unprecedented, ID1: belum in both, ID2: sudah then
+        # unprecedented, ID3: unprecedented
+        self.assertEqual(evaluated['status'].tolist(), [[
+            [vectorized.UNPRECEDENTED, vectorized.UNPRECEDENTED],
+            [vectorized.BELUM, vectorized.BELUM],
+            [vectorized.SUDAH, vectorized.UNPRECEDENTED],
+            [vectorized.UNPRECEDENTED, vectorized.UNPRECEDENTED],
+        ]])
+        self.assertEqual(evaluated['belum'].tolist(), [[False, True, True, False]])
+
+    def test_tied_sorted_positions(self):
+        # Created after Name1/Name2, so a tie broken by primary key would put
+        # it last
+        helper.create_aircrafttype('Name0')
+        AircraftType.objects.update(sorted_position=0)
+        names = util.get_aircrafttype_names()
+        self.assertEqual(names, ['Name0', 'Name1', 'Name2'])
+        self.assertEqual(vectorized.evaluate()['aircraft_types'], names)
+
+    def test_no_aircraft_types(self):
+        AircraftType.objects.all().delete()
+        self.assertEqual(vectorized.belum_selesai([]), [])
+
+    @override_settings(VECTORIZED_BELUM_SELESAI=True)
+    def test_selected_by_setting(self):
+        expected = util.belum_selesai_python(util.get_aircrafttype_names())
+        self.assertEqual(util.belum_selesai()['results'], expected)
@@ -0,0 +1,81 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from checkouts import util, versions
+from checkouts.models import AircraftType, Airstrip, ChangeCounter, Checkout
+
+import checkouts.tests.helper as helper
+
+
+REPORT_MODELS = (User, Checkout, Airstrip, AircraftType)
+
+
+class DataVersionTests(TestCase):
+
+    def setUp(self):
+        self.pilot = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        self.actype = helper.create_aircrafttype('Name1')
+        self.base = helper.create_airstrip('BASE', 'Base1', is_base=True)
+        self.airstrip = helper.create_airstrip('ID1', 'Airstrip1')
+        self.checkout = helper.create_checkout(pilot=self.pilot, airstrip=self.airstrip, aircraft_type=self.actype)
+        # A later checkout, so deleting the first doesn't move the latest
+        # 'modified'
+        helper.create_checkout(pilot=self.pilot, airstrip=self.base, aircraft_type=self.actype)
+
+    def assertChanges(self, change, models=REPORT_MODELS):
+        before = versions.data_version(models)
+        change()
+        after = versions.data_version(models)
+        self.assertNotEqual(before.etag, after.etag)
+        self.assertGreaterEqual(after.last_modified, before.last_modified)
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            version = versions.data_version(REPORT_MODELS)
+        self.assertEqual(version, versions.data_version(REPORT_MODELS))
+
+    def test_saves(self):
+        self.assertChanges(lambda: helper.create_checkout(pilot=self.pilot, airstrip=self.airstrip,
+                                                          aircraft_type=helper.create_aircrafttype('Name2')))
+        self.airstrip.name = 'Renamed'
+        self.assertChanges(self.airstrip.save)
+
+    def test_deletion(self):
+        self.assertChanges(self.checkout.delete)
+
+    def test_bulk_removal(self):
+        self.assertChanges(lambda: util.apply_checkout_changes(
+                                        self.pilot, remove={(self.airstrip.pk, self.actype.pk)}))
+
+    def test_bases(self):
+        self.assertChanges(lambda: self.airstrip.bases.add(self.base), models=(Airstrip,))
+
+    def test_users(self):
+        self.pilot.first_name = 'Kimberly'
+        self.assertChanges(self.pilot.save, models=(User,))
+        self.assertChanges(lambda: self.pilot.groups.clear(), models=(User,))
+
+    def test_login_ignored(self):
+        before = versions.data_version((User,))
+        self.pilot.save(update_fields=['last_login'])
+        self.assertEqual(before, versions.data_version((User,)))
+
+    def test_unrelated_model(self):
+        before = versions.data_version((Airstrip,))
+        self.checkout.delete()
+        self.assertEqual(before, versions.data_version((Airstrip,)))
+
+    def test_missing_counter(self):
+        ChangeCounter.objects.filter(name='airstrip').delete()
+        self.assertIsNone(versions.data_version((Airstrip,)))
+        versions.record_change(Airstrip)
+        self.assertIsNotNone(versions.data_version((Airstrip,)))
+
+    def test_checkout_data_bumped_on_commit(self):
+        before = versions.checkout_data_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.checkout.delete()
+            util.apply_checkout_changes(self.pilot, remove={(self.base.pk, self.actype.pk)})
+            # Not bumped inside the writers' transaction
+            self.assertEqual(versions.checkout_data_version(), before)
+        self.assertGreater(versions.checkout_data_version(), before)
@@ -1,13 +1,33 @@
-from django.contrib.auth.models import AnonymousUser, User
+import datetime
+import json
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.contrib.messages.storage.fallback import FallbackStorage
 from django.urls import reverse
-from django.http import Http404
-from django.test import TestCase, RequestFactory
+from django.http import Http404, HttpResponseForbidden
+from django.db import connection
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from checkouts.views import (
+    BaseEditAttached,
+    CheckoutEditFormView,
+    CheckoutMatrixView,
+    WeightList,
+    WeightEdit,
+    WeightChanges,
+    JobList,
     PilotList,
     PilotDetail,
+    AirstripDetail,
+    BaseList,
+    FilterFormView,
 )
 
+from checkouts.models import Checkout, Job, PilotWeight
+
 import checkouts.tests.helper as helper
 
 class PilotViewsTest(TestCase):
@@ -61,5 +81,461 @@ class PilotViewsTest(TestCase):
         helper.create_pilot(username='kimpilot')
         response = PilotDetail.as_view()(request, username='kimpilot')
         self.assertIsNotNone(response.context_data['pilot'])
-        self.assertIsNotNone(response.context_data['checkouts'])
+        self.assertIn('Checked out at 0 airstrips', response.context_data['report'])
+
+
+
+
+class BaseEditAttachedTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.scheduler = helper.create_flight_scheduler()
+        self.base = helper.create_airstrip('BS1', 'Base1', is_base=True)
+        self.airstrip1 = helper.create_airstrip('ID1', 'Airstrip1')
+        self.airstrip2 = helper.create_airstrip('ID2', 'Airstrip2')
+        self.airstrip1.bases.add(self.base)
+
+    def post(self, idents):
+        url = reverse('base_edit', kwargs={'ident': 'BS1'})
+        request = self.factory.post(url, {'airstrip': idents})
+        request.user = self.scheduler
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        response = BaseEditAttached.as_view()(request, ident='BS1')
+        return response, [str(m) for m in request._messages]
+
+    def test_post(self):
+        response, messages = self.post(['ID2', 'BS1'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.base.attached_airstrips()), [self.airstrip2])
+        self.assertEqual(response.context_data['attached'], set([self.airstrip2]))
+        self.assertEqual(messages, [
+            "Unable to set attachment for 'Base1' to itself",
+            "Attached: Airstrip2",
+            "Unattached: Airstrip1",
+        ])
+
+    def test_post_unchanged(self):
+        response, messages = self.post(['ID1'])
+        self.assertEqual(response.context_data['attached'], set([self.airstrip1]))
+        self.assertEqual(messages, ["Nothing updated; No changes necessary."])
+
+
+class CheckoutEditFormViewTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.pilot = helper.create_pilot()
+        self.airstrip = helper.create_airstrip('ID1', 'Airstrip1')
+        self.actype1 = helper.create_aircrafttype('Name1')
+        self.actype2 = helper.create_aircrafttype('Name2')
+        helper.create_checkout(pilot=self.pilot, airstrip=self.airstrip, aircraft_type=self.actype1)
+
+    def post(self, action):
+        data = {
+            'pilot': self.pilot.pk,
+            'airstrip': self.airstrip.pk,
+            'aircraft_type': [self.actype1.pk, self.actype2.pk],
+            'action': action,
+        }
+        request = self.factory.post(reverse('checkout_edit'), data)
+        request.user = self.pilot
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        response = CheckoutEditFormView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return [str(m) for m in request._messages]
+
+    def test_add(self):
+        messages = self.post('Add Checkout')
+        self.assertEqual(messages, [
+            "Already exists: 'Pilot, Kim is checked out at ID1 (Airstrip1) in a Name1'",
+            "Added 'Pilot, Kim is checked out at ID1 (Airstrip1) in a Name2'",
+        ])
+        self.assertEqual(Checkout.objects.count(), 2)
+
+    def test_remove(self):
+        messages = self.post('Remove Checkout')
+        self.assertEqual(messages, [
+            "Deleted 'Pilot, Kim is checked out at ID1 (Airstrip1) in a Name1'",
+            "Deleted 'Pilot, Kim is checked out at ID1 (Airstrip1) in a Name2'",
+        ])
+        self.assertEqual(Checkout.objects.count(), 0)
+
+
+class CheckoutMatrixViewTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.pilot = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        self.other = helper.create_pilot('sam', 'Sam', 'Pilot2')
+        self.scheduler = helper.create_flight_scheduler('fred', 'Fred', 'Scheduler')
+        self.actype1 = helper.create_aircrafttype('Name1')
+        self.actype2 = helper.create_aircrafttype('Name2')
+        self.airstrips = [helper.create_airstrip('ID%d' % i, 'Airstrip%d' % i) for i in range(1, 4)]
+        helper.create_checkout(pilot=self.pilot, airstrip=self.airstrips[0], aircraft_type=self.actype1)
+
+    def post(self, user, changes):
+        request = self.factory.post(
+                    reverse('checkout_matrix'),
+                    json.dumps(changes),
+                    content_type='application/json')
+        request.user = user
+        response = CheckoutMatrixView.as_view()(request)
+        return response, json.loads(response.content.decode('utf-8'))
+
+    def held(self, pilot):
+        return set(Checkout.objects.filter(pilot=pilot).values_list('airstrip__ident', 'aircraft_type__name'))
+
+    def test_get(self):
+        request = self.factory.get(reverse('checkout_matrix'))
+        request.user = self.pilot
+        response = CheckoutMatrixView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context_data['pilots'], [self.pilot])
+        self.assertEqual(response.context_data['aircraft_types'], ['Name1', 'Name2'])
+        self.assertEqual(response.context_data['rows'][0],
+                         ('ID1', 'Airstrip1', [(self.actype1.pk, True), (self.actype2.pk, False)]))
+
+    def test_apply_change_set(self):
+        response, diff = self.post(self.pilot, {
+            'pilot': 'kim',
+            'add': [['ID2', self.actype1.pk], ['ID3', self.actype2.pk], ['ID3', self.actype1.pk]],
+            'remove': [['ID1', self.actype1.pk], ['ID1', self.actype2.pk]],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(diff, {
+            'pilot': 'kim',
+            'added': [['ID2', self.actype1.pk], ['ID3', self.actype1.pk], ['ID3', self.actype2.pk]],
+            'removed': [['ID1', self.actype1.pk]],
+            'unchanged': 1,
+        })
+        self.assertEqual(self.held(self.pilot), set([('ID2', 'Name1'), ('ID3', 'Name1'), ('ID3', 'Name2')]))
+
+    def test_scheduler_may_edit_others(self):
+        response, diff = self.post(self.scheduler, {'pilot': 'sam', 'add': [['ID1', self.actype2.pk]]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.held(self.other), set([('ID1', 'Name2')]))
+
+    def test_permissions(self):
+        response, _ = self.post(self.pilot, {'pilot': 'sam', 'add': [['ID1', self.actype2.pk]]})
+        self.assertEqual(response.status_code, 403)
+        regular = User.objects.create_user(username='user', password='pass')
+        response, _ = self.post(regular, {'pilot': 'user', 'add': [['ID1', self.actype2.pk]]})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.held(self.other), set())
+
+    def test_invalid_change_sets(self):
+        for changes in [
+                {'add': [['ID1', self.actype2.pk]]},
+                {'pilot': 'kim', 'add': [['ID1']]},
+                {'pilot': 'kim', 'add': [['ID1', self.actype2.pk]], 'remove': [['ID1', self.actype2.pk]]},
+                {'pilot': 'kim', 'add': [['ID9', self.actype2.pk]]},
+                {'pilot': 'kim', 'add': [['ID1', 'Name2']]},
+                {'pilot': 'kim', 'add': [['ID1', self.actype2.pk + 100]]},
+                {'pilot': 'fred', 'add': [['ID1', self.actype2.pk]]},
+            ]:
+            response, diff = self.post(self.scheduler, changes)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', diff)
+        self.assertEqual(self.held(self.pilot), set([('ID1', 'Name1')]))
+
+    def test_duplicate_aircraft_type_names(self):
+        twin = helper.create_aircrafttype('Name2')
+        response, diff = self.post(self.pilot, {'pilot': 'kim', 'add': [['ID1', twin.pk]]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(diff['added'], [['ID1', twin.pk]])
+        self.assertEqual(list(Checkout.objects.filter(pilot=self.pilot, aircraft_type__name='Name2')
+                                              .values_list('aircraft_type', flat=True)), [twin.pk])
+
+    def test_query_count_independent_of_size(self):
+        def queries(cells):
+            Checkout.objects.filter(pilot=self.other).delete()
+            with CaptureQueriesContext(connection) as context:
+                self.post(self.scheduler, {'pilot': 'sam', 'add': cells})
+            return len(context.captured_queries)
+
+        self.assertTrue(self.scheduler.is_flight_scheduler) # Loads the roles
+        small = queries([['ID1', self.actype1.pk]])
+        large = queries([['ID%d' % i, pk] for i in range(1, 4) for pk in (self.actype1.pk, self.actype2.pk)])
+        self.assertEqual(small, large)
+
+
+class WeightListTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.scheduler = helper.create_flight_scheduler()
+
+    def get(self, user):
+        request = self.factory.get(reverse('weight_list'))
+        request.user = user
+        return WeightList.as_view()(request)
+
+    def test_weights(self):
+        kim = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        sam = helper.create_pilot('sam', 'Sam', 'Pilot2')
+        PilotWeight.objects.create(pilot=sam, weight=80)
+
+        response = self.get(self.scheduler)
+        self.assertEqual(response.context_data['pilotweight_list'], [(kim, 0), (sam, 80)])
+
+        response = self.get(sam)
+        self.assertEqual(response.context_data['pilotweight_list'], [(sam, 80)])
+
+    def test_forbidden(self):
+        regular = User.objects.create_user(username='user', password='pass')
+        with mock.patch('checkouts.views.render', return_value=HttpResponseForbidden()) as render:
+            response = self.get(regular)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(render.call_args[0][1], '403.html')
+
+    def test_query_budget(self):
+        """The query count doesn't depend on the number of pilots"""
+        pilots_group, _ = Group.objects.get_or_create(name='Pilots')
+        User.objects.bulk_create([
+            User(username='pilot%04d' % i, first_name='First%04d' % i, last_name='Last%04d' % i)
+            for i in range(1000)
+        ])
+        pilots = list(User.objects.filter(username__startswith='pilot'))
+        Membership = User.groups.through
+        Membership.objects.bulk_create([Membership(user=p, group=pilots_group) for p in pilots])
+        PilotWeight.objects.bulk_create([PilotWeight(pilot=p, weight=70) for p in pilots[::2]])
+
+        # One query for the scheduler's roles, one for the pilots and weights
+        with self.assertNumQueries(2):
+            response = self.get(self.scheduler)
+        weights = response.context_data['pilotweight_list']
+        self.assertEqual(len(weights), 1000)
+        self.assertEqual(sum(weight for _, weight in weights), 500 * 70)
+
+
+class WeightEditTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.pilot = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        PilotWeight.objects.create(pilot=self.pilot, weight=80)
+
+    def post(self, weight):
+        path = reverse('weight_edit', kwargs={'pilot': self.pilot.username})
+        request = self.factory.post(path, {'weight': weight})
+        request.user = self.pilot
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        return WeightEdit.as_view()(request, pilot=self.pilot.username)
+
+    @override_settings(BACKGROUND_JOBS=True)
+    def test_work_is_queued(self):
+        with mock.patch('checkouts.util.export_pilotweights') as export:
+            response = self.post(75)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(export.called)
+
+        queued = Job.objects.filter(status=Job.QUEUED).order_by('pk')
+        self.assertEqual([(j.name, j.arguments) for j in queued], [
+            ('export_pilotweights', {}),
+            ('notify_pilotweight_update', {'pilotweight_id': self.pilot.pilotweight.pk, 'weight': 75}),
+        ])
+
+        # Saving the same weight republishes without another notification
+        Job.objects.all().delete()
+        self.post(75)
+        self.assertEqual(list(Job.objects.values_list('name', flat=True)), ['export_pilotweights'])
+
+    @override_settings(BACKGROUND_JOBS=True, PILOTWEIGHTS_EXPORT_DELAY=30)
+    def test_exports_coalesced(self):
+        self.post(75)
+        self.post(76)
+        self.post(77)
+        self.assertEqual(Job.objects.filter(name='export_pilotweights').count(), 1)
+        self.assertEqual(Job.objects.filter(name='notify_pilotweight_update').count(), 3)
+        export = Job.objects.get(name='export_pilotweights')
+        self.assertGreater(export.run_after, export.created)
+
+
+class JobListTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def get(self, user):
+        request = self.factory.get(reverse('job_list'))
+        request.user = user
+        return JobList.as_view()(request)
+
+    def test_status(self):
+        Job.objects.create(name='export_pilotweights', status=Job.DONE)
+        failed = Job.objects.create(name='export_pilotweights', status=Job.FAILED, last_error='Traceback')
+        response = self.get(helper.create_flight_scheduler())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context_data['counts'], [('Queued', 0), ('Running', 0), ('Done', 1), ('Failed', 1)])
+        self.assertEqual(list(response.context_data['failing']), [failed])
+        self.assertEqual(len(response.context_data['job_list']), 2)
+
+    def test_forbidden(self):
+        pilot = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        with mock.patch('checkouts.views.render', return_value=HttpResponseForbidden()):
+            response = self.get(pilot)
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(EXPORT_PREFIX='secret')
+class WeightChangesTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        pilot = helper.create_pilot('kim', 'Kim & Co', 'Pilot1')
+        pilotweight = PilotWeight.objects.create(pilot=pilot, weight=80)
+        PilotWeight.objects.filter(pk=pilotweight.pk).update(modified=timezone.now() - datetime.timedelta(minutes=1))
+
+    def get(self, prefix, format, **params):
+        request = self.factory.get(reverse('weight_changes', kwargs={'prefix': prefix, 'format': format}), params)
+        return WeightChanges.as_view()(request, prefix=prefix, format=format)
+
+    def test_json(self):
+        response = self.get('secret', 'json')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        document = json.loads(response.content)
+        self.assertEqual([p['username'] for p in document['pilots']], ['kim'])
+        self.assertFalse(document['more'])
+
+        document = json.loads(self.get('secret', 'json', cursor=document['cursor']).content)
+        self.assertEqual(document['pilots'], [])
+
+    def test_xml_escaped(self):
+        response = self.get('secret', 'xml')
+        self.assertEqual(response['Content-Type'], 'application/xml')
+        self.assertIn(b'<firstname>Kim &amp; Co</firstname>', response.content)
+
+    def test_wrong_prefix(self):
+        with self.assertRaises(Http404):
+            self.get('guess', 'json')
+
+    def test_bad_request(self):
+        self.assertEqual(self.get('secret', 'json', cursor='junk').status_code, 400)
+        self.assertEqual(self.get('secret', 'json', limit='0').status_code, 400)
+
+
+class FilterFormViewTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.pilot = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        self.base = helper.create_airstrip('BS1', 'Base1', is_base=True)
+        self.airstrip = helper.create_airstrip('ID1', 'Airstrip1')
+        self.airstrip.bases.add(self.base)
+        helper.create_checkout(pilot=self.pilot, airstrip=self.airstrip)
+
+    def get(self, query):
+        request = self.factory.get(reverse('checkout_filter') + query)
+        request.user = self.pilot
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        return FilterFormView.as_view()(request)
+
+    def test_fresh_form(self):
+        response = self.get('')
+        self.assertFalse(response.context_data['form'].is_bound)
+        self.assertNotIn('report', response.context_data)
+
+    def test_results(self):
+        response = self.get('?pilot=kim&base=BS1&checkout_status=sudah')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Found 1 matching record', response.context_data['report'])
+
+    def test_redirects_to_canonical_url(self):
+        response = self.get('?checkout_status=sudah&aircraft_type=&base=BS1&airstrip=&pilot=kim')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], '/checkouts/?pilot=kim&base=BS1&checkout_status=sudah')
+
+    def test_post_redirects(self):
+        request = self.factory.post(reverse('checkout_filter'), {
+            'pilot': 'kim', 'airstrip': '', 'checkout_status': 'belum',
+        })
+        request.user = self.pilot
+        response = FilterFormView.as_view()(request)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], '/checkouts/?pilot=kim&checkout_status=belum')
+
+    def test_invalid(self):
+        response = self.get('?pilot=nobody&checkout_status=sudah')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('pilot', response.context_data['form'].errors)
+        self.assertNotIn('report', response.context_data)
+
+    @override_settings(CONDITIONAL_REPORTS=True, CHECKOUT_FILTER_MAX_AGE=60)
+    def test_cache_headers(self):
+        response = self.get('?checkout_status=sudah')
+        self.assertTrue(response.has_header('ETag'))
+        self.assertIn('max-age=60', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(response['X-Accel-Expires'], '60')
+
+        # The form itself is always revalidated
+        response = self.get('')
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertFalse(response.has_header('X-Accel-Expires'))
+
+
+@override_settings(CONDITIONAL_REPORTS=True)
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.pilot = helper.create_pilot('kim', 'Kim', 'Pilot1')
+        self.airstrip = helper.create_airstrip('ID1', 'Airstrip1')
+        self.checkout = helper.create_checkout(pilot=self.pilot, airstrip=self.airstrip)
+
+    def request(self, url, user=None, message=None, **headers):
+        request = self.factory.get(url, **headers)
+        request.user = user or self.pilot
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        if message:
+            request._messages.add(20, message)
+        return request
+
+    def detail(self, **kwargs):
+        request = self.request(reverse('airstrip_detail', kwargs={'ident': 'ID1'}), **kwargs)
+        return AirstripDetail.as_view()(request, ident='ID1')
+
+    def test_not_modified(self):
+        response = self.detail()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+
+        with mock.patch('checkouts.util.airstrip_checkouts_grouped_by_pilot') as report:
+            with self.assertNumQueries(1):
+                response = self.detail(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        report.assert_not_called()
+
+    def test_if_modified_since(self):
+        response = self.detail()
+        response = self.detail(HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_changed_data(self):
+        etag = self.detail()['ETag']
+        self.checkout.delete()
+        response = self.detail(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_per_user(self):
+        etag = self.detail()['ETag']
+        scheduler = helper.create_flight_scheduler()
+        self.assertEqual(self.detail(user=scheduler, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pending_messages(self):
+        etag = self.detail()['ETag']
+        response = self.detail(message='Saved', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_base_attachments(self):
+        base = helper.create_airstrip('BS1', 'Base1', is_base=True)
+        etag = BaseList.as_view()(self.request(reverse('base_list')))['ETag']
+        self.airstrip.bases.add(base)
+        response = BaseList.as_view()(self.request(reverse('base_list'), HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 200)
 
+    @override_settings(CONDITIONAL_REPORTS=False)
+    def test_disabled(self):
+        self.assertFalse(self.detail().has_header('ETag'))
@@ -1,17 +1,32 @@
 import datetime
-import json
 import logging
 import os
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 import requests
 
-from .models import AircraftType, Airstrip, Checkout, PilotWeight
+from .models import AircraftType, Airstrip, Checkout, PilotWeight, format_full_name
+from . import coverage, exports, summary, vectorized, versions
 
 # ISO 8601 YYYY-MM-DDTHH:MM:SS
 DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
 
+# The precedent map is invalidated by signals, but in case something slips
+# past them (e.g. a raw SQL update) it'll still expire on its own.
+PRECEDENTED_CACHE_KEY = 'checkouts:precedented'
+PRECEDENTED_CACHE_TIMEOUT = 60 * 60
+BASE_COUNTS_CACHE_KEY = 'checkouts:base_counts'
+BASE_COUNTS_CACHE_TIMEOUT = 60 * 60
+
+# Seconds to wait for the Mailgun API (to connect, and then between bytes)
+MAILGUN_TIMEOUT = 10
+
 
 logger = logging.getLogger(__name__)
 
@@ -50,34 +65,144 @@ def get_bases():
     return Airstrip.objects.filter(is_base=True).order_by('ident')
 
 
+def get_base_counts(use_cache=True):
+    """Provides a list of (base, attached count, unattached count) tuples, one
+    for each base, as shown on the bases page.
+    
+    Built from a single query: the number of attached airstrips is counted per
+    base and the total number of airstrips comes from a subquery, so the
+    unattached count is the total less the attached airstrips and the base
+    itself (unless the base is attached to itself, in which case it's already
+    among the attached). Unless use_cache is False, a copy is kept in the cache
+    between requests when the workers share it (settings.SHARED_CACHE); it's
+    invalidated whenever airstrips or the attachments between airstrips and
+    bases change (see checkouts.signals).
+    """
+    use_cache = use_cache and settings.SHARED_CACHE
+    if use_cache:
+        counts = cache.get(BASE_COUNTS_CACHE_KEY)
+        if counts is not None:
+            return counts
+    
+    # Grouping by a constant aggregates over the whole table
+    total = Airstrip.objects.order_by().annotate(
+                all=Value(1)
+            ).values('all').annotate(count=Count('pk')).values('count')
+    bases = get_bases().annotate(
+                attached=Count('airstrip'),
+                self_attached=Count('airstrip', filter=Q(airstrip=F('pk'))),
+                total=Subquery(total)
+            )
+    counts = []
+    for base in bases:
+        unattached = base.total - base.attached - (0 if base.self_attached else 1)
+        counts.append((base, base.attached, unattached))
+    
+    if use_cache:
+        cache.set(BASE_COUNTS_CACHE_KEY, counts, BASE_COUNTS_CACHE_TIMEOUT)
+    return counts
+
+
+def invalidate_base_counts():
+    """Discards the cached copy of get_base_counts right away, and again once
+    the change is committed: another worker could re-cache the old counts in
+    between."""
+    cache.delete(BASE_COUNTS_CACHE_KEY)
+    transaction.on_commit(lambda: cache.delete(BASE_COUNTS_CACHE_KEY))
+
+
+def set_attached_airstrips(base, idents):
+    """Makes the airstrips with the given idents the full set of airstrips
+    attached to 'base', and returns a summary of the changes:
+    
+    changes = {
+        'attached': [Airstrip, ...],   # newly attached
+        'detached': [Airstrip, ...],   # no longer attached
+        'rejected': [Airstrip, ...],   # the base itself; it can't be newly
+                                       # attached to itself
+        'current':  [Airstrip, ...],   # attached once the changes are made
+    }
+    
+    Each list is ordered by ident. The current and proposed attachments are
+    compared as sets of ids, and the changes are made with a single insert and
+    a single delete on the through table, inside one transaction.
+    """
+    with transaction.atomic():
+        current = list(base.attached_airstrips())
+        proposed = list(Airstrip.objects.filter(ident__in=idents).order_by('ident'))
+        current_ids = set(airstrip.pk for airstrip in current)
+        proposed_ids = set(airstrip.pk for airstrip in proposed)
+        
+        rejected = [a for a in proposed if a.pk == base.pk and a.pk not in current_ids]
+        attached = [a for a in proposed if a.pk not in current_ids and a.pk != base.pk]
+        detached = [a for a in current if a.pk not in proposed_ids]
+        
+        if attached:
+            base.airstrip_set.add(*attached)
+        if detached:
+            base.airstrip_set.remove(*detached)
+    
+    detached_ids = set(airstrip.pk for airstrip in detached)
+    remaining = [airstrip for airstrip in current if airstrip.pk not in detached_ids]
+    return {
+        'attached': attached,
+        'detached': detached,
+        'rejected': rejected,
+        'current': sorted(remaining + attached, key=lambda airstrip: airstrip.ident),
+    }
+
+
 def get_aircrafttype_names(order="sorted_position"):
-    """Populates a sorted list with the names of all known AircraftTypes"""
-    aircrafttypes = AircraftType.objects.order_by(order)
+    """Populates a sorted list with the names of all known AircraftTypes
+    
+    Ties (sorted_position defaults to 0) are broken by name and then by pk so
+    that every call returns the same order: the records' cells are matched up
+    with the report's columns by position.
+    """
+    aircrafttypes = AircraftType.objects.order_by(order, 'name', 'pk')
     return [actype.name for actype in aircrafttypes]
 
 
-def get_pilot_airstrip_pairs(pilot=None, airstrip=None, base=None, **kwargs):
-    """Populates a sorted list of Pilot/Airstrip tuples"""
+def get_pilot_names(pilot=None, **kwargs):
+    """Returns an ordered dictionary of pilot usernames to full names, limited
+    to the given pilot if one is provided"""
     pilots = get_pilots()
     if pilot is not None:
-        # Limiting to the requested object and maintaining iterability
-        pilots = [pilots.get(pk=pilot.pk),]
+        pilots = pilots.filter(pk=pilot.pk)
+    rows = pilots.values_list('username', 'first_name', 'last_name')
+    return {username: format_full_name(username, first_name, last_name)
+            for username, first_name, last_name in rows}
+
+
+def get_airstrip_names(airstrip=None, base=None, **kwargs):
+    """Returns an ordered dictionary of airstrip idents to names, limited to
+    the given airstrip or to the airstrips attached to the given base"""
     airstrips = Airstrip.objects.all().order_by('ident')
     if airstrip is not None:
-        # Limiting to the requested object and maintaining iterability
-        airstrips = [airstrips.get(pk=airstrip.pk),]
+        airstrips = airstrips.filter(pk=airstrip.pk)
     elif base is not None:
         airstrips = airstrips.filter(bases=base)
+    return dict(airstrips.values_list('ident', 'name'))
+
+
+def get_pilot_airstrip_pairs(pilot=None, airstrip=None, base=None, pilot_names=None, airstrip_names=None, **kwargs):
+    """Lazily produces the sorted Pilot/Airstrip tuples
     
-    pairs = []
-    for p in pilots:
-        for a in airstrips:
-            pairs.append((p.username, a.ident))
+    Callers which have already loaded the pilot and airstrip dimensions (see
+    get_pilot_names and get_airstrip_names) may pass them in to avoid loading
+    them a second time.
+    """
+    if pilot_names is None:
+        pilot_names = get_pilot_names(pilot=pilot)
+    if airstrip_names is None:
+        airstrip_names = get_airstrip_names(airstrip=airstrip, base=base)
     
-    return pairs
+    for username in pilot_names:
+        for ident in airstrip_names:
+            yield (username, ident)
 
 
-def get_precedented_checkouts():
+def get_precedented_checkouts(use_cache=True):
     """Provides a two-tier dictionary summarizing whether each airstrip has an
     existing checkout entry for each aircraft.
     
@@ -86,26 +211,132 @@ def get_precedented_checkouts():
             'actype': True,
         },
     }
+    
+    Built from a single DISTINCT query. Unless use_cache is False, a copy is
+    kept in the cache between requests when the workers share it
+    (settings.SHARED_CACHE); it's invalidated whenever checkouts, airstrips,
+    or aircraft types change (see checkouts.signals). When the coverage
+    tensor is enabled the map is derived from it instead.
     """
-    precedented = {}
+    use_cache = use_cache and settings.SHARED_CACHE
+    tensor = coverage.load()
+    if tensor is not None:
+        return tensor.precedented()
+    
+    if use_cache:
+        precedented = cache.get(PRECEDENTED_CACHE_KEY)
+        if precedented is not None:
+            return precedented
     
-    actypes = AircraftType.objects.all()
-    for actype in actypes:
-        checkouts = Checkout.objects.filter(aircraft_type=actype).select_related('airstrip')
-        airstrips = []
-        for c in checkouts:
-            if c.airstrip not in airstrips:
-                airstrips.append(c.airstrip)
-        for a in airstrips:
-            if a.ident not in precedented:
-                precedented[a.ident] = {}
-            precedented[a.ident][actype.name] = True
+    precedented = {}
+    pairs = Checkout.objects.order_by().values_list(
+                'airstrip__ident',
+                'aircraft_type__name'
+            ).distinct()
+    for ident, actype in pairs:
+        if ident not in precedented:
+            precedented[ident] = {}
+        precedented[ident][actype] = True
     
+    if use_cache:
+        cache.set(PRECEDENTED_CACHE_KEY, precedented, PRECEDENTED_CACHE_TIMEOUT)
     return precedented
 
 
-def checkout_filter(pilot=None, airstrip=None, base=None, aircraft_type=None, **kwargs):
-    """Core function for collecting a set of checkout objects"""
+def invalidate_precedented_checkouts():
+    """Discards the cached copy of get_precedented_checkouts right away, and
+    again once the change is committed: another worker could re-cache the
+    old checkouts in between."""
+    cache.delete(PRECEDENTED_CACHE_KEY)
+    transaction.on_commit(lambda: cache.delete(PRECEDENTED_CACHE_KEY))
+
+
+class CheckoutRecord(object):
+    """A single pilot/airstrip row of a checkout report
+    
+    'aircraft_types' is the report's list of aircraft type names, shared by
+    all of its rows, and 'cells' holds the status for each of them in the
+    same order, so the display_checkouts template can simply iterate over
+    the cells. Reports can run to many thousands of rows, hence __slots__
+    and a list rather than a dictionary per row.
+    """
+    __slots__ = ('pilot_name', 'pilot_slug', 'airstrip_ident', 'airstrip_name', 'aircraft_types', 'cells')
+    
+    def __init__(self, pilot_name, pilot_slug, airstrip_ident, airstrip_name, aircraft_types, cells):
+        self.pilot_name = pilot_name
+        self.pilot_slug = pilot_slug
+        self.airstrip_ident = airstrip_ident
+        self.airstrip_name = airstrip_name
+        self.aircraft_types = aircraft_types
+        self.cells = cells
+    
+    def __getitem__(self, name):
+        # The template engine tries a subscript before an attribute, and a
+        # failed subscript (i.e. an exception) per lookup costs more than
+        # the lookup itself
+        try:
+            return getattr(self, name)
+        except (AttributeError, TypeError):
+            raise KeyError(name)
+    
+    def status(self, name):
+        """The status of the named aircraft type"""
+        return self.cells[self.aircraft_types.index(name)]
+    
+    def as_dict(self):
+        """The record in the form reports had before CheckoutRecord, with the
+        statuses keyed by aircraft type name"""
+        return {
+            'pilot_name': self.pilot_name,
+            'pilot_slug': self.pilot_slug,
+            'airstrip_ident': self.airstrip_ident,
+            'airstrip_name': self.airstrip_name,
+            'actypes': dict(zip(self.aircraft_types, self.cells)),
+        }
+    
+    def __eq__(self, other):
+        if not isinstance(other, CheckoutRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+    
+    __hash__ = None
+    
+    def __repr__(self):
+        return 'CheckoutRecord(%s)' % ', '.join(repr(getattr(self, name)) for name in self.__slots__)
+
+
+def checkout_record(pilot_name, pilot_slug, airstrip_ident, airstrip_name, actypes, status):
+    """Builds a single pilot/airstrip record as expected by the
+    display_checkouts template, with every aircraft type set to 'status'.
+    'actypes' should be the same list for every record of a report."""
+    return CheckoutRecord(pilot_name, pilot_slug, airstrip_ident, airstrip_name, actypes, [status] * len(actypes))
+
+
+def aircrafttype_positions(actypes):
+    """Maps each aircraft type name to its position in a record's cells"""
+    return dict((name, position) for position, name in enumerate(actypes))
+
+
+def checkout_filter(pilot=None, airstrip=None, base=None, aircraft_type=None, actypes=None, **kwargs):
+    """Core function for collecting a set of checkout records
+    
+    The records' cells follow 'actypes', which should be the aircraft type
+    names the report shows as its columns. When it isn't given they're looked
+    up (see get_aircrafttype_names).
+    
+    Only the columns needed for display are retrieved (as tuples, from a single
+    ordered query), and consecutive rows for the same pilot/airstrip pair are
+    grouped together in one pass over the results.
+    
+    When settings.CHECKOUT_SUMMARY_TABLE is enabled the records are read from
+    the summary table instead (see checkouts.summary), which already holds one
+    row per pair.
+    """
+    if settings.CHECKOUT_SUMMARY_TABLE:
+        results = summary.checkout_filter(pilot, airstrip, base, aircraft_type, actypes)
+        if results is not None:
+            return results
+    
     core_query = Checkout.objects.all()
     if pilot != None:
         core_query = core_query.filter(pilot=pilot)
@@ -116,64 +347,69 @@ def checkout_filter(pilot=None, airstrip=None, base=None, aircraft_type=None, **
     if aircraft_type != None:
         core_query = core_query.filter(aircraft_type=aircraft_type)
         
-    checkouts = core_query.select_related(
-                    'pilot', 'airstrip', 'aircraft_type'
-                ).order_by(
-                    'pilot__last_name',
-                    'pilot__first_name',
-                    'airstrip__ident',
-                    'aircraft_type__name'
-                )
-    if aircraft_type:
-        actypes = [aircraft_type.name,] # List for iterability
-    else:
-        actypes = get_aircrafttype_names()
+    rows = core_query.order_by(
+                'pilot__last_name',
+                'pilot__first_name',
+                'airstrip__ident',
+                'aircraft_type__name'
+            ).values_list(
+                'pilot__username',
+                'pilot__first_name',
+                'pilot__last_name',
+                'airstrip__ident',
+                'airstrip__name',
+                'aircraft_type__name'
+            )
+    if actypes is None:
+        if aircraft_type:
+            actypes = [aircraft_type.name,] # List for iterability
+        else:
+            actypes = get_aircrafttype_names()
+    positions = aircrafttype_positions(actypes)
     results = []
-    for c in checkouts:
-        if results:
-            r = results.pop()
-            if r['pilot_slug'] == c.pilot.username and r['airstrip_ident'] == c.airstrip.ident:
-                r['actypes'][c.aircraft_type.name] = CHECKOUT_SUDAH
-                results.append(r)
-                continue
-            else:
-                # Put the unmodified record back in the list before creating
-                # the new record
-                results.append(r)
-                
-        r = {
-            'pilot_name': c.pilot.full_name,
-            'pilot_slug': c.pilot.username,
-            'airstrip_ident': c.airstrip.ident,
-            'airstrip_name': c.airstrip.name,
-            'actypes': {},
-        }
-        for actype in actypes:
-            if actype == c.aircraft_type.name:
-                # Mark the entry for the current checkout aircraft during init
-                r['actypes'][actype] = CHECKOUT_SUDAH
-            else:
-                r['actypes'][actype] = CHECKOUT_BELUM
-        
-        results.append(r)
+    current_pair = None
+    for username, first_name, last_name, ident, airstrip_name, actype in rows.iterator():
+        if (username, ident) != current_pair:
+            current_pair = (username, ident)
+            r = checkout_record(
+                    format_full_name(username, first_name, last_name),
+                    username,
+                    ident,
+                    airstrip_name,
+                    actypes,
+                    CHECKOUT_BELUM)
+            results.append(r)
+        r.cells[positions[actype]] = CHECKOUT_SUDAH
     return results
 
 
 def sudah_selesai(**kwargs):
     """Gathers complete checkouts and returns them in a dictionary format as
-    expected by the display_checkouts template."""
+    expected by the display_checkouts template.
+    
+    Answered from the coverage tensor (without touching the database) when
+    settings.CHECKOUT_COVERAGE_FILE is set.
+    """
+    tensor = coverage.load()
     if 'aircraft_type' in kwargs and kwargs['aircraft_type']:
         actypes = [kwargs['aircraft_type'].name, ]
+    elif tensor is not None:
+        actypes = tensor.aircrafttype_names()
     else:
         actypes = get_aircrafttype_names()
     
+    if tensor is not None:
+        checkouts = tensor.checkout_filter(actypes, **kwargs)
+    else:
+        checkouts = checkout_filter(actypes=actypes, **kwargs)
+    
     results = {
         'populate': {
             'pilot': True,
             'airstrip': True,
         },
         'aircraft_types': actypes,
-        'results': checkout_filter(**kwargs),
+        'results': checkouts,
     }
     
     return results
@@ -181,7 +417,15 @@ def sudah_selesai(**kwargs):
 
 def belum_selesai(**kwargs):
     """Gathers incomplete checkouts and returns them in a dictionary format as
-    expected by the display_checkouts template."""
+    expected by the display_checkouts template.
+    
+    When settings.CHECKOUT_COVERAGE_FILE is set the report is answered from
+    the coverage tensor. Otherwise, when settings.BELUM_SELESAI_IN_DATABASE is
+    enabled and the database is PostgreSQL, the gap computation is pushed into
+    the database (see belum_selesai_database). Failing both, it's done in
+    python: with NumPy arrays if settings.VECTORIZED_BELUM_SELESAI is enabled
+    and NumPy is installed, or with plain loops.
+    """
     results = {
         'populate': {
             'pilot': True,
@@ -189,90 +433,331 @@ def belum_selesai(**kwargs):
         },
     }
     
-    original_checkouts = checkout_filter(**kwargs)
+    tensor = coverage.load()
     if 'aircraft_type' in kwargs and kwargs['aircraft_type']:
         actypes = [kwargs['aircraft_type'].name, ]
+    elif tensor is not None:
+        actypes = tensor.aircrafttype_names()
     else:
         actypes = get_aircrafttype_names()
     results['aircraft_types'] = actypes
-    pilots_v_airstrips = get_pilot_airstrip_pairs(**kwargs)
-    next_pair_index = 0
-    
-    belum_selesai_checkouts = []
-    for c in original_checkouts:
-        current_pair = (c['pilot_slug'], c['airstrip_ident'])
-        expected_pair = pilots_v_airstrips[next_pair_index]
-        while current_pair != expected_pair:
-            # Need to insert the missing pair
-            pilot_slug, airstrip_ident = expected_pair
-            pilot = User.objects.get(username=pilot_slug)
-            airstrip = Airstrip.objects.get(ident=airstrip_ident)
-            new_result = {
-                'pilot_name': pilot.full_name,
-                'pilot_slug': pilot_slug,
-                'airstrip_ident': airstrip_ident,
-                'airstrip_name': airstrip.name,
-                'actypes': {},
-            }
-            for actype in actypes:
-                new_result['actypes'][actype] = CHECKOUT_BELUM
-            
-            belum_selesai_checkouts.append(new_result)
-            
-            # Still missing a Pilot/Airstrip pair?
-            next_pair_index += 1
-            expected_pair = pilots_v_airstrips[next_pair_index]
-        
-        belum_selesai_checkouts.append(c)
-        # Prepare for the next check
-        next_pair_index += 1
-    
-    if next_pair_index != len(pilots_v_airstrips):
-        # Still some missing pairs
-        for i in range(next_pair_index, len(pilots_v_airstrips)):
-            expected_pair = pilots_v_airstrips[i]
-            pilot_slug, airstrip_ident = expected_pair
-            pilot = User.objects.get(username=pilot_slug)
-            airstrip = Airstrip.objects.get(ident=airstrip_ident)
-            new_result = {
-                'pilot_name': pilot.full_name,
-                'pilot_slug': pilot_slug,
-                'airstrip_ident': airstrip_ident,
-                'airstrip_name': airstrip.name,
-                'actypes': {},
-            }
-            for actype in actypes:
-                new_result['actypes'][actype] = CHECKOUT_BELUM
-            
-            belum_selesai_checkouts.append(new_result)
     
+    if tensor is not None:
+        results['results'] = tensor.belum_selesai(actypes, **kwargs)
+    elif settings.BELUM_SELESAI_IN_DATABASE and connection.vendor == 'postgresql':
+        results['results'] = belum_selesai_database(actypes, **kwargs)
+    elif settings.VECTORIZED_BELUM_SELESAI and vectorized.numpy is not None:
+        results['results'] = vectorized.belum_selesai(actypes, **kwargs)
+    else:
+        results['results'] = belum_selesai_python(actypes, **kwargs)
+    return results
+
+
+def belum_selesai_python(actypes, **kwargs):
+    """Builds the belum selesai records for the given aircraft type names.
+    
+    Runs a fixed number of queries no matter how many pilots and airstrips
+    are involved: the pilot and airstrip dimensions are loaded once, and the
+    missing pairs are filled in by walking the ordered pair space against the
+    sudah selesai records.
+    """
+    sudah = {}
+    for c in checkout_filter(actypes=actypes, **kwargs):
+        sudah[(c.pilot_slug, c.airstrip_ident)] = c
+    
+    pilot_names = get_pilot_names(**kwargs)
+    airstrip_names = get_airstrip_names(**kwargs)
     precedented = get_precedented_checkouts()
+    
+    # If an airstrip doesn't have any existing checkouts, then we're not going
+    # to show it as a 'belum selesai' airstrip.
+    for ident in airstrip_names:
+        if ident not in precedented:
+            logger.debug("Dropping %s: airstrip is globally unprecedented" % ident)
+    
+    pairs = get_pilot_airstrip_pairs(
+                pilot_names=pilot_names,
+                airstrip_names=airstrip_names,
+                **kwargs)
+    
     checkouts = []
-    for c in belum_selesai_checkouts:
-        ident = c['airstrip_ident']
+    for pair in pairs:
+        pilot_slug, ident = pair
+        if ident not in precedented:
+            continue
+        
+        c = sudah.get(pair)
+        if c is None:
+            # Need to insert the missing pair
+            c = checkout_record(
+                    pilot_names[pilot_slug],
+                    pilot_slug,
+                    ident,
+                    airstrip_names[ident],
+                    actypes,
+                    CHECKOUT_BELUM)
+        
         incomplete = False
-        unprecedented_count = 0
-        for ac, status in c['actypes'].items():
+        airstrip_precedents = precedented[ident]
+        for position, status in enumerate(c.cells):
             if status == CHECKOUT_BELUM:
                 incomplete = True
                 # A Belum should be changed to Unprecedented when no pilot has
                 # been checked out at the given location in the given AircraftType
-                if ident not in precedented or ac not in precedented[ident]:
-                    c['actypes'][ac] = CHECKOUT_UNPRECEDENTED
-                    unprecedented_count += 1
+                if c.aircraft_types[position] not in airstrip_precedents:
+                    c.cells[position] = CHECKOUT_UNPRECEDENTED
         
         # Only save entries with BELUM or UNPRECEDENTED statuses
         if incomplete:
-            # But only if the airstrip has at least one valid checkout. If it
-            # doesn't have any existing checkouts, then we're not going to show
-            # it at as a 'belum selesai' airstrip.
-            if ident not in precedented:
-                logger.debug("Dropping %s: airstrip is globally unprecedented" % ident)
-            else:
+            checkouts.append(c)
+    
+    return checkouts
+
+
+def belum_selesai_database(actypes, pilot=None, airstrip=None, base=None, aircraft_type=None, **kwargs):
+    """Builds the belum selesai records for the given aircraft type names by
+    letting the database do the work.
+    
+    The filtered pilots, airstrips, and aircraft types are CROSS JOINed and
+    then LEFT JOINed against the checkouts (for sudah cells) and against the
+    distinct airstrip/aircraft type pairs (for precedent). Pairs which are
+    complete, or whose airstrip has no checkouts at all, are discarded by the
+    database, so only rows which need rendering come back.
+    
+    Written for PostgreSQL, but sticks to portable SQL so that it can also be
+    exercised by the test suite on SQLite.
+    """
+    if not actypes:
+        return []
+    
+    pilots = get_pilots().order_by()
+    if pilot is not None:
+        pilots = pilots.filter(pk=pilot.pk)
+    airstrips = Airstrip.objects.all()
+    if airstrip is not None:
+        airstrips = airstrips.filter(pk=airstrip.pk)
+    elif base is not None:
+        airstrips = airstrips.filter(bases=base)
+    types = AircraftType.objects.all()
+    if aircraft_type is not None:
+        types = types.filter(pk=aircraft_type.pk)
+    
+    pilots_sql, pilots_params = pilots.values('pk').query.sql_with_params()
+    airstrips_sql, airstrips_params = airstrips.values('pk').query.sql_with_params()
+    types_sql, types_params = types.values('pk').query.sql_with_params()
+    
+    qn = connection.ops.quote_name
+    sql = """
+        SELECT u.username, u.first_name, u.last_name, a.ident, a.name, t.name,
+               CASE WHEN c.id IS NOT NULL THEN %s
+                    WHEN p.airstrip_id IS NOT NULL THEN %s
+                    ELSE %s END
+        FROM {user} u
+        CROSS JOIN {airstrip} a
+        CROSS JOIN {actype} t
+        LEFT JOIN {checkout} c
+            ON c.pilot_id = u.id AND c.airstrip_id = a.id AND c.aircraft_type_id = t.id
+        LEFT JOIN (SELECT DISTINCT airstrip_id, aircraft_type_id FROM {checkout}) p
+            ON p.airstrip_id = a.id AND p.aircraft_type_id = t.id
+        LEFT JOIN (SELECT pilot_id, airstrip_id, COUNT(*) AS done
+                   FROM {checkout}
+                   WHERE aircraft_type_id IN ({types})
+                   GROUP BY pilot_id, airstrip_id) d
+            ON d.pilot_id = u.id AND d.airstrip_id = a.id
+        WHERE u.id IN ({pilots})
+          AND a.id IN ({airstrips})
+          AND t.id IN ({types})
+          AND a.id IN (SELECT airstrip_id FROM {checkout})
+          AND COALESCE(d.done, 0) < %s
+        ORDER BY u.last_name, u.first_name, u.username, a.ident
+    """.format(
+        user=qn(User._meta.db_table),
+        airstrip=qn(Airstrip._meta.db_table),
+        actype=qn(AircraftType._meta.db_table),
+        checkout=qn(Checkout._meta.db_table),
+        pilots=pilots_sql,
+        airstrips=airstrips_sql,
+        types=types_sql,
+    )
+    params = [CHECKOUT_SUDAH, CHECKOUT_BELUM, CHECKOUT_UNPRECEDENTED]
+    params += types_params + pilots_params + airstrips_params + types_params
+    params.append(len(actypes))
+    
+    positions = aircrafttype_positions(actypes)
+    checkouts = []
+    current_pair = None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for username, first_name, last_name, ident, airstrip_name, actype, status in cursor:
+            if (username, ident) != current_pair:
+                current_pair = (username, ident)
+                c = checkout_record(
+                        format_full_name(username, first_name, last_name),
+                        username,
+                        ident,
+                        airstrip_name,
+                        actypes,
+                        CHECKOUT_BELUM)
                 checkouts.append(c)
+            c.cells[positions[actype]] = status
+    return checkouts
+
+
+def bulk_checkouts_changed(pilot_id, cells, present):
+    """Brings the data derived from the checkouts up to date after a pilot's
+    checkouts at the given (airstrip_id, aircraft_type_id) 'cells' were added
+    (present=True) or removed in bulk. Bulk writes don't send the model
+    signals, so this does what the receivers in checkouts.signals would have
+    done for each checkout."""
+    cells = list(cells)
+    if not cells:
+        return
+    invalidate_precedented_checkouts()
+    versions.record_checkout_data_change()
+    if not present:
+        versions.record_change(Checkout)
+    if settings.CHECKOUT_SUMMARY_TABLE:
+        summary.refresh_pairs(pilot_id, set(airstrip_id for airstrip_id, _ in cells))
+    transaction.on_commit(lambda: coverage.patch_many(
+        [(pilot_id, airstrip_id, aircraft_type_id) for airstrip_id, aircraft_type_id in cells],
+        present))
+
+
+def supports_returning():
+    """True if the database can return the affected rows from an INSERT ... ON
+    CONFLICT DO NOTHING or a DELETE"""
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return False
+
+
+# Cells per INSERT/DELETE statement; keeps the parameter count well within
+# limits
+CELL_BATCH_SIZE = 400
+
+
+def apply_checkout_changes(pilot, add=(), remove=()):
+    """Adds and removes any number of a pilot's checkouts, given as sets of
+    (airstrip_id, aircraft_type_id) 'cells', in a single transaction. Returns
+    the cells which actually changed:
     
-    results['results'] = checkouts
-    return results
+    changes = {
+        'added':   set([(airstrip_id, aircraft_type_id), ...]),
+        'removed': set([(airstrip_id, aircraft_type_id), ...]),
+    }
+    
+    The additions are INSERT ... ON CONFLICT DO NOTHING RETURNING statements
+    which leave it to the unique_together constraint to skip checkouts which
+    already exist, so they report exactly what was inserted. On databases
+    which can't return the inserted rows, the cells already present are
+    looked up (and locked) first and the rest are bulk inserted, ignoring
+    conflicts. The removals are DELETE ... RETURNING statements (a locked
+    SELECT and a DELETE on databases which can't return deleted rows), so
+    they report exactly what was deleted.
+    """
+    add = set(add)
+    remove = set(remove)
+    if add & remove:
+        raise ValueError("Cannot both add and remove the same checkout")
+    
+    qn = connection.ops.quote_name
+    insert_sql = ("INSERT INTO {checkout} (pilot_id, airstrip_id, aircraft_type_id, date, created, modified) "
+                  "VALUES {rows} ON CONFLICT DO NOTHING RETURNING airstrip_id, aircraft_type_id")
+    row_sql = "(%s, %s, %s, %s, %s, %s)"
+    delete_sql = "DELETE FROM {checkout} WHERE pilot_id = %s AND ({cells})"
+    cell_sql = "(airstrip_id = %s AND aircraft_type_id = %s)"
+    
+    def cells_q(cells):
+        q = Q()
+        for airstrip_id, aircraft_type_id in cells:
+            q |= Q(airstrip_id=airstrip_id, aircraft_type_id=aircraft_type_id)
+        return q
+    
+    with transaction.atomic():
+        added = set()
+        cells = sorted(add)
+        if cells and supports_returning():
+            # The values Checkout.save() would fill in (see TimeStampedModel)
+            today = connection.ops.adapt_datefield_value(datetime.date.today())
+            now = connection.ops.adapt_datetimefield_value(timezone.now())
+            for i in range(0, len(cells), CELL_BATCH_SIZE):
+                batch = cells[i:i + CELL_BATCH_SIZE]
+                sql = insert_sql.format(
+                        checkout=qn(Checkout._meta.db_table),
+                        rows=', '.join([row_sql] * len(batch)))
+                params = []
+                for airstrip_id, aircraft_type_id in batch:
+                    params.extend([pilot.pk, airstrip_id, aircraft_type_id, today, now, now])
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, params)
+                    added.update((a, t) for a, t in cursor.fetchall())
+        elif cells:
+            now = timezone.now()
+            present = set()
+            for i in range(0, len(cells), CELL_BATCH_SIZE):
+                present.update(Checkout.objects.select_for_update()
+                                .filter(cells_q(cells[i:i + CELL_BATCH_SIZE]), pilot=pilot)
+                                .values_list('airstrip_id', 'aircraft_type_id'))
+            added = set(cells) - present
+            Checkout.objects.bulk_create(
+                [Checkout(pilot=pilot, airstrip_id=airstrip_id, aircraft_type_id=aircraft_type_id, created=now, modified=now)
+                 for airstrip_id, aircraft_type_id in sorted(added)],
+                batch_size=1000,
+                ignore_conflicts=True)
+        
+        removed = set()
+        cells = sorted(remove)
+        for i in range(0, len(cells), CELL_BATCH_SIZE):
+            batch = cells[i:i + CELL_BATCH_SIZE]
+            sql = delete_sql.format(
+                    checkout=qn(Checkout._meta.db_table),
+                    cells=' OR '.join([cell_sql] * len(batch)))
+            params = [pilot.pk]
+            for cell in batch:
+                params.extend(cell)
+            with connection.cursor() as cursor:
+                if supports_returning():
+                    cursor.execute(sql + " RETURNING airstrip_id, aircraft_type_id", params)
+                    removed.update((a, t) for a, t in cursor.fetchall())
+                else:
+                    removed.update(Checkout.objects.select_for_update().filter(cells_q(batch), pilot=pilot)
+                                    .values_list('airstrip_id', 'aircraft_type_id'))
+                    cursor.execute(sql, params)
+        
+        bulk_checkouts_changed(pilot.pk, added, True)
+        bulk_checkouts_changed(pilot.pk, removed, False)
+    
+    return {'added': added, 'removed': removed}
+
+
+def add_checkouts(pilot, airstrip, aircraft_types):
+    """Checks the pilot out at the airstrip in each of the aircraft types.
+    Returns a list of (checkout, added) pairs in the order of the aircraft
+    types, where each checkout is an unsaved Checkout instance (suitable for
+    display) and 'added' is False for those which already existed.
+    See apply_checkout_changes.
+    """
+    aircraft_types = list(aircraft_types)
+    changes = apply_checkout_changes(pilot, add=[(airstrip.pk, t.pk) for t in aircraft_types])
+    return [(Checkout(pilot=pilot, airstrip=airstrip, aircraft_type=t), (airstrip.pk, t.pk) in changes['added'])
+            for t in aircraft_types]
+
+
+def remove_checkouts(pilot, airstrip, aircraft_types):
+    """Removes the pilot's checkouts at the airstrip in each of the aircraft
+    types. Returns a pair of lists of unsaved Checkout instances (suitable for
+    display): those which were deleted, and those which didn't exist.
+    See apply_checkout_changes.
+    """
+    aircraft_types = list(aircraft_types)
+    changes = apply_checkout_changes(pilot, remove=[(airstrip.pk, t.pk) for t in aircraft_types])
+    removed, missing = [], []
+    for t in aircraft_types:
+        c = Checkout(pilot=pilot, airstrip=airstrip, aircraft_type=t)
+        (removed if (airstrip.pk, t.pk) in changes['removed'] else missing).append(c)
+    return removed, missing
 
 
 def pilot_checkouts_grouped_by_airstrip(pilot):
@@ -289,42 +774,87 @@ def airstrip_checkouts_grouped_by_pilot(airstrip):
     return results
 
 
-def export_pilotweights():
-    """Regenerates the 'static' files containing the PilotWeights"""
-    pilotweights = PilotWeight.objects.all().order_by("pilot__last_name", "pilot__first_name")
-    logger.info("Exporting %d PilotWeight records to static files" % len(pilotweights))
-
-    to_export = {
-        "version": "1",
-        "updated": datetime.datetime.utcnow().strftime(DATE_FORMAT),
-        "pilots": [],
-    }
-    for pw in pilotweights:
-        data = {
-            'lastname': pw.pilot.last_name,
-            'firstname': pw.pilot.first_name,
-            'weight': pw.weight,
+def get_pilot_weights(pilots=None):
+    """Returns a list of (pilot, weight) pairs for the given queryset of Users
+    (by default, all pilots), using a weight of 0 for any pilot without a
+    PilotWeight. Built from a single LEFT JOIN query."""
+    if pilots is None:
+        pilots = get_pilots()
+    pilots = pilots.annotate(weight_or_zero=Coalesce('pilotweight__weight', 0))
+    return [(pilot, pilot.weight_or_zero) for pilot in pilots]
+
+
+PILOTWEIGHTS_EXPORT_VERSION = "1"
+
+
+def pilotweight_records():
+    """Yields the exported fields of each PilotWeight, in export order. The
+    rows come from a single query (joined with the pilots) read through a
+    server-side cursor, so they're never all in memory at once."""
+    rows = PilotWeight.objects.order_by(
+                "pilot__last_name",
+                "pilot__first_name"
+            ).values_list(
+                "pilot__last_name",
+                "pilot__first_name",
+                "weight"
+            )
+    for last_name, first_name, weight in rows.iterator():
+        yield {
+            'lastname': last_name,
+            'firstname': first_name,
+            'weight': weight,
         }
-        to_export["pilots"].append(data)
 
-    jsonpath = os.path.join(settings.STATIC_ROOT, settings.PILOTWEIGHTS_JSON_FILE)
-    with open(jsonpath, 'w') as f:
-        json.dump(to_export, f, indent=4, sort_keys=True)
-    logger.info("Wrote %d bytes to %s" % (os.path.getsize(jsonpath), jsonpath))
 
+def pilotweights_json(updated, records, indent=4):
+    """Text chunks of the JSON pilot weights export"""
+    header = {"version": PILOTWEIGHTS_EXPORT_VERSION, "updated": updated}
+    return exports.json_chunks(header, "pilots", records, indent=indent)
+
+
+def pilotweights_xml(updated, records, indent=2):
+    """Text chunks of the XML pilot weights export"""
+    header = {"version": PILOTWEIGHTS_EXPORT_VERSION, "updated": updated}
+    return exports.xml_chunks("pilotweights", header, "pilot", records, indent=indent)
+
+
+def export_pilotweights():
+    """Regenerates the 'static' files containing the PilotWeights, along with
+    their precompressed copies and pointer file (see checkouts.exports). The
+    files are left untouched (so their mtime still says when the data last
+    changed) if nothing but the 'updated' timestamp would differ. Returns True
+    if the files were written."""
+    jsonpath = os.path.join(settings.STATIC_ROOT, settings.PILOTWEIGHTS_JSON_FILE)
     xmlpath = os.path.join(settings.STATIC_ROOT, settings.PILOTWEIGHTS_XML_FILE)
-    with open(xmlpath, 'w') as f:
-        f.write("<pilotweights>\n")
-        f.write("  <version>%s</version>\n" % to_export["version"])
-        f.write("  <updated>%s</updated>\n" % to_export["updated"])
-        for pilot in to_export["pilots"]:
-            f.write("  <pilot>\n")
-            f.write("    <lastname>%s</lastname>\n" % pilot["lastname"])
-            f.write("    <firstname>%s</firstname>\n" % pilot["firstname"])
-            f.write("    <weight>%d</weight>\n" % pilot["weight"])
-            f.write("  </pilot>\n")
-        f.write("</pilotweights>\n")
-    logger.info("Wrote %d bytes to %s" % (os.path.getsize(xmlpath), xmlpath))
+    metapath = os.path.join(settings.STATIC_ROOT, settings.PILOTWEIGHTS_META_FILE)
+    hashed = settings.PILOTWEIGHTS_HASHED_EXPORTS
+    # Indented like the original exports unless compact output is wanted
+    json_indent, xml_indent = (None, None) if settings.PILOTWEIGHTS_COMPACT_EXPORTS else (4, 2)
+    formats = [
+        ("json", jsonpath, lambda updated: pilotweights_json(updated, pilotweight_records(), json_indent)),
+        ("xml", xmlpath, lambda updated: pilotweights_xml(updated, pilotweight_records(), xml_indent)),
+    ]
+
+    # Rendering the current data with the published timestamp must reproduce
+    # the published files exactly if nothing has changed.
+    previous = exports.read_metadata(metapath)
+    if previous.get("updated"):
+        for name, path, chunks in formats:
+            if not exports.is_published(path, exports.digest(chunks(previous["updated"])), hashed):
+                break
+        else:
+            logger.info("PilotWeight exports are unchanged; not rewriting them")
+            return False
+
+    updated = datetime.datetime.utcnow().strftime(DATE_FORMAT)
+    files = {}
+    for name, path, chunks in formats:
+        files[name] = exports.publish(path, chunks(updated), hashed, previous.get("files", {}).get(name))
+        logger.info("Wrote %d bytes to %s" % (files[name]["bytes"], path))
+
+    exports.write_metadata(metapath, PILOTWEIGHTS_EXPORT_VERSION, updated, files)
+    return True
 
 
 def notify_pilotweight_update(pilotweight):
@@ -352,8 +882,11 @@ def notify_pilotweight_update(pilotweight):
     response = requests.post(
         mgconfig['api_url'],
         auth=('api', mgconfig['api_key']),
-        data=data)
+        data=data,
+        timeout=MAILGUN_TIMEOUT)
     logger.info("Response status: %d, text: %s" % (response.status_code, response.text))
+    # Raising lets the background job which sent this retry it later
+    response.raise_for_status()
 
 
 def get_pilotweights_mtime():
@@ -363,3 +896,69 @@ def get_pilotweights_mtime():
         return None
     timestamp = os.path.getmtime(jsonpath)
     return datetime.datetime.fromtimestamp(timestamp)
+
+
+# Rows saved within this many seconds of a change feed request are held back
+# until a later request. A save's 'modified' timestamp is taken before its
+# transaction commits, so without the margin a cursor could move past a row
+# which was about to appear with an earlier timestamp.
+CHANGE_FEED_SETTLE = datetime.timedelta(seconds=5)
+CHANGE_FEED_LIMIT = 500
+
+
+def encode_change_cursor(modified, pk):
+    """Cursor for the position just after the row (modified, pk), as
+    '<microseconds since the epoch>-<pk>'"""
+    delta = modified - datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+    return '%d-%d' % (delta // datetime.timedelta(microseconds=1), pk)
+
+
+def decode_change_cursor(cursor):
+    """Reverses encode_change_cursor. Raises ValueError for a malformed
+    cursor."""
+    microseconds, pk = cursor.split('-')
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+    return epoch + datetime.timedelta(microseconds=int(microseconds)), int(pk)
+
+
+def pilotweight_changes(cursor=None, limit=CHANGE_FEED_LIMIT):
+    """Returns the PilotWeights saved since the position given by 'cursor'
+    (or all of them, without one) in the order they were saved, as a tuple of
+    (pilotweights, next cursor, more). Pass the next cursor back to continue
+    from the last row returned; 'more' is True if the limit cut the page
+    short. Raises ValueError for a malformed cursor."""
+    changes = PilotWeight.objects.select_related('pilot').filter(
+                modified__lte=timezone.now() - CHANGE_FEED_SETTLE)
+    if cursor:
+        modified, pk = decode_change_cursor(cursor)
+        changes = changes.filter(Q(modified__gt=modified) | Q(modified=modified, pk__gt=pk))
+    pilotweights = list(changes.order_by('modified', 'pk')[:limit + 1])
+    more = len(pilotweights) > limit
+    pilotweights = pilotweights[:limit]
+    if pilotweights:
+        last = pilotweights[-1]
+        cursor = encode_change_cursor(last.modified, last.pk)
+    return pilotweights, cursor or '', more
+
+
+def pilotweight_change_records(pilotweights):
+    for pw in pilotweights:
+        yield {
+            'username': pw.pilot.username,
+            'lastname': pw.pilot.last_name,
+            'firstname': pw.pilot.first_name,
+            'weight': pw.weight,
+            'modified': pw.modified.strftime(DATE_FORMAT),
+        }
+
+
+def pilotweight_changes_json(pilotweights, cursor, more):
+    """Text chunks of a JSON change feed page"""
+    header = {"version": PILOTWEIGHTS_EXPORT_VERSION, "cursor": cursor, "more": more}
+    return exports.json_chunks(header, "pilots", pilotweight_change_records(pilotweights))
+
+
+def pilotweight_changes_xml(pilotweights, cursor, more):
+    """Text chunks of an XML change feed page"""
+    header = {"version": PILOTWEIGHTS_EXPORT_VERSION, "cursor": cursor, "more": more}
+    return exports.xml_chunks("pilotweights", header, "pilot", pilotweight_change_records(pilotweights))
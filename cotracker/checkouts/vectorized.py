@@ -0,0 +1,134 @@
+"""Vectorized evaluation of the checkout states
+
+An alternative to the nested loops in util.belum_selesai_python: the checkouts
+are loaded once into a boolean pilot x airstrip x aircraft type array and the
+sudah/belum/unprecedented states are computed with NumPy array operations.
+
+NumPy is an optional dependency. When it isn't installed, 'numpy' is None and
+util.belum_selesai sticks with the python evaluator.
+"""
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .models import AircraftType, Airstrip, Checkout
+import checkouts.util as util
+
+
+# Status codes used in the status matrix
+SUDAH = 0
+BELUM = 1
+UNPRECEDENTED = 2
+
+
+def index_of(ids, values):
+    """Positions in the 'ids' array of each of the 'values' (all of which must
+    be present in 'ids')"""
+    order = numpy.argsort(ids, kind='stable')
+    return order[numpy.searchsorted(ids[order], values)]
+
+
+def evaluate(pilot=None, airstrip=None, base=None, aircraft_type=None, **kwargs):
+    """Computes the checkout states for the filtered pilots, airstrips, and
+    aircraft types. Returns a dictionary of:
+
+    pilots          [(username, full name)] in report order
+    airstrips       [(ident, name)] in report order
+    aircraft_types  names of the aircraft types in the status matrix
+    status          int8 array of SUDAH/BELUM/UNPRECEDENTED codes, shaped
+                    (pilots, airstrips, aircraft_types)
+    belum           boolean array shaped (pilots, airstrips); True for pairs
+                    which belong in the belum selesai report
+    """
+    pilots = util.get_pilots()
+    if pilot is not None:
+        pilots = pilots.filter(pk=pilot.pk)
+    pilot_rows = list(pilots.values_list('id', 'username', 'first_name', 'last_name'))
+
+    airstrips = Airstrip.objects.all().order_by('ident')
+    if airstrip is not None:
+        airstrips = airstrips.filter(pk=airstrip.pk)
+    elif base is not None:
+        airstrips = airstrips.filter(bases=base)
+    airstrip_rows = list(airstrips.values_list('id', 'ident', 'name'))
+
+    type_rows = list(AircraftType.objects.order_by('sorted_position', 'name', 'pk').values_list('id', 'name'))
+
+    # Precedent considers every checkout at the selected airstrips, no matter
+    # who holds it, so the user axis covers more than just the pilots.
+    checkouts = Checkout.objects.filter(
+                    airstrip__in=airstrips.values('pk')
+                ).values_list('pilot_id', 'airstrip_id', 'aircraft_type_id')
+    rows = numpy.array(list(checkouts), dtype=numpy.int64).reshape(-1, 3)
+
+    pilot_ids = numpy.array([r[0] for r in pilot_rows], dtype=numpy.int64)
+    airstrip_ids = numpy.array([r[0] for r in airstrip_rows], dtype=numpy.int64)
+    type_ids = numpy.array([r[0] for r in type_rows], dtype=numpy.int64)
+    user_ids = numpy.union1d(pilot_ids, rows[:, 0])
+
+    covered = numpy.zeros((len(user_ids), len(airstrip_ids), len(type_ids)), dtype=bool)
+    covered[
+        index_of(user_ids, rows[:, 0]),
+        index_of(airstrip_ids, rows[:, 1]),
+        index_of(type_ids, rows[:, 2]),
+    ] = True
+
+    precedented = covered.any(axis=0)
+    # Airstrips without any checkouts at all are dropped from the report
+    globally_precedented = precedented.any(axis=1)
+
+    if aircraft_type is not None:
+        selected = numpy.flatnonzero(type_ids == aircraft_type.pk)
+        names = [aircraft_type.name] if len(selected) else []
+    else:
+        selected = numpy.arange(len(type_ids))
+        names = [name for _, name in type_rows]
+
+    pilot_covered = covered[index_of(user_ids, pilot_ids)][:, :, selected]
+    status = numpy.where(
+                pilot_covered,
+                SUDAH,
+                numpy.where(precedented[:, selected][numpy.newaxis], BELUM, UNPRECEDENTED)
+            ).astype(numpy.int8)
+    belum = ~pilot_covered.all(axis=2) & globally_precedented[numpy.newaxis, :]
+
+    return {
+        'pilots': [(username, util.format_full_name(username, first_name, last_name))
+                   for _, username, first_name, last_name in pilot_rows],
+        'airstrips': [(ident, name) for _, ident, name in airstrip_rows],
+        'aircraft_types': names,
+        'status': status,
+        'belum': belum,
+    }
+
+
+def belum_selesai(actypes, **kwargs):
+    """Equivalent of util.belum_selesai_python, built from the status matrix"""
+    evaluated = evaluate(**kwargs)
+    pilots = evaluated['pilots']
+    airstrips = evaluated['airstrips']
+    names = evaluated['aircraft_types']
+    # Indexed by status code
+    status_names = (util.CHECKOUT_SUDAH, util.CHECKOUT_BELUM, util.CHECKOUT_UNPRECEDENTED)
+
+    pilot_indexes, airstrip_indexes = numpy.nonzero(evaluated['belum'])
+    rows = evaluated['status'][pilot_indexes, airstrip_indexes]
+    # Each distinct row of statuses gets a single number (the row read as a
+    # base 3 number) so that its cells only need to be worked out once.
+    patterns = rows.astype(numpy.int64) @ (3 ** numpy.arange(len(names), dtype=numpy.int64))
+    positions = [util.aircrafttype_positions(actypes)[name] for name in names]
+    templates = {}
+
+    checkouts = []
+    for p, a, pattern, row in zip(pilot_indexes.tolist(), airstrip_indexes.tolist(), patterns.tolist(), rows):
+        template = templates.get(pattern)
+        if template is None:
+            template = [util.CHECKOUT_BELUM] * len(actypes)
+            for position, code in zip(positions, row.tolist()):
+                template[position] = status_names[code]
+            templates[pattern] = template
+        pilot_slug, pilot_name = pilots[p]
+        ident, airstrip_name = airstrips[a]
+        checkouts.append(util.CheckoutRecord(pilot_name, pilot_slug, ident, airstrip_name, actypes, list(template)))
+    return checkouts
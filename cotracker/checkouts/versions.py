@@ -0,0 +1,122 @@
+"""Data versions for answering conditional GETs on the report pages
+
+A report page only changes when the rows it's built from change, which is
+rare compared to how often the pages are requested. Each report view names
+the models it reads (see ConditionalGetMixin in checkouts.views) and the
+version of that data is made of, for each model:
+
+- the latest 'modified' timestamp of its rows, which moves whenever a row is
+  saved (including by bulk_create), and
+- its ChangeCounter, which the receivers in checkouts.signals bump for the
+  changes which leave no timestamp behind: deleted rows, changes to a
+  many-to-many relation, and saves of Users (which have no 'modified').
+
+Both are read with a single query, which is all that a request answered
+with 304 Not Modified costs.
+
+The checkout data version is a single counter covering all of the checkout
+reports' data, bumped for every change to it (timestamped or not). It keys
+the rendered reports in checkouts.reports. As every writer shares it, it's
+bumped once the change has been committed rather than inside the writer's
+transaction, where its row lock would be held until the commit.
+"""
+import hashlib
+import os
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Subquery
+from django.utils import timezone
+
+from .models import ChangeCounter
+
+
+DataVersion = namedtuple('DataVersion', ['etag', 'last_modified'])
+
+# Counts every change to the checkout reports' data, whichever model it's in
+CHECKOUT_DATA = 'checkout_data'
+
+
+def counter_name(model):
+    return model._meta.model_name
+
+
+def record_change(model):
+    """Bumps the model's ChangeCounter. Called from inside the transaction
+    making the change, so the version moves exactly when the change becomes
+    visible."""
+    bump(counter_name(model))
+
+
+def bump(name):
+    now = timezone.now()
+    updated = ChangeCounter.objects.filter(name=name).update(count=F('count') + 1, modified=now)
+    if not updated:
+        _, created = ChangeCounter.objects.get_or_create(name=name, defaults={'count': 1})
+        if not created:
+            ChangeCounter.objects.filter(name=name).update(count=F('count') + 1, modified=now)
+
+
+def record_checkout_data_change():
+    """Bumps the checkout data version, which moves with every change to the
+    data behind the checkout reports (see checkouts.reports), once the
+    current transaction commits. A report built in between is only kept
+    under the old version, which the bump leaves behind."""
+    transaction.on_commit(lambda: bump(CHECKOUT_DATA))
+
+
+def checkout_data_version():
+    """The checkout data version, or None if it has no counter"""
+    return ChangeCounter.objects.filter(name=CHECKOUT_DATA).values_list('count', flat=True).first()
+
+
+def is_timestamped(model):
+    return any(field.name == 'modified' for field in model._meta.concrete_fields)
+
+
+def data_version(models):
+    """Returns the DataVersion of the data in the given models, or None if
+    it can't be determined (i.e. a ChangeCounter is missing)"""
+    names = sorted(counter_name(model) for model in models)
+    latest = {}
+    for model in models:
+        if is_timestamped(model):
+            latest['latest_' + counter_name(model)] = Subquery(
+                model.objects.order_by('-modified').values('modified')[:1])
+    rows = list(ChangeCounter.objects.filter(name__in=names).annotate(**latest).values(
+                    'name', 'count', 'modified', *sorted(latest)).order_by('name'))
+    if len(rows) != len(names):
+        return None
+
+    parts = []
+    timestamps = []
+    for row in rows:
+        parts.append('%s:%d:%s' % (row['name'], row['count'], row['modified'].isoformat()))
+        timestamps.append(row['modified'])
+    for key in sorted(latest):
+        value = rows[0][key]
+        parts.append('%s:%s' % (key, value.isoformat() if value is not None else ''))
+        if value is not None:
+            timestamps.append(value)
+
+    etag = hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+    return DataVersion(etag, max(timestamps))
+
+
+_code_version = None
+
+
+def code_version():
+    """A stamp of the deployed code and templates (their latest mtime), so
+    that a deploy changes the ETags of pages rendered by the old code"""
+    global _code_version
+    if _code_version is None:
+        latest = 0
+        for root, dirs, files in os.walk(settings.PROJECT_ROOT):
+            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in ('logs', 'cache', 'static', '__pycache__')]
+            for filename in files:
+                if filename.endswith(('.py', '.html')):
+                    latest = max(latest, os.path.getmtime(os.path.join(root, filename)))
+        _code_version = '%d' % latest
+    return _code_version
@@ -1,32 +1,112 @@
 """View definitions for the Checkouts app"""
+import hashlib
+import json
 import logging
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Count
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import redirect, render
-from django.views.generic import DetailView, ListView, TemplateView
+from django.utils.cache import add_never_cache_headers, get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
+from django.views.generic import DetailView, ListView, TemplateView, View
 
 from braces.views import LoginRequiredMixin
 
 from .forms import FilterForm, CheckoutEditForm
-from .models import AircraftType, Airstrip, Checkout, PilotWeight
+from .models import AircraftType, Airstrip, Checkout, Job, PilotWeight
+import checkouts.jobs as jobs
+import checkouts.reports as reports
 import checkouts.util as util
+import checkouts.versions as versions
 
 
 logger = logging.getLogger(__name__)
 
 
-class PilotList(LoginRequiredMixin, ListView):
+class ConditionalGetMixin(object):
+    """Answers a GET with 304 Not Modified, without running the rest of the
+    view, when the client's copy of the page is still current
+    
+    'version_models' are the models the page is built from (Users are always
+    included). The page's ETag combines their data version (see
+    checkouts.versions) with everything else the page depends on: the user,
+    the URL, the CSRF token in its forms and the deployed code. Only in
+    effect with settings.CONDITIONAL_REPORTS.
+    """
+    version_models = ()
+    # Set by a view which rendered out of date data, e.g. a report being
+    # rebuilt in the background. Such a page must not be reused.
+    stale = False
+    
+    def get_max_age(self, request):
+        """Seconds for which the client (or the nginx cache, see
+        etc/nginx.secure) may reuse the page without asking again. With 0
+        it must revalidate every time."""
+        return 0
+    
+    def get_validators(self, request):
+        """Returns the page's (ETag, Last-Modified timestamp), or (None, None)
+        if the request can't be answered conditionally"""
+        if not settings.CONDITIONAL_REPORTS or request.method not in ('GET', 'HEAD'):
+            return None, None
+        # Messages waiting to be shown make the page differ from the client's
+        # copy (and would be lost with a 304)
+        if len(messages.get_messages(request)):
+            return None, None
+        # The navigation shows the user's roles, so every page depends on the
+        # Users as well
+        models = set(self.version_models) | {User}
+        version = versions.data_version(models)
+        if version is None:
+            return None, None
+        parts = [
+            version.etag,
+            versions.code_version(),
+            str(request.user.pk),
+            request.get_full_path(),
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        ]
+        etag = '"%s"' % hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+        return etag, int(version.last_modified.timestamp())
+    
+    def dispatch(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request)
+        if etag is None:
+            return super(ConditionalGetMixin, self).dispatch(request, *args, **kwargs)
+        
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super(ConditionalGetMixin, self).dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            if self.stale:
+                add_never_cache_headers(response)
+                return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # The page is specific to the user
+        max_age = self.get_max_age(request)
+        if max_age:
+            patch_cache_control(response, private=True, max_age=max_age)
+            response['X-Accel-Expires'] = max_age
+        else:
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class PilotList(LoginRequiredMixin, ConditionalGetMixin, ListView):
     """List of current pilots"""
     queryset = util.get_pilots()
     context_object_name = 'pilot_list'
     template_name = 'checkouts/pilot_list.html'
 
 
-class PilotDetail(LoginRequiredMixin, DetailView):
+class PilotDetail(LoginRequiredMixin, ConditionalGetMixin, DetailView):
     """All checkout information for a particular pilot"""
+    version_models = (Checkout, Airstrip, AircraftType)
     model = User
     context_object_name = 'pilot'
     template_name = 'checkouts/pilot_detail.html'
@@ -36,20 +116,25 @@ class PilotDetail(LoginRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super(PilotDetail, self).get_context_data(**kwargs)
         
-        context['checkouts'] = util.pilot_checkouts_grouped_by_airstrip(self.object)
+        context['report'] = reports.render(
+            'pilot', [self.object.pk], 'checkouts/pilot_report.html',
+            lambda: {'checkouts': util.pilot_checkouts_grouped_by_airstrip(self.object)},
+        )
         
         return context
 
 
-class AirstripList(LoginRequiredMixin, ListView):
+class AirstripList(LoginRequiredMixin, ConditionalGetMixin, ListView):
     """List of current airstrips"""
+    version_models = (Airstrip,)
     queryset = Airstrip.objects.all().order_by('ident')
     context_object_name = 'airstrip_list'
     template_name = 'checkouts/airstrip_list.html'
 
 
-class AirstripDetail(LoginRequiredMixin, DetailView):
+class AirstripDetail(LoginRequiredMixin, ConditionalGetMixin, DetailView):
     """All checkout information for a particular airstrip"""
+    version_models = (Checkout, Airstrip, AircraftType)
     model = Airstrip
     context_object_name = 'airstrip'
     template_name = 'checkouts/airstrip_detail.html'
@@ -59,26 +144,30 @@ class AirstripDetail(LoginRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super(AirstripDetail, self).get_context_data(**kwargs)
         
-        context['checkouts'] = util.airstrip_checkouts_grouped_by_pilot(self.object)
+        context['report'] = reports.render(
+            'airstrip', [self.object.pk], 'checkouts/airstrip_report.html',
+            lambda: {'checkouts': util.airstrip_checkouts_grouped_by_pilot(self.object)},
+        )
         
         return context
 
 
-class BaseList(LoginRequiredMixin, ListView):
+class BaseList(LoginRequiredMixin, ConditionalGetMixin, TemplateView):
     """List of airstrips which are bases"""
-    queryset = util.get_bases().annotate(attached=Count('airstrip'))
+    version_models = (Airstrip,)
     template_name = 'checkouts/base_list.html'
     
     def get_context_data(self, **kwargs):
         context = super(BaseList, self).get_context_data(**kwargs)
         
-        bases = self.object_list
-        base_list = []
-        for base in bases:
-            unattached = base.unattached_airstrips().count()
-            base_list.append((base, base.attached, unattached))
-        
-        context['base_list'] = base_list
+        # Only flight schedulers and superusers see the 'Edit' links
+        user = self.request.user
+        editable = user.is_superuser or user.is_flight_scheduler
+        context['report'] = reports.render(
+            'bases', [], 'checkouts/base_report.html',
+            lambda: {'base_list': util.get_base_counts(), 'editable': editable},
+            variant=[editable],
+        )
         
         return context
 
@@ -154,7 +243,11 @@ class BaseEditAttached(LoginRequiredMixin, DetailView):
         and the set of airstrips currently attached to the 'self' base."""
         context = super(BaseEditAttached, self).get_context_data(**kwargs)
         context['airstrips'] = Airstrip.objects.exclude(pk=self.object.id).order_by('ident')
-        context['attached'] = self.object.attached_airstrips()
+        attached = getattr(self, 'attached', None)
+        if attached is None:
+            attached = self.object.attached_airstrips()
+        # A set makes the template's 'airstrip in attached' test cheap
+        context['attached'] = set(attached)
         
         return context
     
@@ -175,86 +268,97 @@ class BaseEditAttached(LoginRequiredMixin, DetailView):
         
         logger.debug(request.POST)
         
-        current = base.attached_airstrips()
-        logger.debug("Current: %d attached airstrips" % current.count())
-        proposed = Airstrip.objects.filter(ident__in=request.POST.getlist('airstrip', []))
-        logger.debug("Proposed: %d attached airstrips" % proposed.count())
-        
-        # We can figure out what changes to make by comparing the 'current'
-        # attachments with the 'proposed' list.
-        to_add = [airstrip for airstrip in proposed]
-        to_delete = []
-        for airstrip in current:
-            if airstrip in to_add:
-                to_add.remove(airstrip)
-            else:
-                to_delete.append(airstrip)
+        changes = util.set_attached_airstrips(base, request.POST.getlist('airstrip', []))
         
         # Prevent the user from adding a self-loop on a base
-        if base in to_add:
+        if changes['rejected']:
             message = "Unable to set attachment for '%s' to itself" % base.name
             messages.add_message(request, messages.ERROR, message)
-            to_add.remove(base)
         
-        if not to_add and not to_delete:
+        if not changes['attached'] and not changes['detached']:
             message = "Nothing updated; No changes necessary."
             messages.add_message(request, messages.SUCCESS, message)
         else:
-            if to_add:
-                for airstrip in to_add:
-                    airstrip.bases.add(base)
-                updates = ', '.join([airstrip.name for airstrip in to_add])
+            if changes['attached']:
+                updates = ', '.join([airstrip.name for airstrip in changes['attached']])
                 logger.info("%s is attaching the following to %s: %s" % (request.user.username, base.ident, updates))
                 message = "Attached: %s" % updates
                 messages.add_message(request, messages.SUCCESS, message)
             
-            if to_delete:
-                for airstrip in to_delete:
-                    airstrip.bases.remove(base)
-                updates = ', '.join([airstrip.name for airstrip in to_delete])
+            if changes['detached']:
+                updates = ', '.join([airstrip.name for airstrip in changes['detached']])
                 logger.info("%s is detaching the following from %s: %s" % (request.user.username, base.ident, updates))
                 message = "Unattached: %s" % updates 
                 messages.add_message(request, messages.SUCCESS, message)
         
         # We'll render a fresh view of the editing form which will have all
-        # the updates in place.
+        # the updates in place. The attachments are already known, so there's
+        # no need to query for them again.
+        self.attached = changes['current']
         return self.get(request, *args, **kwargs)
 
-class FilterFormView(LoginRequiredMixin, TemplateView):
+class FilterFormView(LoginRequiredMixin, ConditionalGetMixin, TemplateView):
     """Provides an interface for filtering the set of checkout records
     
     Not limited to existing records: it's possible to query for 'which
     checkouts have not been completed?'
+    
+    The results are a GET of the filter page with the filter in its query
+    string, so they can be bookmarked, shared and cached. Every filter has a
+    single canonical URL (see FilterForm.query_string); others are redirected
+    to it.
     """
+    version_models = (Checkout, Airstrip, AircraftType)
     form_class = FilterForm
     template_name = 'checkouts/filter.html'
     
+    def get_max_age(self, request):
+        return settings.CHECKOUT_FILTER_MAX_AGE if request.GET else 0
+    
+    def results_url(self, form):
+        return '%s?%s' % (self.request.path, form.query_string())
+    
     def get(self, request, *args, **kwargs):
-        """Renders a fresh filter form"""
+        """Renders a fresh filter form or, given a filter, its results"""
         logger.debug("=> FilterFormView.get")
-        context = {'form': self.form_class(),}
+        if not request.GET:
+            context = {'form': self.form_class(),}
+            return self.render_to_response(context)
+        
+        form = self.form_class(request.GET)
+        context = {'form': form}
+        if not form.is_valid():
+            logger.debug("Unable to validate form data")
+            return self.render_to_response(context)
+        
+        # Not a permanent redirect: browsers and proxies would hold on to it
+        # even if the canonical form of the query string changed
+        if request.GET.urlencode() != form.query_string():
+            return redirect(self.results_url(form))
+        
+        logger.debug(form.cleaned_data)
+        on_stale = None
+        if settings.BACKGROUND_JOBS:
+            # Rather than keep the user waiting, an out of date copy of the
+            # report is shown while the worker rebuilds it
+            values = dict(reports.filter_params(form.cleaned_data))
+            on_stale = lambda: jobs.enqueue_once('refresh_filter_report', filters=values)
+        context['report'], self.stale = reports.render_filter(form.cleaned_data, on_stale)
+        context['refreshing'] = self.stale
         return self.render_to_response(context)
     
     def post(self, request, *args, **kwargs):
-        """If the filter is valid, renders the filtered checkout data"""
+        """If the filter is valid, redirects to its results (the form itself
+        is submitted with GET)"""
         logger.debug("=> FilterFormView.post")
         logger.debug(request.POST)
         form = self.form_class(request.POST)
-        context = {'form': form}
         
         if not form.is_valid():
             logger.debug("Unable to validate form data")
-        else:
-            logger.debug(form.cleaned_data)
-            status = form.cleaned_data['checkout_status']
-            if status == util.CHECKOUT_SUDAH:
-                context['checkouts'] = util.sudah_selesai(**form.cleaned_data)
-            else:
-                context['checkouts'] = util.belum_selesai(**form.cleaned_data)
-            
-            context['show_summary'] = True
-            
-        return self.render_to_response(context)
+            return self.render_to_response({'form': form})
+        
+        return redirect(self.results_url(form))
 
 
 class CheckoutEditFormView(LoginRequiredMixin, TemplateView):
@@ -345,56 +449,183 @@ class CheckoutEditFormView(LoginRequiredMixin, TemplateView):
                 return self.forbidden(request, message)
             
             if action == u'Remove Checkout':
-                checkouts = Checkout.objects.filter(
-                                pilot=pilot, 
-                                airstrip=airstrip, 
-                                aircraft_type__in=aircraft_types)
-                
-                for c in checkouts:
+                deleted, missing = util.remove_checkouts(pilot, airstrip, aircraft_types)
+                for c in deleted:
                     logger.info("%s is deleting '%s'" % (request.user.username, c))
-                    # We'll be pretending that all of the requested checkouts
-                    # were deleted, even if they never existed, so we need to
-                    # keep track of which ones haven't really been deleted.
-                    # Then we'll use those remaining 'checkouts' to construct
-                    # 'delete successful' messages for the user.
-                    aircraft_types = aircraft_types.exclude(name=c.aircraft_type)
-                    c.delete()
+                # We pretend that all of the requested checkouts were deleted,
+                # even those which never existed.
+                for c in missing:
+                    logger.info("Pretending to delete non-existent checkout '%s'" % c)
+                for c in deleted + missing:
                     messages.add_message(request, messages.SUCCESS, "Deleted '%s'" % c)
                 
-                # Now that all the checkouts which actually existed have been
-                # deleted, we'll build 'delete successful' messages for each
-                # of the remainders.
-                if aircraft_types.count() > 0:
-                    for ac_type in aircraft_types:
-                        c = "%s is checked out at %s in a %s" % (pilot, airstrip, ac_type)
-                        logger.info("Pretending to delete non-existent checkout '%s'" % c)
-                        messages.add_message(request, messages.SUCCESS, "Deleted '%s'" % c)
-                
             else:
-                for ac_type in aircraft_types:
-                    existing = Checkout.objects.filter(
-                                    pilot=pilot, 
-                                    airstrip=airstrip, 
-                                    aircraft_type=ac_type)
-                    
-                    # Don't allow a duplicate checkout to be created. Unlike
-                    # the 'delete checkout' version, here we'll actually tell
-                    # the user that we found a duplicate (although it's still
-                    # styled as a 'success' message).
-                    if existing.exists():
-                        c = existing.get()
-                        logger.debug("Prevented duplicate '%s'" % c)
-                        messages.add_message(
-                                    request, 
-                                    messages.SUCCESS, 
-                                    "Already exists: '%s'" % c)
-                    else:
-                        c = Checkout(pilot=pilot, airstrip=airstrip, aircraft_type=ac_type)
+                # Unlike the 'delete checkout' version, here we'll actually
+                # tell the user that we found a duplicate (although it's
+                # still styled as a 'success' message).
+                for c, added in util.add_checkouts(pilot, airstrip, aircraft_types):
+                    if added:
                         logger.info("%s is adding '%s'" % (request.user.username, c))
-                        c.save()
                         messages.add_message(request, messages.SUCCESS, "Added '%s'" % c)
+                    else:
+                        logger.debug("Prevented duplicate '%s'" % c)
+                        messages.add_message(request, messages.SUCCESS, "Already exists: '%s'" % c)
+        
+        return self.render_to_response(context)
+
+
+class CheckoutMatrixView(LoginRequiredMixin, TemplateView):
+    """Grid editor for all of a pilot's checkouts at once
+    
+    GET renders a grid of airstrips (rows) by aircraft types (columns). The
+    page POSTs only the cells which were toggled, as a JSON change set:
+    
+        {
+            "pilot": "username",
+            "add": [["IDENT", aircraft type pk], ...],
+            "remove": [["IDENT", aircraft type pk], ...]
+        }
+    
+    Aircraft types are given by primary key rather than by name, which isn't
+    unique.
+    
+    The whole set is applied in one transaction and the response is a compact
+    diff of what actually changed:
+    
+        {
+            "pilot": "username",
+            "added": [["IDENT", aircraft type pk], ...],
+            "removed": [["IDENT", aircraft type pk], ...],
+            "unchanged": 0
+        }
+    
+    The same permission checks as CheckoutEditFormView apply.
+    """
+    template_name = 'checkouts/matrix.html'
+    
+    def forbidden(self, request, message="Sorry, you can't do that."):
+        """Shortcut for rendering an 'access denied' page"""
+        template = '403.html'
+        context = {
+            'reason': message,
+        }
+        return render(request, template, context, status=403)
+    
+    def may_edit(self, user):
+        """Only superusers, pilots, and flight schedulers may edit checkouts"""
+        return user.is_superuser or user.is_pilot or user.is_flight_scheduler
+    
+    def may_edit_others(self, user):
+        """Pilots may only edit their own checkouts if they are not a superuser
+        nor a flight scheduler"""
+        return user.is_superuser or user.is_flight_scheduler
+    
+    def get(self, request, *args, **kwargs):
+        """Renders the grid for the selected pilot"""
+        logger.debug("=> CheckoutMatrixView.get")
+        
+        # Security Check
+        # --------------
+        if not self.may_edit(request.user):
+            username = request.user.username
+            logger.warn("Forbidden: '%s' is not a pilot, flight scheduler, nor superuser" % username)
+            message = 'Only pilots may edit checkouts.'
+            return self.forbidden(request, message)
         
+        pilots = util.get_pilots()
+        if not self.may_edit_others(request.user):
+            pilots = pilots.filter(pk=request.user.id)
+        pilots = list(pilots)
+        
+        username = request.GET.get('pilot', request.user.username)
+        pilot = next((p for p in pilots if p.username == username), None)
+        if pilot is None and pilots:
+            pilot = pilots[0]
+        
+        aircraft_types = list(AircraftType.objects.order_by('sorted_position').values_list('pk', 'name'))
+        held = set()
+        if pilot is not None:
+            held = set(Checkout.objects.filter(pilot=pilot).values_list('airstrip_id', 'aircraft_type_id'))
+        rows = []
+        for airstrip_id, ident, name in Airstrip.objects.order_by('ident').values_list('pk', 'ident', 'name'):
+            cells = [(actype_id, (airstrip_id, actype_id) in held) for actype_id, _ in aircraft_types]
+            rows.append((ident, name, cells))
+        
+        context = {
+            'pilots': pilots,
+            'pilot': pilot,
+            'aircraft_types': [name for _, name in aircraft_types],
+            'rows': rows,
+        }
         return self.render_to_response(context)
+    
+    def post(self, request, *args, **kwargs):
+        """Applies a change set and responds with the resulting diff"""
+        logger.debug("=> CheckoutMatrixView.post")
+        
+        # Security Check
+        # --------------
+        if not self.may_edit(request.user):
+            username = request.user.username
+            logger.warn("Forbidden: '%s' is not a pilot, flight scheduler, nor superuser" % username)
+            return JsonResponse({'error': 'Only pilots may edit checkouts.'}, status=403)
+        
+        try:
+            changes = json.loads(request.body.decode('utf-8'))
+            username = changes['pilot']
+            add = set(tuple(cell) for cell in changes.get('add', []))
+            remove = set(tuple(cell) for cell in changes.get('remove', []))
+            if any(len(cell) != 2 or type(cell[1]) is not int for cell in add | remove):
+                raise ValueError("Cells must be [ident, aircraft type pk] pairs")
+        except (ValueError, KeyError, TypeError) as e:
+            logger.debug("Unable to read change set: %s" % e)
+            return JsonResponse({'error': 'Malformed change set.'}, status=400)
+        if add & remove:
+            return JsonResponse({'error': 'A checkout cannot be both added and removed.'}, status=400)
+        
+        pilot = util.get_pilots().filter(username=username).first()
+        if pilot is None:
+            return JsonResponse({'error': "Unknown pilot '%s'." % username}, status=400)
+        
+        # Security Check
+        # --------------
+        # If the user is not a superuser or flight scheduler, they may only
+        # edit their own checkouts
+        if pilot != request.user and not self.may_edit_others(request.user):
+            logger.warn("Forbidden: '%s' may not edit for '%s'" % (request.user.username, pilot.username))
+            return JsonResponse({'error': 'Pilots may only edit their own checkouts.'}, status=403)
+        
+        cells = add | remove
+        airstrips = dict(Airstrip.objects.filter(
+                            ident__in=set(ident for ident, _ in cells)
+                        ).values_list('ident', 'pk'))
+        aircraft_types = set(AircraftType.objects.filter(
+                            pk__in=set(pk for _, pk in cells)
+                        ).values_list('pk', flat=True))
+        unknown = [cell for cell in cells if cell[0] not in airstrips or cell[1] not in aircraft_types]
+        if unknown:
+            return JsonResponse({'error': 'Unknown airstrips or aircraft types.', 'unknown': [list(cell) for cell in unknown]}, status=400)
+        
+        def ids(cell):
+            return (airstrips[cell[0]], cell[1])
+        names = dict((ids(cell), cell) for cell in cells)
+        
+        applied = util.apply_checkout_changes(
+                    pilot,
+                    add=[ids(cell) for cell in add],
+                    remove=[ids(cell) for cell in remove])
+        added = sorted(names[cell] for cell in applied['added'])
+        removed = sorted(names[cell] for cell in applied['removed'])
+        
+        if added or removed:
+            logger.info("%s changed checkouts for %s: added %d, removed %d" % (
+                            request.user.username, pilot.username, len(added), len(removed)))
+        return JsonResponse({
+            'pilot': pilot.username,
+            'added': added,
+            'removed': removed,
+            'unchanged': len(cells) - len(added) - len(removed),
+        })
 
 
 class WeightList(LoginRequiredMixin, ListView):
@@ -417,6 +648,19 @@ class WeightList(LoginRequiredMixin, ListView):
         context = {'reason': message}
         return render(request, template, context, status=403)
 
+    def get(self, request, *args, **kwargs):
+        # Security Check
+        # --------------
+        # This would be unusual, but just in case: make sure that the request
+        # is from a superuser, pilot, or flight scheduler (normal users may
+        # not view nor edit pilot weights).
+        user = request.user
+        if not user.is_superuser and not user.is_pilot and not user.is_flight_scheduler:
+            logger.warn("Forbidden: '%s' is not a pilot, flight scheduler, nor superuser" % user.username)
+            message = 'Only pilots and flight schedulers may view pilot weights.'
+            return self.forbidden(request, message)
+        return super(WeightList, self).get(request, *args, **kwargs)
+
     def get_queryset(self):
         """Prepares the pilot/weight pairs for the template.
         If the requesting user is a simple pilot, we're only going to show
@@ -430,31 +674,12 @@ class WeightList(LoginRequiredMixin, ListView):
         """
         user = self.request.user
 
-        # Security Check
-        # --------------
-        # This would be unusual, but just in case: make sure that the request
-        # is from a superuser, pilot, or flight scheduler (normal users may
-        # not view nor edit pilot weights).
-        if not user.is_superuser and not user.is_pilot and not user.is_flight_scheduler:
-            logger.warn("Forbidden: '%s' is not a pilot, flight scheduler, nor superuser" % user.username)
-            message = 'Only pilots and flight schedulers may view pilot weights.'
-            return self.forbidden(request, message)
-
         if user.is_flight_scheduler or user.is_superuser:
             pilots = util.get_pilots()
         else:
-            pilots = [user,]
+            pilots = User.objects.filter(pk=user.pk)
 
-        pilot_weights = []
-        for pilot in pilots:
-            try:
-                weight = pilot.pilotweight.weight
-            except ObjectDoesNotExist:
-                # A matching PilotWeight probably hasn't been created yet.
-                # Default to zero and continue.
-                weight = 0
-            pilot_weights.append((pilot, weight))
-        return pilot_weights
+        return util.get_pilot_weights(pilots)
 
 
 class WeightEdit(LoginRequiredMixin, DetailView):
@@ -559,9 +784,76 @@ class WeightEdit(LoginRequiredMixin, DetailView):
         # We're using the 'PilotWeight saved' 'event' to push out an update to
         # the JSON & XML reports which publish pilot weights for use by other
         # systems. We'll also send a notification email with the updated info.
-        # As soon as these tasks are done, we'll take the user back to the
-        # pilot weight list.
-        util.export_pilotweights()
+        # Both are left to the background job worker (see checkouts.jobs) so
+        # the user is taken straight back to the pilot weight list. Saves made
+        # in quick succession share a single export.
+        jobs.enqueue_once('export_pilotweights', delay=settings.PILOTWEIGHTS_EXPORT_DELAY)
         if weight_changed:
-            util.notify_pilotweight_update(pilotweight)
+            jobs.enqueue('notify_pilotweight_update', pilotweight_id=pilotweight.pk, weight=pilotweight.weight)
         return redirect('weight_list')
+
+
+class WeightChanges(View):
+    """Feed of the pilot weights changed since a client's cursor
+
+    Like the exported files, the feed is reached through the secret export
+    prefix rather than a login, so the systems which poll the exports can use
+    it too. The client passes back the cursor from its last response (none
+    at first, to start from the beginning) and receives the rows saved since
+    then along with a new cursor. A response with 'more' set means another
+    page is waiting. Deleted rows (a deleted pilot) are not reported.
+    """
+    content_types = {
+        'json': 'application/json',
+        'xml': 'application/xml',
+    }
+
+    def get(self, request, prefix, format, *args, **kwargs):
+        if not constant_time_compare(prefix, settings.EXPORT_PREFIX):
+            raise Http404
+        try:
+            limit = min(int(request.GET.get('limit', util.CHANGE_FEED_LIMIT)), util.CHANGE_FEED_LIMIT)
+            if limit < 1:
+                raise ValueError("The limit must be positive")
+            pilotweights, cursor, more = util.pilotweight_changes(request.GET.get('cursor'), limit)
+        except ValueError as exc:
+            logger.warning("Rejected change feed request: %s" % exc)
+            return HttpResponseBadRequest("Invalid cursor or limit")
+
+        if format == 'json':
+            content = util.pilotweight_changes_json(pilotweights, cursor, more)
+        else:
+            content = util.pilotweight_changes_xml(pilotweights, cursor, more)
+        response = HttpResponse(''.join(content), content_type=self.content_types[format])
+        response['Access-Control-Allow-Origin'] = '*'
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+
+class JobList(LoginRequiredMixin, TemplateView):
+    """Status of the background jobs (pilot weight exports and notifications)"""
+    template_name = 'checkouts/job_list.html'
+    recent = 50
+
+    def forbidden(self, request, message="Sorry, you can't do that."):
+        """Shortcut for rendering an 'access denied' page"""
+        template = '403.html'
+        context = {'reason': message}
+        return render(request, template, context, status=403)
+
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        if not user.is_superuser and not user.is_flight_scheduler:
+            logger.warn("Forbidden: '%s' is not a flight scheduler nor superuser" % user.username)
+            message = 'Only flight schedulers may view the background jobs.'
+            return self.forbidden(request, message)
+        return super(JobList, self).get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super(JobList, self).get_context_data(**kwargs)
+        counts = jobs.status_counts()
+        context['counts'] = [(label, counts[status]) for status, label in Job.STATUS_CHOICES]
+        # Problems first: anything failed or waiting to retry, then the rest
+        context['failing'] = Job.objects.exclude(last_error='').exclude(status=Job.DONE).order_by('-modified')[:self.recent]
+        context['job_list'] = Job.objects.order_by('-created')[:self.recent]
+        return context
@@ -26,6 +26,12 @@ def get_env_var(name):
         error_message = "The '%s' environment variable is not set" % name
         raise ImproperlyConfigured(error_message)
 
+def env_flag(name):
+    """True if the named environment variable is set to '1', 'true', or 'yes'
+    (in any case). Unset, empty, or anything else (e.g. 'false' or '0') is
+    False."""
+    return os.environ.get(name, '').strip().lower() in ('1', 'true', 'yes')
+
 if get_env_var('DATABASE_URL'):
     DATABASES = {
         'default': dj_database_url.config(),
@@ -38,8 +44,19 @@ sentry_sdk.init(
     integrations=[DjangoIntegration()]
 )
 
+# The exports (and the pilot weight change feed) are only reachable by those
+# who know this prefix
+EXPORT_PREFIX = get_env_var('EXPORT_PREFIX')
 PILOTWEIGHTS_JSON_FILE = get_env_var('EXPORT_PREFIX') + '_pilotweights.json'
 PILOTWEIGHTS_XML_FILE =  get_env_var('EXPORT_PREFIX') + '_pilotweights.xml'
+# Pointer file describing the current exports (digests, sizes, and the names
+# of the content addressed copies)
+PILOTWEIGHTS_META_FILE = get_env_var('EXPORT_PREFIX') + '_pilotweights.meta.json'
+# Also publish each export under a name containing its content digest, which
+# consumers can cache forever. See checkouts/exports.py.
+PILOTWEIGHTS_HASHED_EXPORTS = env_flag('PILOTWEIGHTS_HASHED_EXPORTS')
+# Write the exports without indentation or whitespace between elements
+PILOTWEIGHTS_COMPACT_EXPORTS = env_flag('PILOTWEIGHTS_COMPACT_EXPORTS')
 
 # If the user has defined this env var, we're going to assume that they also
 # defined the rest of the env vars needed for sending email. If this env var
@@ -57,6 +74,91 @@ if 'MAILGUN_SENDER' in os.environ:
 else:
     MAILGUN_CONFIG = None
 
+# Pushes the 'Belum Selesai' gap computation into the database instead of
+# doing it in python. Only takes effect when the database is PostgreSQL.
+BELUM_SELESAI_IN_DATABASE = env_flag('BELUM_SELESAI_IN_DATABASE')
+
+# Evaluates the 'Belum Selesai' states with NumPy array operations instead of
+# python loops. Only takes effect when NumPy is installed.
+VECTORIZED_BELUM_SELESAI = env_flag('VECTORIZED_BELUM_SELESAI')
+
+# Reads the checkout reports from the incrementally maintained summary table
+# (one row per pilot/airstrip pair) instead of regrouping the raw checkouts.
+# The table is only maintained while this is on, so run 'manage.py
+# checkout_summary' to rebuild it after turning it on. See checkouts/summary.py.
+CHECKOUT_SUMMARY_TABLE = env_flag('CHECKOUT_SUMMARY_TABLE')
+
+# Path of the memory-mapped checkout coverage file shared by all of the
+# gunicorn workers. When set, the checkout reports are answered from it
+# instead of from the database. See checkouts/coverage.py.
+CHECKOUT_COVERAGE_FILE = os.environ.get('CHECKOUT_COVERAGE_FILE', None)
+
+# Keeps each user's group names (and so the is_pilot/is_flight_scheduler role
+# flags) in the cache between requests instead of loading them once per
+# request.
+CACHE_USER_ROLES = env_flag('CACHE_USER_ROLES')
+
+# Leaves the pilot weight exports and notification emails to the background
+# job worker ('manage.py run_jobs', see etc/supervisor.conf) instead of
+# running them during the request. See checkouts/jobs.py.
+BACKGROUND_JOBS = env_flag('BACKGROUND_JOBS')
+
+# With BACKGROUND_JOBS enabled, how many seconds the pilot weight export waits
+# after a weight is saved. Every save made in the meantime is covered by the
+# same export.
+PILOTWEIGHTS_EXPORT_DELAY = int(os.environ.get('PILOTWEIGHTS_EXPORT_DELAY', 30))
+
+# Sends ETag/Last-Modified headers with the report pages and answers repeat
+# requests for an unchanged page with 304 Not Modified. See
+# checkouts/versions.py.
+CONDITIONAL_REPORTS = env_flag('CONDITIONAL_REPORTS')
+
+# With CONDITIONAL_REPORTS, how many seconds a browser (or the nginx cache,
+# see etc/nginx.secure) may reuse the checkout filter results before asking
+# again. The results may be that much out of date.
+CHECKOUT_FILTER_MAX_AGE = int(os.environ.get('CHECKOUT_FILTER_MAX_AGE', 0))
+
+# The default cache. CACHE_BACKEND is 'locmem' (one cache per worker, which
+# is Django's default), 'file' (shared by the gunicorn workers on the host), or
+# the dotted path of any Django cache backend, e.g. a memcached server, whose
+# location is CACHE_LOCATION.
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', ''),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(PROJECT_ROOT, 'cache')),
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+backend, location = CACHE_BACKENDS.get(CACHE_BACKEND, (CACHE_BACKEND, None))
+CACHES = {
+    'default': {
+        'BACKEND': backend,
+        'LOCATION': os.environ.get('CACHE_LOCATION', location),
+    },
+}
+
+# Whether every worker sees the same default cache. Only then does one
+# worker's invalidation reach the others, so the precedent map and the base
+# counts are only cached when it's shared.
+SHARED_CACHE = CACHE_BACKEND != 'locmem'
+
+# Keeps the rendered checkout reports in a cache of their own (see
+# checkouts/reports.py). REPORT_CACHE_BACKEND is 'locmem' (one cache per
+# worker), 'file' (shared by the workers on the host), or the dotted path of
+# any Django cache backend, e.g. a memcached server shared by several hosts,
+# whose location is REPORT_CACHE_LOCATION.
+REPORT_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'checkouts-reports'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(PROJECT_ROOT, 'cache', 'reports')),
+}
+REPORT_CACHE = None
+if os.environ.get('REPORT_CACHE_BACKEND'):
+    backend, location = REPORT_CACHE_BACKENDS.get(os.environ['REPORT_CACHE_BACKEND'],
+                                                  (os.environ['REPORT_CACHE_BACKEND'], None))
+    CACHES['reports'] = {
+        'BACKEND': backend,
+        'LOCATION': os.environ.get('REPORT_CACHE_LOCATION', location),
+    }
+    REPORT_CACHE = 'reports'
+
 LOGIN_URL = '/login/'
 # Default 'successful login' URL redirect if an alternative is not specified
 LOGIN_REDIRECT_URL = '/checkouts/'
@@ -13,3 +13,14 @@ DATABASES = {
         "NAME": ":memory:",
     },
 }
+
+# Cached data would otherwise leak between test cases (rolling back a test's
+# transaction doesn't send any signals). Tests which exercise caching opt in
+# with override_settings.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.dummy.DummyCache",
+    },
+}
+# ...and so would the rendered reports
+REPORT_CACHE = None
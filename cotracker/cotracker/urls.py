@@ -13,8 +13,11 @@ from checkouts.views import (
     BaseEditAttached,
     FilterFormView,
     CheckoutEditFormView,
+    CheckoutMatrixView,
     WeightList,
     WeightEdit,
+    WeightChanges,
+    JobList,
 )
 
 admin.autodiscover()
@@ -82,6 +85,11 @@ urlpatterns = [
         view=CheckoutEditFormView.as_view(),
         name='checkout_edit',
     ),
+    url(
+        regex=r'^checkouts/matrix/$',
+        view=CheckoutMatrixView.as_view(),
+        name='checkout_matrix',
+    ),
     url(
         regex=r'^weights/$',
         view=WeightList.as_view(),
@@ -92,5 +100,15 @@ urlpatterns = [
         view=WeightEdit.as_view(),
         name='weight_edit',
     ),
+    url(
+        regex=r'^weights/changes/(?P<prefix>\w+)\.(?P<format>json|xml)$',
+        view=WeightChanges.as_view(),
+        name='weight_changes',
+    ),
+    url(
+        regex=r'^jobs/$',
+        view=JobList.as_view(),
+        name='job_list',
+    ),
 ]
 
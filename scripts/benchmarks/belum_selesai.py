@@ -0,0 +1,44 @@
+"""
+Compares the python loops in util.belum_selesai_python with the NumPy
+evaluator in checkouts.vectorized, for the unfiltered 'Belum Selesai' report.
+
+The 'realistic' roster is roughly the size of the production fleet; the '10x'
+roster has ten times as many pilots and airstrips. About a third of all the
+pilot/airstrip/aircraft type cells are checked out.
+
+Usage: python scripts/benchmarks/belum_selesai.py
+"""
+import fleet
+
+ROSTERS = [
+    # label, pilots, airstrips
+    ('realistic', 40, 160),
+    ('10x', 400, 1600),
+]
+
+
+def main():
+    from checkouts import util, vectorized
+
+    if vectorized.numpy is None:
+        raise SystemExit("NumPy is not installed")
+
+    # 'evaluate' is the part of the numpy column spent loading the checkouts
+    # and computing the status matrix; the remainder is building the records.
+    print("%10s %7s %9s %9s %8s %8s %8s %8s" % ('roster', 'pilots', 'airstrips', 'records', 'loops', 'numpy', 'evaluate', 'speedup'))
+    for label, pilots, airstrips in ROSTERS:
+        fleet.build_roster(pilots, airstrips, density=0.33)
+        actypes = util.get_aircrafttype_names()
+        loops_time, loops = fleet.best_of(lambda: util.belum_selesai_python(actypes))
+        numpy_time, vector = fleet.best_of(lambda: vectorized.belum_selesai(actypes))
+        evaluate_time, _ = fleet.best_of(vectorized.evaluate)
+        if loops != vector:
+            raise AssertionError("Evaluators disagree for the %s roster" % label)
+        print("%10s %7d %9d %9d %7.3fs %7.3fs %7.3fs %7.1fx" % (
+            label, pilots, airstrips, len(vector), loops_time, numpy_time, evaluate_time, loops_time / numpy_time))
+        fleet.clear_fleet()
+
+
+if __name__ == '__main__':
+    fleet.setup_django()
+    main()
@@ -0,0 +1,90 @@
+"""
+Compares the original checkout_filter (full model instances via select_related
+and list pop/append grouping) with the current values_list-based engine, and
+with the engine reading the checkout summary table.
+
+Usage: python scripts/benchmarks/checkout_filter.py [CHECKOUTS [CHECKOUTS ...]]
+"""
+import fleet
+
+
+def legacy_checkout_filter(pilot=None, airstrip=None, base=None, aircraft_type=None, **kwargs):
+    """checkout_filter as it was before the single pass engine"""
+    from checkouts.models import Checkout
+    from checkouts.util import CHECKOUT_BELUM, CHECKOUT_SUDAH, get_aircrafttype_names
+
+    core_query = Checkout.objects.all()
+    if pilot != None:
+        core_query = core_query.filter(pilot=pilot)
+    if airstrip != None:
+        core_query = core_query.filter(airstrip=airstrip)
+    if base != None:
+        core_query = core_query.filter(airstrip__bases=base)
+    if aircraft_type != None:
+        core_query = core_query.filter(aircraft_type=aircraft_type)
+
+    checkouts = core_query.select_related(
+                    'pilot', 'airstrip', 'aircraft_type'
+                ).order_by(
+                    'pilot__last_name',
+                    'pilot__first_name',
+                    'airstrip__ident',
+                    'aircraft_type__name'
+                )
+    if aircraft_type:
+        actypes = [aircraft_type.name,]
+    else:
+        actypes = get_aircrafttype_names()
+    results = []
+    for c in checkouts:
+        if results:
+            r = results.pop()
+            if r['pilot_slug'] == c.pilot.username and r['airstrip_ident'] == c.airstrip.ident:
+                r['actypes'][c.aircraft_type.name] = CHECKOUT_SUDAH
+                results.append(r)
+                continue
+            else:
+                results.append(r)
+
+        r = {
+            'pilot_name': c.pilot.full_name,
+            'pilot_slug': c.pilot.username,
+            'airstrip_ident': c.airstrip.ident,
+            'airstrip_name': c.airstrip.name,
+            'actypes': {},
+        }
+        for actype in actypes:
+            if actype == c.aircraft_type.name:
+                r['actypes'][actype] = CHECKOUT_SUDAH
+            else:
+                r['actypes'][actype] = CHECKOUT_BELUM
+
+        results.append(r)
+    return results
+
+
+def main(sizes):
+    from django.test import override_settings
+    from checkouts import summary, util
+
+    print("%10s %8s %10s %10s %10s %8s" % ('checkouts', 'records', 'legacy', 'current', 'summary', 'speedup'))
+    for size in sizes:
+        fleet.build_fleet(size)
+        # The fleet is bulk created, which bypasses the summary signals
+        summary.rebuild()
+        repeat = 1 if size >= 1000000 else 3
+        legacy_time, legacy = fleet.best_of(legacy_checkout_filter, repeat)
+        current_time, current = fleet.best_of(util.checkout_filter, repeat)
+        with override_settings(CHECKOUT_SUMMARY_TABLE=True):
+            summary_time, summarized = fleet.best_of(util.checkout_filter, repeat)
+        if not (legacy == [r.as_dict() for r in current] and current == summarized):
+            raise AssertionError("Engines disagree at %d checkouts" % size)
+        print("%10d %8d %9.3fs %9.3fs %9.3fs %7.1fx" % (
+            size, len(current), legacy_time, current_time, summary_time, legacy_time / summary_time))
+        fleet.clear_fleet()
+
+
+if __name__ == '__main__':
+    sizes = fleet.sizes_from_argv([10000, 100000, 1000000])
+    fleet.setup_django()
+    main(sizes)
@@ -0,0 +1,138 @@
+"""
+Shared helpers for the benchmark scripts: configures django to use an
+in-memory database and fills it with a synthetic fleet of pilots, airstrips,
+aircraft types, and checkouts.
+"""
+import math
+import os
+import random
+import sys
+import time
+
+SITE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+
+
+def setup_django():
+    """Prepares django with the test settings and a migrated in-memory DB."""
+    sys.path.insert(0, os.path.join(SITE_ROOT, 'cotracker'))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cotracker.settings.test')
+    # The settings insist on these, but none of them matter for benchmarks
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///ignored')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.setdefault('SENTRY_DSN', '')
+    os.environ.setdefault('EXPORT_PREFIX', 'benchmark')
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def build_fleet(checkouts, actypes=5):
+    """Creates roughly 'checkouts' Checkout rows spread over a pilot/airstrip
+    grid sized so that airstrips outnumber pilots about four to one (which is
+    close to the shape of the production data). Returns a summary dict.
+    """
+    pairs = int(math.ceil(checkouts / float(actypes)))
+    airstrip_count = int(math.ceil(math.sqrt(pairs * 4)))
+    pilot_count = int(math.ceil(pairs / float(airstrip_count)))
+    return build_roster(pilot_count, airstrip_count, actypes, checkouts=checkouts)
+
+
+def build_roster(pilot_count, airstrip_count, actypes=5, checkouts=None, density=None):
+    """Creates the given numbers of pilots, airstrips, and aircraft types.
+    Checkouts are either the first 'checkouts' cells of the grid, or a
+    (repeatable) random 'density' fraction of all the cells. Returns a
+    summary dict.
+    """
+    from django.contrib.auth.models import Group, User
+    from checkouts.models import AircraftType, Airstrip, Checkout
+
+    chooser = random.Random(42)
+
+    pilots_group, _ = Group.objects.get_or_create(name='Pilots')
+    User.objects.bulk_create([
+        User(username='pilot%05d' % i, first_name='First%05d' % i, last_name='Last%05d' % i)
+        for i in range(pilot_count)
+    ])
+    pilots = list(User.objects.filter(username__startswith='pilot').order_by('pk'))
+    Membership = User.groups.through
+    Membership.objects.bulk_create([Membership(user=p, group=pilots_group) for p in pilots])
+
+    Airstrip.objects.bulk_create([Airstrip(ident='BS%02d' % i, name='Base %02d' % i, is_base=True) for i in range(2)])
+    Airstrip.objects.bulk_create([
+        Airstrip(ident='%04d' % i, name='Airstrip %04d' % i, is_base=False)
+        for i in range(airstrip_count)
+    ])
+    bases = list(Airstrip.objects.filter(is_base=True).order_by('pk'))
+    airstrips = list(Airstrip.objects.filter(is_base=False).order_by('pk'))
+    Attachment = Airstrip.bases.through
+    Attachment.objects.bulk_create([
+        Attachment(from_airstrip=a, to_airstrip=bases[i % len(bases)])
+        for i, a in enumerate(airstrips)
+    ])
+
+    AircraftType.objects.bulk_create([
+        AircraftType(name='Type%d' % i, sorted_position=i) for i in range(actypes)
+    ])
+    types = list(AircraftType.objects.order_by('pk'))
+
+    batch = []
+    created = 0
+    for p in pilots:
+        for a in airstrips:
+            for t in types:
+                if created == checkouts:
+                    break
+                if density is not None and chooser.random() >= density:
+                    continue
+                batch.append(Checkout(pilot=p, airstrip=a, aircraft_type=t))
+                created += 1
+                if len(batch) == 10000:
+                    Checkout.objects.bulk_create(batch)
+                    batch = []
+    Checkout.objects.bulk_create(batch)
+
+    return {
+        'pilots': len(pilots),
+        'airstrips': len(airstrips),
+        'bases': len(bases),
+        'aircraft_types': len(types),
+        'checkouts': created,
+    }
+
+
+def clear_fleet():
+    """Removes everything created by build_fleet."""
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from checkouts.models import AircraftType, Airstrip, Checkout, CheckoutSummary
+
+    # Deleting through the ORM would send (and act on) a signal per checkout
+    with connection.cursor() as cursor:
+        for model in (CheckoutSummary, Checkout):
+            cursor.execute('DELETE FROM %s' % connection.ops.quote_name(model._meta.db_table))
+    Airstrip.objects.all().delete()
+    AircraftType.objects.all().delete()
+    User.objects.all().delete()
+
+
+def best_of(func, repeat=3):
+    """Returns (seconds, result) for the fastest of 'repeat' calls."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def sizes_from_argv(default):
+    """Parses checkout counts from the command line, if any were given."""
+    if len(sys.argv) > 1:
+        return [int(arg) for arg in sys.argv[1:]]
+    return default
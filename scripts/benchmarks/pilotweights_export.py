@@ -0,0 +1,88 @@
+"""
+Compares the original pilot weight export (the whole roster gathered into a
+dict, then json.dump'ed and formatted into XML) with the streaming writers,
+by time and by peak python memory (tracemalloc) while writing both files.
+
+Usage: python scripts/benchmarks/pilotweights_export.py [PILOTS [PILOTS ...]]
+"""
+import json
+import os
+import tempfile
+import tracemalloc
+
+import fleet
+
+
+def legacy_export_pilotweights(root):
+    """export_pilotweights as it was before the streaming writers"""
+    from checkouts.models import PilotWeight
+
+    pilotweights = PilotWeight.objects.all().order_by("pilot__last_name", "pilot__first_name")
+    to_export = {
+        "version": "1",
+        "updated": "2020-01-01T00:00:00",
+        "pilots": [],
+    }
+    for pw in pilotweights:
+        to_export["pilots"].append({
+            'lastname': pw.pilot.last_name,
+            'firstname': pw.pilot.first_name,
+            'weight': pw.weight,
+        })
+    with open(os.path.join(root, 'legacy.json'), 'w') as f:
+        json.dump(to_export, f, indent=4, sort_keys=True)
+    with open(os.path.join(root, 'legacy.xml'), 'w') as f:
+        f.write("<pilotweights>\n")
+        for pilot in to_export["pilots"]:
+            f.write("  <pilot>\n")
+            f.write("    <lastname>%s</lastname>\n" % pilot["lastname"])
+            f.write("    <firstname>%s</firstname>\n" % pilot["firstname"])
+            f.write("    <weight>%d</weight>\n" % pilot["weight"])
+            f.write("  </pilot>\n")
+        f.write("</pilotweights>\n")
+
+
+def build_weights(pilot_count):
+    from django.contrib.auth.models import User
+    from checkouts.models import PilotWeight
+
+    User.objects.bulk_create([
+        User(username='pilot%06d' % i, first_name='First%06d' % i, last_name='Last%06d' % i)
+        for i in range(pilot_count)
+    ], batch_size=5000)
+    PilotWeight.objects.bulk_create([
+        PilotWeight(pilot_id=pk, weight=60 + pk % 40)
+        for pk in User.objects.values_list('pk', flat=True)
+    ], batch_size=5000)
+
+
+def measure(func):
+    """Returns (seconds, peak MB) for a single call"""
+    tracemalloc.start()
+    seconds, _ = fleet.best_of(func, 1)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak / 1024.0 / 1024.0
+
+
+def main(sizes):
+    from django.contrib.auth.models import User
+    from django.test import override_settings
+    from checkouts import util
+
+    print("%10s %10s %10s %10s %10s" % ('pilots', 'legacy', 'peak', 'streaming', 'peak'))
+    for size in sizes:
+        build_weights(size)
+        with tempfile.TemporaryDirectory() as root:
+            legacy_time, legacy_peak = measure(lambda: legacy_export_pilotweights(root))
+            with override_settings(STATIC_ROOT=root):
+                streaming_time, streaming_peak = measure(util.export_pilotweights)
+        print("%10d %9.3fs %8.1fMB %9.3fs %8.1fMB" % (
+            size, legacy_time, legacy_peak, streaming_time, streaming_peak))
+        User.objects.all().delete()
+
+
+if __name__ == '__main__':
+    sizes = fleet.sizes_from_argv([1000, 10000])
+    fleet.setup_django()
+    main(sizes)
@@ -0,0 +1,134 @@
+"""
+Compares the rows of the unfiltered 'Belum Selesai' report as they used to be
+(a dict per row, with the statuses in a nested dict keyed by aircraft type
+name which the template read through the 'get_item' filter) with the
+CheckoutRecord rows, whose statuses the template iterates over directly.
+
+Memory is what tracemalloc sees allocated by building each kind of rows from
+the same report; render time is the display_checkouts template rendered from
+each of them.
+
+Usage: python scripts/benchmarks/report_rows.py
+"""
+import os
+import tracemalloc
+
+from django import template
+
+import fleet
+
+ROSTERS = [
+    # label, pilots, airstrips
+    ('realistic', 40, 160),
+    ('10x', 400, 1600),
+]
+
+# display_checkouts.html before CheckoutRecord, 'get_item' being registered
+# below
+LEGACY_TEMPLATE = """{% load legacy_extras %}
+{% if checkouts %}
+{% if checkouts.results and checkouts.results|length > 0 %}
+<p>Found {{ checkouts.results|length }} matching record{{ checkouts.results|length|pluralize }}</p>
+<table border="1">
+<tr>
+{% if checkouts.populate.pilot %}
+    <th rowspan="2">Pilot</th>
+{% endif %}
+{% if checkouts.populate.airstrip %}
+    <th colspan="2">Airstrip</th>
+{% endif %}
+    <th colspan="{{ checkouts.aircraft_types|length }}">Aircraft Type</th>
+</tr>
+<tr>
+{% if checkouts.populate.airstrip %}
+    <th>Ident</th><th>Name</th>
+{% endif %}
+{% for actype in checkouts.aircraft_types %}
+    <th>{{ actype }}</th>
+{% endfor %}
+</tr>
+{% for r in checkouts.results %}
+<tr>
+{% if checkouts.populate.pilot %}
+    <td><a href="{% url 'pilot_detail' r.pilot_slug %}">{{ r.pilot_name }}</a></td>
+{% endif %}
+{% if checkouts.populate.airstrip %}
+    <td><a href="{% url 'airstrip_detail' r.airstrip_ident %}">{{ r.airstrip_ident }}</a></td>
+    <td>{{ r.airstrip_name }}</td>
+{% endif %}
+{% for name in checkouts.aircraft_types %}
+    <td class="{{ r.actypes|get_item:name }}">&nbsp;</td>
+{% endfor %}
+</tr>
+{% endfor %}
+</table>
+{% endif %}
+{% endif %}
+"""
+
+register = template.Library()
+
+
+@register.filter
+def get_item(dictionary, key):
+    return dictionary.get(key)
+
+
+def legacy_rows(records):
+    """The rows as checkout_record built them before CheckoutRecord"""
+    return [{
+        'pilot_name': r.pilot_name,
+        'pilot_slug': r.pilot_slug,
+        'airstrip_ident': r.airstrip_ident,
+        'airstrip_name': r.airstrip_name,
+        'actypes': dict(zip(r.aircraft_types, r.cells)),
+    } for r in records]
+
+
+def current_rows(records):
+    from checkouts.util import CheckoutRecord
+
+    return [CheckoutRecord(r.pilot_name, r.pilot_slug, r.airstrip_ident, r.airstrip_name,
+                           r.aircraft_types, list(r.cells)) for r in records]
+
+
+def allocated(func):
+    """Returns (result, MB held by the result) for a single call"""
+    tracemalloc.start()
+    result = func()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current / 1024.0 / 1024.0
+
+
+def main():
+    from django.template import Context, Engine
+    from checkouts import util
+
+    engine = Engine(libraries={'legacy_extras': __name__})
+    legacy_template = engine.from_string(LEGACY_TEMPLATE)
+    path = os.path.join(fleet.SITE_ROOT, 'cotracker', 'templates', 'checkouts', 'display_checkouts.html')
+    with open(path) as f:
+        current_template = engine.from_string(f.read())
+
+    # Memory, then render time, of the dict rows and of the CheckoutRecords
+    print("%10s %8s %9s %9s %9s %9s %8s" % ('roster', 'rows', 'dicts', 'records', 'dicts', 'records', 'speedup'))
+    for label, pilots, airstrips in ROSTERS:
+        fleet.build_roster(pilots, airstrips, density=0.33)
+        report = util.belum_selesai()
+        legacy, legacy_mb = allocated(lambda: legacy_rows(report['results']))
+        current, current_mb = allocated(lambda: current_rows(report['results']))
+        legacy_context = Context({'checkouts': dict(report, results=legacy), 'show_summary': True})
+        current_context = Context({'checkouts': dict(report, results=current), 'show_summary': True})
+        legacy_time, legacy_html = fleet.best_of(lambda: legacy_template.render(legacy_context))
+        current_time, current_html = fleet.best_of(lambda: current_template.render(current_context))
+        if legacy_html.split() != current_html.split():
+            raise AssertionError("Rendered reports differ for the %s roster" % label)
+        print("%10s %8d %7.1fMB %7.1fMB %8.3fs %8.3fs %7.1fx" % (
+            label, len(current), legacy_mb, current_mb, legacy_time, current_time, legacy_time / current_time))
+        fleet.clear_fleet()
+
+
+if __name__ == '__main__':
+    fleet.setup_django()
+    main()
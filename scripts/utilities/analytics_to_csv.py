@@ -17,12 +17,18 @@ such as this:
       real int,
       status char(3),
       bytes int,
+      queries int,
+      sql int,
+      slowest varchar,
       useragent varchar
     );
 
 Then load the CSV directly into the table:
 
     COPY co from '/tmp/cleaned.csv' DELIMITER ',' CSV HEADER;
+
+Lines written before the database fields (queries, sql, slowest) were added to
+the log leave those columns empty.
 """
 
 import csv
@@ -46,9 +52,9 @@ def parse(line):
                 username, ip = value.split('@')
                 segments.append(['username', username])
                 segments.append(['ip', ip])
-            elif name in ['queue', 'real']:
+            elif name in ['queue', 'real', 'sql']:
                 segments.append([name, int(value.strip('ms'))])
-            elif name == 'bytes':
+            elif name in ['bytes', 'queries']:
                 segments.append([name, int(value)])
             elif name == 'useragent':
                 segments.append([name, value.strip('"').strip(',')])
@@ -71,7 +77,7 @@ for name in files:
         for line in f:
             records.append(parse(line))
 
-headers = ['date', 'time', 'pid', 'level', 'username', 'ip', 'method', 'path', 'queue', 'real', 'status', 'bytes', 'useragent']
+headers = ['date', 'time', 'pid', 'level', 'username', 'ip', 'method', 'path', 'queue', 'real', 'status', 'bytes', 'queries', 'sql', 'slowest', 'useragent']
 with open('cleaned.csv', 'w') as f:
     writer = csv.DictWriter(f, fieldnames=headers)
     writer.writeheader()
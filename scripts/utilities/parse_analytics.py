@@ -107,6 +107,34 @@ def not_founds(parsed):
     pprint.pprint(paths)
 
 
+def database(parsed):
+    """Per-path query counts and SQL time. A path whose query count grows with
+    the data (rather than staying flat) is the signature of an N+1 query."""
+    paths = {}
+    for d in parsed:
+        if 'queries' not in d:
+            continue # Logged before the database fields were added
+        stats = paths.setdefault(d['path'], {'hits': 0, 'queries': 0, 'max_queries': 0, 'sql': 0, 'slowest': {}})
+        queries = int(d['queries'])
+        stats['hits'] += 1
+        stats['queries'] += queries
+        stats['max_queries'] = max(stats['max_queries'], queries)
+        stats['sql'] += int(d['sql'].strip('ms'))
+        stats['slowest'][d['slowest']] = stats['slowest'].get(d['slowest'], 0) + 1
+    data = []
+    for path, stats in paths.items():
+        slowest = max(stats['slowest'].items(), key=lambda item: item[1])[0]
+        data.append("%-40s| %5.1f queries (max %4d), %6.1fms SQL, usually slowest %s" % (
+            path,
+            stats['queries'] / float(stats['hits']),
+            stats['max_queries'],
+            stats['sql'] / float(stats['hits']),
+            slowest))
+    data.sort()
+    print("Average database use per path:")
+    pprint.pprint(data)
+
+
 f = open('analytics.log', 'rb')
 
 lines = f.readlines()
@@ -131,6 +159,7 @@ for line in lines:
 #clients(parsed)
 #useragents(parsed)
 #statuscodes(parsed)
+database(parsed)
 not_founds(parsed)
 last(parsed)
 per_day(parsed)
@@ -0,0 +1,22 @@
+#!/bin/bash
+# ============================================================================
+# Utility script for starting the background job worker
+# ------------------------------------------------------
+# The companion of venv_gunicorn.sh: a command target for Supervisor which
+# activates the virtualenv and then runs the worker which carries out the
+# jobs queued by the web app (pilot weight exports, notification emails).
+# ============================================================================
+
+SITE_ROOT=$(dirname $0)
+
+echo "Operating in $SITE_ROOT"
+
+echo "Loading virtualenv"
+
+# Getting all of the necessary env vars for django
+source bin/activate
+
+echo "Starting job worker"
+
+# Using exec so that Supervisor's stop signal reaches the worker itself
+exec python $SITE_ROOT/cotracker/manage.py run_jobs